@@ -0,0 +1,128 @@
+"""Compteurs de téléchargements et suivi des accès, agrégés en mémoire et écrits en différé (write-behind).
+
+Un téléchargement n'ajoute aucune écriture Mongo sur le chemin de lecture : on
+cumule par fichier le nombre de téléchargements et le dernier accès, et un
+vidage périodique les applique en bulk_write ($inc/$max avec upsert dans
+file_stats, $max sur files.last_accessed_at pour le stockage hiérarchisé).
+"""
+import logging
+from datetime import datetime
+from typing import Dict, List
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.config import settings
+from app.metrics import Counter, Gauge
+from app.models.file import File, FileStats
+from app.mongo_connect import get_collection
+from app.tasks import spawn
+
+logger = logging.getLogger(__name__)
+
+buffered_files = Gauge("access_buffer_files", "Fichiers ayant des accès en attente d'écriture")
+flushed_events = Counter("access_events_flushed_total", "Téléchargements écrits dans file_stats")
+dropped_events = Counter("access_events_dropped_total", "Téléchargements perdus, tampon saturé")
+
+
+class _Entry:
+    __slots__ = ("owner_id", "count", "last_at")
+
+    def __init__(self, owner_id: str):
+        self.owner_id = owner_id
+        self.count = 0
+        self.last_at = datetime.min
+
+
+class AccessBuffer:
+    """Tampon borné : vidage anticipé à `max_entries` fichiers, abandon au-delà du double."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: Dict[object, _Entry] = {}
+        self._flush_scheduled = False
+
+    def _merge(self, file_id, owner_id: str, count: int, at: datetime) -> bool:
+        entry = self._entries.get(file_id)
+        if entry is None:
+            if len(self._entries) >= 2 * self.max_entries:
+                # Mongo ne suit plus (vidages en échec) : on protège la mémoire du worker
+                dropped_events.inc(count)
+                return False
+            entry = self._entries[file_id] = _Entry(owner_id)
+        entry.count += count
+        if entry.last_at < at:
+            entry.last_at = at
+        return True
+
+    def record(self, file_id, owner_id: str, at: datetime = None):
+        self._merge(file_id, owner_id, 1, at or datetime.utcnow())
+        buffered_files.set(len(self._entries))
+        if len(self._entries) >= self.max_entries and not self._flush_scheduled:
+            self._flush_scheduled = True
+            spawn("access-flush", self.flush)
+
+    def pending(self, file_id) -> bool:
+        return file_id in self._entries
+
+    def _requeue(self, file_ids: List, batch: Dict[object, _Entry]):
+        for file_id in file_ids:
+            entry = batch[file_id]
+            self._merge(file_id, entry.owner_id, entry.count, entry.last_at)
+
+    async def flush(self):
+        self._flush_scheduled = False
+        if not self._entries:
+            return
+        batch, self._entries = self._entries, {}
+        buffered_files.set(0)
+        file_ids = list(batch)
+
+        # $inc n'est pas idempotent : seules les opérations en échec sont réinjectées
+        stats_operations = [
+            UpdateOne(
+                {"_id": file_id},
+                {
+                    "$inc": {"download_count": batch[file_id].count},
+                    "$max": {"last_opened_at": batch[file_id].last_at},
+                    "$setOnInsert": {"owner_id": batch[file_id].owner_id},
+                },
+                upsert=True,
+            )
+            for file_id in file_ids
+        ]
+        try:
+            await get_collection(FileStats.Settings.name).bulk_write(stats_operations, ordered=False)
+        except BulkWriteError as e:
+            self._requeue([file_ids[error["index"]] for error in e.details["writeErrors"]], batch)
+            raise
+        except Exception:
+            self._requeue(file_ids, batch)
+            raise
+        flushed_events.inc(sum(entry.count for entry in batch.values()))
+
+        # $max est idempotent : un échec ici ne fausse aucun compteur
+        await get_collection(File.Settings.name).bulk_write([
+            UpdateOne({"_id": file_id}, {"$max": {"last_accessed_at": batch[file_id].last_at}})
+            for file_id in file_ids
+        ], ordered=False)
+        logger.debug("Accès de %d fichier(s) enregistrés", len(file_ids))
+
+
+access_buffer = AccessBuffer(settings.access_buffer_max_entries)
+
+
+async def get_file_stats(file_ids: List) -> Dict[object, dict]:
+    """Compteurs persistés augmentés de ceux encore en mémoire, en une requête $in."""
+    stats = {
+        doc["_id"]: {"download_count": doc.get("download_count", 0), "last_opened_at": doc.get("last_opened_at")}
+        async for doc in get_collection(FileStats.Settings.name).find({"_id": {"$in": file_ids}})
+    }
+    for file_id in file_ids:
+        entry = access_buffer._entries.get(file_id)
+        if entry:
+            current = stats.setdefault(file_id, {"download_count": 0, "last_opened_at": None})
+            current["download_count"] += entry.count
+            if current["last_opened_at"] is None or current["last_opened_at"] < entry.last_at:
+                current["last_opened_at"] = entry.last_at
+    return stats
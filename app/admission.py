@@ -0,0 +1,274 @@
+"""Contrôle d'admission des routes de stockage : pools séparés, file bornée, limites adaptatives.
+
+Trois pools indépendants (uploads, téléchargements, métadonnées) évitent que des
+uploads volumineux ne fassent attendre les appels légers. Les uploads sont aussi
+bornés en octets en vol (global et par utilisateur, d'après Content-Length). La
+concurrence des uploads suit un AIMD piloté par la latence d'écriture GridFS.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from jose import JWTError, jwt
+from starlette.responses import JSONResponse
+
+from app.config import settings
+from app.metrics import Counter, Gauge
+
+UPLOAD_PREFIXES = ("/files/upload/", "/files/delta/", "/files/extract/")
+DOWNLOAD_PREFIXES = ("/files/download/", "/share/")
+# Le long-polling reste inactif la plupart du temps : il n'occupe pas de place dans un pool
+EXEMPT_PATHS = ("/files/changes",)
+
+queue_depth = Gauge("admission_queue_depth", "Requêtes en attente d'admission", ("pool",))
+in_flight = Gauge("admission_in_flight", "Requêtes admises en cours", ("pool",))
+pool_limit = Gauge("admission_limit", "Concurrence maximale courante", ("pool",))
+rejections = Counter("admission_rejections_total", "Requêtes refusées (503)", ("pool", "reason"))
+upload_bytes = Gauge("admission_upload_bytes_in_flight", "Octets d'upload admis en cours")
+write_latency = Gauge("admission_gridfs_write_latency_seconds", "Latence moyenne (EWMA) d'écriture d'un chunk GridFS")
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ("future", "weight", "user")
+
+    def __init__(self, future: asyncio.Future, weight: int, user: Optional[str]):
+        self.future = future
+        self.weight = weight
+        self.user = user
+
+
+class AdmissionPool:
+    """Sémaphore à file d'attente bornée, avec budget d'octets optionnel (global et par utilisateur)."""
+
+    def __init__(self, name: str, limit: int, max_queue: int, max_bytes: int = 0, max_user_bytes: int = 0):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_bytes = max_bytes
+        self.max_user_bytes = max_user_bytes
+        self.in_flight = 0
+        self.bytes_in_flight = 0
+        self.user_bytes: Dict[str, int] = {}
+        self._waiters: Deque[_Waiter] = deque()
+        pool_limit.set(limit, pool=name)
+
+    def _fits(self, weight: int, user: Optional[str]) -> bool:
+        if self.in_flight >= self.limit:
+            return False
+        if self.max_bytes and self.bytes_in_flight and self.bytes_in_flight + weight > self.max_bytes:
+            return False
+        used = self.user_bytes.get(user, 0)
+        if self.max_user_bytes and used and used + weight > self.max_user_bytes:
+            return False
+        return True
+
+    def _grant(self, weight: int, user: Optional[str]):
+        self.in_flight += 1
+        self.bytes_in_flight += weight
+        if weight:
+            self.user_bytes[user] = self.user_bytes.get(user, 0) + weight
+        self._publish()
+
+    def _publish(self):
+        in_flight.set(self.in_flight, pool=self.name)
+        queue_depth.set(len(self._waiters), pool=self.name)
+        if self.max_bytes:
+            upload_bytes.set(self.bytes_in_flight)
+
+    def _wake(self):
+        # Ordre d'arrivée, mais un utilisateur au-delà de son budget ne bloque pas les suivants
+        for waiter in list(self._waiters):
+            if self.in_flight >= self.limit:
+                break
+            if waiter.future.done():
+                self._waiters.remove(waiter)
+            elif self._fits(waiter.weight, waiter.user):
+                self._waiters.remove(waiter)
+                self._grant(waiter.weight, waiter.user)
+                waiter.future.set_result(None)
+        self._publish()
+
+    async def acquire(self, weight: int = 0, user: Optional[str] = None, timeout: float = 0):
+        # Une requête plus grosse que le budget passe seule plutôt que jamais
+        if self.max_bytes:
+            weight = min(weight, self.max_bytes)
+        if self.max_user_bytes:
+            weight = min(weight, self.max_user_bytes)
+
+        if not self._waiters and self._fits(weight, user):
+            self._grant(weight, user)
+            return weight
+        if len(self._waiters) >= self.max_queue:
+            raise Rejected("queue_full")
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), weight, user)
+        self._waiters.append(waiter)
+        self._publish()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout or None)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admise au moment même de l'abandon : on rend la place
+                self.release(weight, user)
+            else:
+                waiter.future.cancel()
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                self._publish()
+            if isinstance(e, asyncio.TimeoutError):
+                raise Rejected("timeout")
+            raise
+        return weight
+
+    def release(self, weight: int = 0, user: Optional[str] = None):
+        self.in_flight -= 1
+        self.bytes_in_flight -= weight
+        if weight:
+            remaining = self.user_bytes.get(user, 0) - weight
+            if remaining > 0:
+                self.user_bytes[user] = remaining
+            else:
+                self.user_bytes.pop(user, None)
+        self._wake()
+
+    def set_limit(self, limit: int):
+        self.limit = limit
+        pool_limit.set(limit, pool=self.name)
+        self._wake()
+
+
+class WriteLatencyController:
+    """AIMD : +1 par fenêtre tant que la latence reste sous la cible, x0.75 au-delà."""
+
+    def __init__(self, pool: AdmissionPool, target_seconds: float, min_limit: int, max_limit: int, interval: float):
+        self.pool = pool
+        self.target_seconds = target_seconds
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.interval = interval
+        self.ewma: Optional[float] = None
+        self._capacity = float(pool.limit)
+        self._last_decrease = 0.0
+
+    def observe(self, seconds: float, chunks: int = 1):
+        if chunks <= 0:
+            return
+        sample = seconds / chunks
+        self.ewma = sample if self.ewma is None else 0.8 * self.ewma + 0.2 * sample
+        write_latency.set(self.ewma)
+
+        now = time.monotonic()
+        if self.ewma > self.target_seconds:
+            # Une seule réduction par intervalle : les écritures en vol reflètent encore l'ancienne limite
+            if now - self._last_decrease < self.interval:
+                return
+            self._last_decrease = now
+            self._capacity = max(self.min_limit, self._capacity * 0.75)
+        else:
+            self._capacity = min(self.max_limit, self._capacity + 1 / self._capacity)
+        if int(self._capacity) != self.pool.limit:
+            self.pool.set_limit(int(self._capacity))
+
+
+pools = {
+    "upload": AdmissionPool(
+        "upload",
+        settings.admission_upload_concurrency,
+        settings.admission_queue_size,
+        max_bytes=settings.admission_upload_bytes_global,
+        max_user_bytes=settings.admission_upload_bytes_per_user,
+    ),
+    "download": AdmissionPool("download", settings.admission_download_concurrency, settings.admission_queue_size),
+    "metadata": AdmissionPool("metadata", settings.admission_metadata_concurrency, settings.admission_queue_size),
+}
+
+upload_controller = WriteLatencyController(
+    pools["upload"],
+    settings.admission_write_latency_target_ms / 1000,
+    settings.admission_upload_min_concurrency,
+    settings.admission_upload_max_concurrency,
+    settings.admission_adjust_interval_seconds,
+)
+
+
+def record_write_latency(seconds: float, chunks: int = 1):
+    """Appelé après une écriture GridFS de `chunks` chunks ayant pris `seconds` secondes."""
+    upload_controller.observe(seconds, chunks)
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    if not path.startswith(("/files", "/share")) or path.startswith(EXEMPT_PATHS):
+        return None
+    if method == "POST" and path.startswith(UPLOAD_PREFIXES):
+        return "upload"
+    if method == "GET" and path.startswith(DOWNLOAD_PREFIXES):
+        return "download"
+    return "metadata"
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _user_key(scope) -> str:
+    """Identifiant utilisateur du JWT (signature vérifiée), à défaut l'adresse du client."""
+    authorization = _header(scope, b"authorization") or ""
+    if authorization.lower().startswith("bearer "):
+        try:
+            user_id = jwt.decode(authorization[7:], settings.secret_key, algorithms=[settings.algorithm]).get("user_id")
+            if user_id:
+                return str(user_id)
+        except JWTError:
+            pass
+    client = scope.get("client")
+    return f"ip:{client[0]}" if client else "anonyme"
+
+
+def _upload_weight(scope) -> int:
+    try:
+        return max(int(_header(scope, b"content-length")), 0)
+    except (TypeError, ValueError):
+        # Transfert chunked : taille inconnue, on réserve une part forfaitaire
+        return settings.admission_unknown_upload_bytes
+
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        pool_name = classify(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if pool_name is None or not settings.admission_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        pool = pools[pool_name]
+        weight, user = 0, None
+        if pool_name == "upload":
+            weight, user = _upload_weight(scope), _user_key(scope)
+        try:
+            weight = await pool.acquire(weight, user, settings.admission_queue_timeout_seconds)
+        except Rejected as e:
+            rejections.inc(pool=pool_name, reason=e.reason)
+            response = JSONResponse(
+                {"detail": "Service momentanément surchargé, veuillez réessayer."},
+                status_code=503,
+                headers={"Retry-After": str(settings.admission_retry_after_seconds)},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.release(weight, user)
@@ -0,0 +1,272 @@
+"""Statistiques de stockage par utilisateur : une agrégation $facet, un cache mis à jour par deltas."""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from beanie import PydanticObjectId
+
+from app.config import settings
+from app.models.file import Directory, File
+from app.metrics import cache_requests
+from app.mongo_connect import get_collection
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_COLLECTION = "storage_analytics"
+
+# Bornes inférieures des tranches (octets / jours), la dernière tranche est ouverte
+SIZE_BUCKETS = [
+    (0, "< 100 Ko"),
+    (100 * 1024, "100 Ko - 1 Mo"),
+    (1024 ** 2, "1 Mo - 10 Mo"),
+    (10 * 1024 ** 2, "10 Mo - 100 Mo"),
+    (100 * 1024 ** 2, "100 Mo - 1 Go"),
+    (1024 ** 3, ">= 1 Go"),
+]
+AGE_BUCKETS = [
+    (0, "< 7 jours"),
+    (7, "7 - 30 jours"),
+    (30, "30 - 365 jours"),
+    (365, ">= 1 an"),
+]
+DAY_MS = 24 * 3600 * 1000
+OUT_OF_RANGE = "hors tranche"
+
+
+def _label(buckets, value) -> str:
+    label = buckets[0][1]
+    for lower, name in buckets:
+        if value >= lower:
+            label = name
+    return label
+
+
+def size_bucket(size: int) -> str:
+    return _label(SIZE_BUCKETS, size)
+
+
+def age_bucket(created_at: datetime, now: Optional[datetime] = None) -> str:
+    return _label(AGE_BUCKETS, ((now or datetime.utcnow()) - created_at).days)
+
+
+def _bucket_stage(group_by, buckets, scale: int = 1) -> dict:
+    return {"$bucket": {
+        "groupBy": group_by,
+        "boundaries": [lower * scale for lower, _ in buckets] + [2 ** 62],
+        # Tailles ou dates incohérentes (valeur négative, champ absent)
+        "default": OUT_OF_RANGE,
+        "output": {"file_count": {"$sum": 1}, "total_bytes": {"$sum": "$file_size_bytes"}},
+    }}
+
+
+def _group_stage(key) -> list:
+    return [{"$group": {"_id": key, "file_count": {"$sum": 1}, "total_bytes": {"$sum": "$file_size_bytes"}}}]
+
+
+def build_analytics_pipeline(owner_id: str, now: datetime) -> list:
+    return [
+        {"$match": {"owner_id": owner_id, "trashed": False}},
+        {"$facet": {
+            "total": _group_stage(None),
+            "content_type": _group_stage("$content_type"),
+            # Dossier direct = dernier ancêtre
+            "directory": _group_stage({"$last": "$ancestors"}),
+            "size": [_bucket_stage("$file_size_bytes", SIZE_BUCKETS)],
+            "age": [_bucket_stage({"$subtract": [now, "$created_at"]}, AGE_BUCKETS, DAY_MS)],
+        }},
+    ]
+
+
+def _to_counts(rows, key=lambda value: value) -> Dict[str, list]:
+    return {key(row["_id"]): [row["file_count"], row["total_bytes"]] for row in rows}
+
+
+async def compute_analytics(owner_id: str) -> dict:
+    now = datetime.utcnow()
+    cursor = get_collection(File.Settings.name).aggregate(build_analytics_pipeline(owner_id, now))
+    facets = (await cursor.to_list(length=1))[0]
+    total = facets["total"][0] if facets["total"] else {"file_count": 0, "total_bytes": 0}
+    size_labels = dict(SIZE_BUCKETS)
+    age_labels = {lower * DAY_MS: name for lower, name in AGE_BUCKETS}
+    return {
+        "computed_at": now,
+        "total": [total["file_count"], total["total_bytes"]],
+        "content_type": _to_counts(facets["content_type"], lambda value: value or "inconnu"),
+        "directory": _to_counts(facets["directory"], str),
+        "size": _to_counts(facets["size"], lambda value: size_labels.get(value, value)),
+        "age": _to_counts(facets["age"], lambda value: age_labels.get(value, value)),
+    }
+
+
+class AnalyticsCache:
+    """Résultats par utilisateur (LRU + TTL), ajustés en place à chaque modification de fichier.
+
+    Les tranches d'âge dérivent avec le temps : le TTL borne cette dérive.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, owner_id: str) -> Optional[dict]:
+        entry = self._entries.get(owner_id)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(owner_id, None)
+            self.misses += 1
+            cache_requests.inc(cache="analytics", result="miss")
+            return None
+        self._entries.move_to_end(owner_id)
+        self.hits += 1
+        cache_requests.inc(cache="analytics", result="hit")
+        return entry[1]
+
+    def put(self, owner_id: str, analytics: dict):
+        self._entries[owner_id] = (time.monotonic() + self.ttl_seconds, analytics)
+        self._entries.move_to_end(owner_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def apply(self, owner_id: str, file: File, sign: int):
+        """Ajoute (sign=1) ou retire (sign=-1) un fichier des résultats en cache."""
+        entry = self._entries.get(owner_id)
+        if entry is None:
+            return
+        analytics = entry[1]
+        size = file.file_size_bytes
+        directory_id = str(file.ancestors[-1]) if file.ancestors else "None"
+        buckets = (
+            analytics["total"],
+            analytics["content_type"].setdefault(file.content_type or "inconnu", [0, 0]),
+            analytics["directory"].setdefault(directory_id, [0, 0]),
+            analytics["size"].setdefault(size_bucket(size), [0, 0]),
+            analytics["age"].setdefault(age_bucket(file.created_at), [0, 0]),
+        )
+        for counts in buckets:
+            counts[0] += sign
+            counts[1] += sign * size
+
+    def invalidate(self, owner_id: str):
+        self._entries.pop(owner_id, None)
+
+
+analytics_cache = AnalyticsCache(settings.analytics_cache_max_entries, settings.analytics_cache_ttl_seconds)
+
+
+async def get_user_analytics(owner_id: str) -> dict:
+    analytics = analytics_cache.get(owner_id)
+    if analytics is None:
+        analytics = await compute_analytics(owner_id)
+        analytics_cache.put(owner_id, analytics)
+    return analytics
+
+
+def _breakdown(counts: Dict[str, list], names: Optional[dict] = None) -> list:
+    """{clé: [nombre, octets]} -> liste triée par volume décroissant."""
+    return sorted(
+        (
+            {"key": (names or {}).get(key, key), "file_count": count, "total_bytes": size}
+            for key, (count, size) in counts.items()
+            if count > 0
+        ),
+        key=lambda item: item["total_bytes"],
+        reverse=True,
+    )
+
+
+async def format_analytics(analytics: dict) -> dict:
+    """Forme de réponse ; les chemins de dossiers sont résolus en une requête $in."""
+    directory_ids = [PydanticObjectId(key) for key in analytics["directory"] if PydanticObjectId.is_valid(key)]
+    directories = await Directory.find({"_id": {"$in": directory_ids}}).to_list()
+    paths = {str(directory.id): directory.path for directory in directories}
+    return {
+        "computed_at": analytics["computed_at"],
+        "file_count": analytics["total"][0],
+        "total_bytes": analytics["total"][1],
+        "by_content_type": _breakdown(analytics["content_type"]),
+        "by_directory": _breakdown(analytics["directory"], paths),
+        "by_size": _breakdown(analytics["size"]),
+        "by_age": _breakdown(analytics["age"]),
+    }
+
+
+async def _rollup_owner(owner_id: str, semaphore: asyncio.Semaphore):
+    async with semaphore:
+        analytics = await compute_analytics(owner_id)
+        analytics_cache.put(owner_id, analytics)
+        # Les clés (types MIME) ne sont pas des noms de champs sûrs : on stocke des listes
+        await get_collection(ANALYTICS_COLLECTION).replace_one({"_id": owner_id}, {
+            "_id": owner_id,
+            "computed_at": analytics["computed_at"],
+            "total": analytics["total"],
+            **{facet: _breakdown(analytics[facet]) for facet in ("content_type", "directory", "size", "age")},
+        }, upsert=True)
+
+
+async def rollup_storage_analytics():
+    """Recalcule les statistiques de tous les utilisateurs, à concurrence bornée."""
+    semaphore = asyncio.Semaphore(settings.analytics_rollup_concurrency)
+    started = datetime.utcnow()
+    owners = get_collection(File.Settings.name).aggregate([
+        {"$match": {"trashed": False}},
+        {"$group": {"_id": "$owner_id"}},
+    ])
+    pending = set()
+    count = 0
+    failed = 0
+
+    def collect(done) -> int:
+        errors = 0
+        for task in done:
+            if task.exception() is not None:
+                errors += 1
+                logger.error(
+                    "Échec du recalcul des statistiques de %s", task.get_name(), exc_info=task.exception()
+                )
+        return errors
+
+    async for row in owners:
+        # La file d'attente reste bornée : on n'ouvre pas une tâche par utilisateur d'un coup
+        if len(pending) >= settings.analytics_rollup_concurrency * 2:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            failed += collect(done)
+        pending.add(asyncio.create_task(_rollup_owner(row["_id"], semaphore), name=str(row["_id"])))
+        count += 1
+    if pending:
+        done, _ = await asyncio.wait(pending)
+        failed += collect(done)
+
+    if failed:
+        # Le nettoyage effacerait la dernière synthèse valide des utilisateurs en échec
+        logger.warning("Statistiques non recalculées pour %d utilisateur(s) sur %d", failed, count)
+        return
+    # Utilisateurs sans fichier actif depuis le dernier passage
+    await get_collection(ANALYTICS_COLLECTION).delete_many({"computed_at": {"$lt": started - timedelta(seconds=1)}})
+    logger.info("Statistiques de stockage recalculées pour %d utilisateur(s)", count)
+
+
+async def get_rollup_summary(limit: int = 50) -> dict:
+    collection = get_collection(ANALYTICS_COLLECTION)
+    totals = await collection.aggregate([
+        {"$group": {
+            "_id": None,
+            "users": {"$sum": 1},
+            "file_count": {"$sum": {"$arrayElemAt": ["$total", 0]}},
+            "total_bytes": {"$sum": {"$arrayElemAt": ["$total", 1]}},
+            "computed_at": {"$min": "$computed_at"},
+        }},
+    ]).to_list(length=1)
+    top = await collection.aggregate([
+        {"$addFields": {"total_bytes": {"$arrayElemAt": ["$total", 1]}}},
+        {"$sort": {"total_bytes": -1}},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "owner_id": "$_id", "total_bytes": 1, "file_count": {"$arrayElemAt": ["$total", 0]}}},
+    ]).to_list(length=limit)
+    summary = totals[0] if totals else {"users": 0, "file_count": 0, "total_bytes": 0, "computed_at": None}
+    summary.pop("_id", None)
+    return {**summary, "top_users": top}
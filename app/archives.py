@@ -0,0 +1,240 @@
+"""Extraction d'archives ZIP côté serveur, membre par membre, directement dans GridFS.
+
+L'archive reçue (UploadFile, déjà mise en tampon par Starlette) est lue via son
+répertoire central : chaque membre est décompressé par morceaux et écrit au fil
+de l'eau dans GridFS, sans extraction complète en mémoire ni sur disque. Les
+limites anti zip-bomb sont vérifiées sur les tailles déclarées puis sur les
+octets réellement produits, qui peuvent mentir.
+"""
+import asyncio
+import hashlib
+import mimetypes
+import posixpath
+import zipfile
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from beanie import PydanticObjectId
+from fastapi import HTTPException, UploadFile, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.admission import record_write_latency
+from app.analytics import analytics_cache
+from app.config import settings
+from app.directories import apply_directory_delta, child_ancestors, get_or_create_child
+from app.journal import record_changes
+from app.models.change import ChangeEvent, ChangeKind
+from app.models.file import Directory, File, FileVersion
+from app.models.user import User
+from app.mongo_connect import delete_blobs, get_gridfs_bucket, record_gridfs_write
+from app.utils import check_storage_quota, get_filename
+
+IGNORED_PREFIXES = ("__MACOSX/",)
+IGNORED_NAMES = (".DS_Store", "Thumbs.db")
+
+
+class ArchiveLimitExceeded(Exception):
+    pass
+
+
+def _member_parts(info: zipfile.ZipInfo) -> List[str]:
+    """Chemin du membre découpé et assaini ; liste vide si le membre est ignoré."""
+    name = info.filename.replace("\\", "/")
+    if info.is_dir() or name.startswith(IGNORED_PREFIXES):
+        return []
+    parts = [part.strip() for part in posixpath.normpath(name).split("/") if part.strip() not in ("", ".")]
+    if not parts or any(part == ".." for part in parts) or name.startswith("/"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Chemin interdit dans l'archive : {info.filename}")
+    if parts[-1] in IGNORED_NAMES or parts[-1].startswith("._"):
+        return []
+    return parts
+
+
+def _check_declared_limits(members: List[Tuple[zipfile.ZipInfo, List[str]]]) -> int:
+    if len(members) > settings.zip_max_members:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Archive trop volumineuse : plus de {settings.zip_max_members} fichiers"
+        )
+    declared = 0
+    for info, _ in members:
+        if info.flag_bits & 0x1:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Les archives chiffrées ne sont pas prises en charge")
+        if info.file_size > settings.zip_ratio_check_min_bytes and \
+                info.file_size > max(info.compress_size, 1) * settings.zip_max_compression_ratio:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Taux de compression suspect : {info.filename}")
+        declared += info.file_size
+    if declared > settings.zip_max_total_bytes:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Archive trop volumineuse une fois décompressée"
+        )
+    return declared
+
+
+class _Extraction:
+    def __init__(self, archive: zipfile.ZipFile, target: Directory, user: User):
+        self.archive = archive
+        self.target = target
+        self.owner_id = str(user.id)
+        self.owner = user.name
+        self.bucket = get_gridfs_bucket()
+        self.directories: Dict[Tuple[str, ...], Directory] = {(): target}
+        self.taken_names: Dict[PydanticObjectId, set] = {}
+        self.pending: List[File] = []
+        self.changes: List[dict] = []
+        self.extracted = 0
+        self.extracted_bytes = 0
+        self.streamed_bytes = 0
+        self.created_directories = 0
+
+    async def _directory(self, parts: Tuple[str, ...]) -> Directory:
+        if parts not in self.directories:
+            parent = await self._directory(parts[:-1])
+            directory, created = await get_or_create_child(parent, parts[-1])
+            if created:
+                self.created_directories += 1
+                self.changes.append({
+                    "event": ChangeEvent.CREATE, "kind": ChangeKind.DIRECTORY,
+                    "entity_id": directory.id, "path": directory.path,
+                })
+            self.directories[parts] = directory
+        return self.directories[parts]
+
+    async def _unique_name(self, directory: Directory, name: str) -> str:
+        taken = self.taken_names.setdefault(directory.id, set())
+        if name in taken or await File.find_one(
+            File.file_name == name, File.parent.id == directory.id, File.trashed == False
+        ):
+            name = get_filename(name)
+        taken.add(name)
+        return name
+
+    async def _stream_member(self, info: zipfile.ZipInfo, filename: str, directory: Directory, content_type: str):
+        """Décompresse un membre par morceaux vers GridFS ; retourne (blob, taille, empreinte)."""
+        upload = self.bucket.open_upload_stream(filename, metadata={
+            "owner_id": self.owner_id,
+            "directory": directory.path,
+            "content_type": content_type,
+        })
+        digest = hashlib.sha256()
+        size = 0
+        member = await asyncio.to_thread(self.archive.open, info)
+        try:
+            while chunk := await asyncio.to_thread(member.read, settings.chunk_size):
+                size += len(chunk)
+                # La taille déclarée a servi aux contrôles : la dépasser trahit une archive piégée
+                if size > info.file_size or self.streamed_bytes + size > settings.zip_max_total_bytes:
+                    raise ArchiveLimitExceeded(f"Contenu décompressé supérieur à la taille déclarée : {info.filename}")
+                digest.update(chunk)
+                started = asyncio.get_running_loop().time()
+                await upload.write(chunk)
+                record_write_latency(asyncio.get_running_loop().time() - started, 1)
+                record_gridfs_write(len(chunk))
+            await upload.close()
+        except BaseException:
+            await upload.abort()
+            raise
+        finally:
+            await asyncio.to_thread(member.close)
+        return upload._id, size, digest.hexdigest()
+
+    async def add(self, info: zipfile.ZipInfo, parts: List[str]):
+        directory = await self._directory(tuple(parts[:-1]))
+        filename = await self._unique_name(directory, parts[-1])
+        content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        gridfs_id, size, digest = await self._stream_member(info, filename, directory, content_type)
+
+        self.streamed_bytes += size
+        file = File(
+            id=PydanticObjectId(),
+            file_name=filename,
+            content_type=content_type,
+            owner_id=self.owner_id,
+            owner=self.owner,
+            created_at=datetime.utcnow(),
+            parent=directory,
+            ancestors=child_ancestors(directory),
+            gridfs_id=gridfs_id,
+            file_size_bytes=size,
+            digest=digest,
+        )
+        self.pending.append(file)
+        self.changes.append({
+            "event": ChangeEvent.CREATE, "kind": ChangeKind.FILE, "entity_id": file.id,
+            "path": f"{directory.path}/{filename}", "file_size_bytes": size,
+        })
+        if len(self.pending) >= settings.zip_insert_batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """Insère le lot de fichiers, leurs versions, les agrégats de dossiers et le journal."""
+        files, self.pending = self.pending, []
+        if files:
+            await File.insert_many(files)
+            await FileVersion.insert_many([
+                FileVersion(
+                    file_id=f.id, owner_id=f.owner_id, version=1, gridfs_id=f.gridfs_id,
+                    file_size_bytes=f.file_size_bytes, content_type=f.content_type,
+                    digest=f.digest, created_at=f.created_at,
+                )
+                for f in files
+            ])
+            deltas: Dict[PydanticObjectId, List[int]] = {}
+            for f in files:
+                delta = deltas.setdefault(f.ancestors[-1], [0, 0])
+                delta[0] += 1
+                delta[1] += f.file_size_bytes
+                analytics_cache.apply(self.owner_id, f, 1)
+            for directory_id, (count, size) in deltas.items():
+                await apply_directory_delta(directory_id, count, size)
+            self.extracted += len(files)
+            self.extracted_bytes += sum(f.file_size_bytes for f in files)
+        changes, self.changes = self.changes, []
+        await record_changes(self.owner_id, changes)
+
+    async def abort(self):
+        """Annule le lot en cours (blobs compris) ; les dossiers déjà créés restent journalisés."""
+        await delete_blobs([f.gridfs_id for f in self.pending])
+        self.pending = []
+        await record_changes(self.owner_id, [c for c in self.changes if c["kind"] == ChangeKind.DIRECTORY])
+        self.changes = []
+
+
+async def extract_zip(upload: UploadFile, target: Directory, user: User, db: AsyncSession) -> dict:
+    try:
+        archive = await asyncio.to_thread(zipfile.ZipFile, upload.file)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Archive ZIP invalide")
+
+    with archive:
+        members = [(info, parts) for info in archive.infolist() if (parts := _member_parts(info))]
+        declared = _check_declared_limits(members)
+        if not await check_storage_quota(str(user.id), declared, db):
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail="Quota de stockage dépassé. Veuillez upgrader votre abonnement."
+            )
+
+        extraction = _Extraction(archive, target, user)
+        try:
+            for info, parts in members:
+                await extraction.add(info, parts)
+            await extraction.flush()
+        except (ArchiveLimitExceeded, zipfile.BadZipFile, zipfile.LargeZipFile) as e:
+            # Les lots déjà insérés restent ; seul le lot en cours est annulé
+            await extraction.abort()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{e} ({extraction.extracted} fichier(s) extrait(s) avant l'arrêt)"
+            )
+        except BaseException:
+            await extraction.abort()
+            raise
+
+    return {
+        "directory": target.path,
+        "extracted": extraction.extracted,
+        "total_bytes": extraction.extracted_bytes,
+        "directories_created": extraction.created_directories,
+    }
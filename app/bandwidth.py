@@ -0,0 +1,119 @@
+"""Limitation de débit des téléchargements : seaux à jetons par utilisateur et par worker.
+
+Le débit est consommé par tranches de la taille d'un chunk (au plus une attente
+par chunk). Chaque seau est protégé par un verrou asyncio, qui réveille les
+attentes dans l'ordre d'arrivée : les flux actifs d'un même seau avancent à
+tour de rôle, chunk par chunk.
+"""
+import asyncio
+import time
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.metrics import Counter, cache_requests
+from app.utils import get_active_plan
+
+throttled_seconds = Counter(
+    "bandwidth_throttled_seconds_total", "Temps passé à attendre des jetons de débit", ("scope",)
+)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.active_streams = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def is_idle(self) -> bool:
+        """Sans flux actif et plein : équivalent à un seau neuf, on peut l'oublier."""
+        if self.active_streams:
+            return False
+        self._refill()
+        return self.tokens >= self.burst
+
+    async def consume(self, amount: int, scope: str):
+        async with self._lock:
+            self._refill()
+            if self.tokens < amount:
+                delay = (amount - self.tokens) / self.rate
+                throttled_seconds.inc(delay, scope=scope)
+                await asyncio.sleep(delay)
+                self._refill()
+            # Peut devenir négatif pour un chunk plus gros que la rafale : dette remboursée au suivant
+            self.tokens -= amount
+
+
+def _new_bucket(rate: int) -> TokenBucket:
+    return TokenBucket(rate, max(rate, settings.chunk_size))
+
+
+_user_buckets: Dict[str, TokenBucket] = {}
+_worker_bucket: Optional[TokenBucket] = (
+    _new_bucket(settings.bandwidth_worker_bytes_per_second) if settings.bandwidth_worker_bytes_per_second else None
+)
+# user_id -> (expiration monotonic, débit en octets/s)
+_entitlements: Dict[str, Tuple[float, int]] = {}
+
+
+def rate_for_plan(plan_type: Optional[str]) -> int:
+    rates = settings.bandwidth_plan_rates
+    return rates.get(plan_type or "free", rates.get("free", 0))
+
+
+async def get_download_rate(user_id: str, db: AsyncSession) -> int:
+    """Débit autorisé selon le plan actif, mis en cache `bandwidth_entitlement_ttl_seconds`."""
+    cached = _entitlements.get(user_id)
+    if cached and cached[0] > time.monotonic():
+        cache_requests.inc(cache="entitlements", result="hit")
+        return cached[1]
+    cache_requests.inc(cache="entitlements", result="miss")
+    plan = await get_active_plan(user_id, db)
+    rate = rate_for_plan(plan.plan_type if plan else None)
+    _entitlements[user_id] = (time.monotonic() + settings.bandwidth_entitlement_ttl_seconds, rate)
+    return rate
+
+
+def invalidate_entitlement(user_id: str):
+    _entitlements.pop(str(user_id), None)
+
+
+def _user_bucket(user_id: str, rate: int) -> TokenBucket:
+    bucket = _user_buckets.get(user_id)
+    if bucket is None or bucket.rate != rate:
+        for key in [key for key, existing in _user_buckets.items() if existing.is_idle()]:
+            del _user_buckets[key]
+        bucket = _user_buckets.setdefault(user_id, _new_bucket(rate))
+        bucket.rate = rate
+    return bucket
+
+
+async def throttle(chunks: AsyncIterator[bytes], user_id: Optional[str] = None, rate: int = 0) -> AsyncIterator[bytes]:
+    """Enveloppe un flux de chunks ; `rate=0` désactive la limite par utilisateur."""
+    if not settings.bandwidth_enabled:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    bucket = _user_bucket(user_id, rate) if user_id and rate else None
+    if bucket:
+        bucket.active_streams += 1
+    try:
+        async for chunk in chunks:
+            if bucket:
+                await bucket.consume(len(chunk), "user")
+            if _worker_bucket:
+                await _worker_bucket.consume(len(chunk), "worker")
+            yield chunk
+    finally:
+        if bucket:
+            bucket.active_streams -= 1
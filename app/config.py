@@ -1,3 +1,5 @@
+from typing import Dict, Literal, Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -12,6 +14,133 @@ class Settings(BaseSettings):
     chunk_size: int = 1024 * 1024  
     stripe_secret_key: str = ""
     stripe_webhook_secret: str = ""
+
+    change_journal_retention_days: int = 30
+    change_journal_compact_after_hours: int = 24
+    change_journal_compact_batch_size: int = 1000
+    change_journal_maintenance_interval_seconds: int = 3600
+    changes_long_poll_max_seconds: float = 30.0
+    changes_poll_interval_seconds: float = 2.0
+
+    share_link_secret: str = ""
+    share_link_max_ttl_seconds: int = 7 * 24 * 3600
+    share_link_cache_max_age: int = 3600
+
+    trash_retention_days: int = 30
+    # "count" : la corbeille consomme le quota ; "exclude" : seuls les fichiers vivants comptent
+    trash_quota_policy: Literal["count", "exclude"] = "count"
+    trash_purge_interval_seconds: int = 300
+    trash_purge_batch_size: int = 100
+
+    default_max_file_versions: int = 3
+    version_prune_interval_seconds: int = 600
+    version_prune_batch_size: int = 100
+
+    analytics_cache_ttl_seconds: int = 300
+    analytics_cache_max_entries: int = 10000
+    analytics_rollup_interval_seconds: int = 3600
+    analytics_rollup_concurrency: int = 4
+
+    admission_enabled: bool = True
+    admission_queue_size: int = 100
+    admission_queue_timeout_seconds: float = 10.0
+    admission_retry_after_seconds: int = 5
+    admission_upload_concurrency: int = 8
+    admission_upload_min_concurrency: int = 1
+    admission_upload_max_concurrency: int = 32
+    admission_download_concurrency: int = 64
+    admission_metadata_concurrency: int = 128
+    admission_upload_bytes_global: int = 512 * 1024 * 1024
+    admission_upload_bytes_per_user: int = 128 * 1024 * 1024
+    admission_unknown_upload_bytes: int = 16 * 1024 * 1024
+    # Latence cible d'écriture d'un chunk GridFS (255 Ko) pour l'AIMD des uploads
+    admission_write_latency_target_ms: float = 50.0
+    admission_adjust_interval_seconds: float = 2.0
+
+    bandwidth_enabled: bool = True
+    # Débit de téléchargement par type de plan, en octets/s (0 = illimité)
+    bandwidth_plan_rates: Dict[str, int] = {
+        "free": 2 * 1024 * 1024,
+        "basic": 10 * 1024 * 1024,
+        "premium": 50 * 1024 * 1024,
+        "enterprise": 0,
+    }
+    # Plafond de sortie du worker, partagé par tous les flux (0 = aucun)
+    bandwidth_worker_bytes_per_second: int = 0
+    bandwidth_entitlement_ttl_seconds: int = 300
+
+    access_buffer_max_entries: int = 10000
+    access_flush_interval_seconds: int = 60
+
+    # "local" : fichiers zlib sous cold_storage_path ; "mongo" : base Mongo séparée
+    cold_storage_backend: Literal["none", "local", "mongo"] = "none"
+    cold_storage_path: str = "./cold_storage"
+    cold_storage_mongo_database: str = "drivestorage_cold"
+    cold_storage_after_days: int = 30
+    cold_storage_compression_level: int = 6
+    cold_recall_timeout_seconds: int = 120
+    # Délai avant suppression de la copie GridFS d'un blob copié à froid (téléchargements en cours)
+    cold_storage_delete_grace_seconds: int = 3600
+    tiering_interval_seconds: int = 3600
+    tiering_batch_size: int = 50
+
+    zip_max_members: int = 10000
+    zip_max_total_bytes: int = 5 * 1024 * 1024 * 1024
+    zip_max_compression_ratio: int = 100
+    # Sous ce seuil, un fort taux de compression est normal (fichiers texte, images vides)
+    zip_ratio_check_min_bytes: int = 1024 * 1024
+    zip_insert_batch_size: int = 100
+
+    postgres_pool_size: int = 10
+    postgres_max_overflow: int = 10
+    postgres_pool_timeout_seconds: float = 30.0
+    postgres_pool_recycle_seconds: int = 1800
+    postgres_pool_pre_ping: bool = True
+    # Connexions ouvertes dès le démarrage (au plus postgres_pool_size)
+    postgres_pool_warmup: int = 2
+    # Cache de requêtes préparées d'asyncpg ; 0 derrière un PgBouncer en mode transaction
+    postgres_statement_cache_size: int = 100
+
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 2
+    mongo_max_idle_time_ms: Optional[int] = None
+    mongo_wait_queue_timeout_ms: Optional[int] = None
+
+    # Réplica de lecture optionnel ; l'URL du primaire convient pour les tests (sessions en lecture seule)
+    postgres_read_url: Optional[str] = None
+    postgres_read_ssl: Literal["require", "prefer", "disable"] = "require"
+    postgres_read_max_lag_seconds: float = 5.0
+    # Après un changement d'abonnement, les lectures de l'utilisateur restent sur le primaire
+    postgres_read_your_writes_seconds: float = 30.0
+    postgres_replica_check_interval_seconds: int = 10
+
+    plans_cache_max_age_seconds: int = 300
+    # Filet de sécurité si un NOTIFY plans_changed est perdu
+    plans_refresh_interval_seconds: int = 900
+    plans_listen_retry_seconds: float = 5.0
+
+    subscription_expiry_interval_seconds: int = 300
+    subscription_expiry_batch_size: int = 500
+    subscription_expiry_emails: bool = True
+    subscription_expiry_email_concurrency: int = 4
+
+    users_export_batch_size: int = 1000
+
+    event_loop_lag_interval_seconds: float = 0.5
+
+    # Fraction des requêtes tracées (Server-Timing, phases dans le journal d'accès, export)
+    tracing_sample_rate: float = 0.1
+    access_log_enabled: bool = True
+    # Fichier OTLP/JSON (une trace par ligne) ; aucun export si absent
+    tracing_export_path: Optional[str] = None
+    tracing_export_interval_seconds: float = 5.0
+    tracing_export_max_buffer: int = 10000
+    tracing_service_name: str = "drive-storage-api"
+
+    # 0 désactive le journal des requêtes lentes
+    slow_query_threshold_ms: float = 200.0
+    slow_query_max_shapes: int = 500
+    slow_query_recent_size: int = 200
   
     @property
     def postgres_database_url(self) -> str:
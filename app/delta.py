@@ -0,0 +1,217 @@
+"""Uploads différentiels par blocs (type rsync) réutilisant les chunks GridFS existants.
+
+Un bloc correspond à un chunk GridFS du blob de base. Le serveur publie pour
+chaque bloc une somme faible (adler32, roulante côté client) et une somme forte
+(sha256). Le client décrit la nouvelle version comme une suite de blocs alignés :
+références à des blocs de base, ou blocs littéraux envoyés dans le corps. Les
+blocs référencés sont copiés par MongoDB ($merge) sans transiter par Python.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+import zlib
+from datetime import datetime
+from typing import List, Optional
+
+from bson import Binary, ObjectId
+from fastapi import HTTPException, UploadFile, status
+from pydantic import BaseModel, Field, model_validator
+
+from app.admission import record_write_latency
+from app.metrics import cache_requests
+from app.mongo_connect import get_collection, get_database, record_gridfs_write
+from app.tiering import ensure_hot
+from app.versions import set_blob_digest
+
+logger = logging.getLogger(__name__)
+
+BUCKET = "fs"
+SIGNATURES_COLLECTION = "block_signatures"
+LITERAL_INSERT_BATCH = 16
+
+
+class DeltaBlock(BaseModel):
+    ref: Optional[int] = Field(default=None, ge=0)
+    literal: Optional[int] = Field(default=None, gt=0)
+
+    @model_validator(mode="after")
+    def _exactly_one(self):
+        if (self.ref is None) == (self.literal is None):
+            raise ValueError("Chaque bloc doit être soit 'ref', soit 'literal'")
+        return self
+
+
+class DeltaManifest(BaseModel):
+    blocks: List[DeltaBlock]
+    md5: str = Field(pattern=r"^[0-9a-fA-F]{32}$")
+    sha256: str = Field(pattern=r"^[0-9a-fA-F]{64}$")
+
+
+def _sign_block(data: bytes) -> list:
+    return [zlib.adler32(data), hashlib.sha256(data).hexdigest()]
+
+
+async def get_block_signatures(gridfs_id) -> dict:
+    """Signatures des blocs d'un blob, calculées une seule fois puis mises en cache."""
+    signatures = get_collection(SIGNATURES_COLLECTION)
+    cached = await signatures.find_one({"_id": gridfs_id})
+    cache_requests.inc(cache="block_signatures", result="hit" if cached else "miss")
+    if cached:
+        return cached
+
+    await ensure_hot(gridfs_id)
+    grid_file = await get_collection(f"{BUCKET}.files").find_one({"_id": gridfs_id})
+    if not grid_file:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contenu du fichier introuvable")
+
+    blocks = []
+    async for chunk in get_collection(f"{BUCKET}.chunks").find({"files_id": gridfs_id}).sort("n", 1):
+        blocks.append(await asyncio.to_thread(_sign_block, bytes(chunk["data"])))
+
+    doc = {
+        "_id": gridfs_id,
+        "block_size": grid_file["chunkSize"],
+        "length": grid_file["length"],
+        "blocks": blocks,
+    }
+    await signatures.replace_one({"_id": gridfs_id}, doc, upsert=True)
+    return doc
+
+
+def _block_length(signatures: dict, n: int) -> int:
+    block_size = signatures["block_size"]
+    return min(block_size, signatures["length"] - n * block_size)
+
+
+async def _insert_chunks(chunks, docs: list):
+    started = time.perf_counter()
+    await chunks.insert_many(docs)
+    record_write_latency(time.perf_counter() - started, len(docs))
+    record_gridfs_write(sum(len(doc["data"]) for doc in docs))
+
+
+async def _blob_sha256(files_id) -> str:
+    """sha256 du blob relu chunk par chunk : les blocs copiés par $merge ne passent pas par Python."""
+    digest = hashlib.sha256()
+    async for chunk in get_collection(f"{BUCKET}.chunks").find({"files_id": files_id}, {"data": 1}).sort("n", 1):
+        await asyncio.to_thread(digest.update, chunk["data"])
+    return digest.hexdigest()
+
+
+async def record_assembled_digest(files_id, announced: str):
+    """Tâche de fond : sha256 du blob assemblé, reporté sur la version qui le référence.
+
+    Le contenu est déjà vérifié à l'assemblage (sommes fortes par bloc et
+    filemd5) ; l'empreinte reste vide jusque-là, ce qui exclut le blob de la
+    déduplication tant qu'elle n'est pas calculée.
+    """
+    sha256 = await _blob_sha256(files_id)
+    if sha256 != announced:
+        logger.warning("sha256 du blob %s différent de celui annoncé (%s != %s)", files_id, sha256, announced)
+    await set_blob_digest(files_id, sha256)
+
+
+async def _discard(new_id):
+    await get_collection(f"{BUCKET}.chunks").delete_many({"files_id": new_id})
+
+
+async def assemble_delta(
+    base_gridfs_id,
+    manifest: DeltaManifest,
+    literals: UploadFile,
+    filename: str,
+    metadata: dict,
+) -> dict:
+    """Construit un nouveau blob GridFS à partir du blob de base et des blocs littéraux.
+
+    Retourne l'identifiant et la taille du nouveau blob. Les sommes fortes par
+    bloc sont calculées côté serveur et le contenu assemblé est vérifié par
+    filemd5 avant que le document fs.files ne soit publié ; le sha256 du blob,
+    qui impose de relire tous les chunks, est calculé hors requête
+    (`record_assembled_digest`).
+    """
+    base = await get_block_signatures(base_gridfs_id)
+    # Les blocs référencés sont copiés depuis fs.chunks : la base doit être dans GridFS
+    await ensure_hot(base_gridfs_id)
+    block_size = base["block_size"]
+    chunks = get_collection(f"{BUCKET}.chunks")
+    new_id = ObjectId()
+
+    last = len(manifest.blocks) - 1
+    ref_targets: dict = {}
+    new_blocks = []
+    length = 0
+    pending = []
+    try:
+        for n, block in enumerate(manifest.blocks):
+            if block.ref is not None and block.ref >= len(base["blocks"]):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Bloc de base {block.ref} inexistant")
+            size = _block_length(base, block.ref) if block.ref is not None else block.literal
+
+            # GridFS impose des chunks pleins, sauf le dernier ; vérifié avant toute lecture du corps
+            if size <= 0 or size > block_size or (n != last and size != block_size):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Le bloc {n} doit faire exactement {block_size} octets (sauf le dernier)"
+                )
+
+            if block.ref is not None:
+                ref_targets.setdefault(block.ref, []).append(n)
+                new_blocks.append(base["blocks"][block.ref])
+            else:
+                data = await literals.read(size)
+                if len(data) != size:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Données littérales incomplètes")
+                pending.append({"files_id": new_id, "n": n, "data": Binary(data)})
+                new_blocks.append(await asyncio.to_thread(_sign_block, data))
+                if len(pending) >= LITERAL_INSERT_BATCH:
+                    await _insert_chunks(chunks, pending)
+                    pending = []
+            length += size
+
+        if pending:
+            await _insert_chunks(chunks, pending)
+        if await literals.read(1):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Données littérales excédentaires")
+
+        if ref_targets:
+            # Table indexée par numéro de bloc de base -> positions dans la nouvelle version
+            table = [ref_targets.get(i, []) for i in range(max(ref_targets) + 1)]
+            await chunks.aggregate([
+                {"$match": {"files_id": base_gridfs_id, "n": {"$in": list(ref_targets)}}},
+                {"$project": {
+                    "_id": 0,
+                    "files_id": {"$literal": new_id},
+                    "data": 1,
+                    "n": {"$arrayElemAt": [table, "$n"]},
+                }},
+                {"$unwind": "$n"},
+                {"$merge": {"into": f"{BUCKET}.chunks", "whenMatched": "fail", "whenNotMatched": "insert"}},
+            ]).to_list(length=None)
+
+        checksum = await get_database().command("filemd5", new_id, root=BUCKET)
+        if checksum.get("md5") != manifest.md5.lower():
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="L'empreinte du fichier assemblé ne correspond pas (md5)"
+            )
+    except BaseException:
+        await _discard(new_id)
+        raise
+
+    await get_collection(f"{BUCKET}.files").insert_one({
+        "_id": new_id,
+        "length": length,
+        "chunkSize": block_size,
+        "uploadDate": datetime.utcnow(),
+        "filename": filename,
+        "metadata": metadata,
+    })
+    # Les signatures de la nouvelle version sont connues sans relire les données
+    await get_collection(SIGNATURES_COLLECTION).replace_one(
+        {"_id": new_id},
+        {"_id": new_id, "block_size": block_size, "length": length, "blocks": new_blocks},
+        upsert=True,
+    )
+    return {"gridfs_id": new_id, "length": length}
@@ -0,0 +1,222 @@
+"""Hiérarchie de dossiers basée sur des chemins matérialisés."""
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from pymongo.errors import DuplicateKeyError
+
+from app.models.file import Directory, File
+from app.mongo_connect import get_collection
+
+PATH_SEPARATOR = "/"
+
+
+def normalize_path(path: str) -> str:
+    """Normalise un chemin de dossier : "photos//2024/" -> "/photos/2024"."""
+    parts = [part.strip() for part in path.split(PATH_SEPARATOR) if part.strip()]
+    if not parts or any(part in (".", "..") for part in parts):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Chemin de dossier invalide : {path}"
+        )
+    return PATH_SEPARATOR + PATH_SEPARATOR.join(parts)
+
+
+def is_root_path(path: Optional[str]) -> bool:
+    return path is not None and not path.strip(PATH_SEPARATOR).strip()
+
+
+def join_path(parent_path: Optional[str], name: str) -> str:
+    if PATH_SEPARATOR in name or not name.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Nom de dossier invalide : {name}"
+        )
+    return f"{parent_path or ''}{PATH_SEPARATOR}{name.strip()}"
+
+
+def parent_path_of(path: str) -> str:
+    return path.rsplit(PATH_SEPARATOR, 1)[0]
+
+
+async def find_directory(owner_id: str, directory: str) -> Optional[Directory]:
+    """Résout un dossier par son chemin ("a/b/c") ou son nom racine ("a")."""
+    return await Directory.find_one(
+        Directory.owner_id == owner_id,
+        Directory.path == normalize_path(directory)
+    )
+
+
+def child_ancestors(directory: Directory) -> list:
+    """Ancêtres d'un élément placé directement dans `directory`."""
+    return [*directory.ancestors, directory.id]
+
+
+async def get_or_create_child(parent: Directory, name: str) -> Tuple[Directory, bool]:
+    """Sous-dossier `name` de `parent`, créé s'il n'existe pas (sûr en cas de création concurrente)."""
+    path = join_path(parent.path, name)
+    existing = await Directory.find_one(Directory.owner_id == parent.owner_id, Directory.path == path)
+    if existing:
+        return existing, False
+
+    ancestors = child_ancestors(parent)
+    directory = Directory(
+        dir_name=name.strip(),
+        owner_id=parent.owner_id,
+        owner=parent.owner,
+        created_at=datetime.utcnow(),
+        path=path,
+        parent_id=parent.id,
+        ancestors=ancestors,
+        depth=len(ancestors),
+    )
+    try:
+        await directory.insert()
+    except DuplicateKeyError:
+        return await Directory.find_one(Directory.owner_id == parent.owner_id, Directory.path == path), False
+    return directory, True
+
+
+async def list_children(owner_id: str, parent: Optional[Directory]) -> List[Directory]:
+    parent_id = parent.id if parent else None
+    return await Directory.find(
+        {"owner_id": owner_id, "parent_id": parent_id}
+    ).sort("dir_name").to_list()
+
+
+async def list_subtree(owner_id: str, root: Directory) -> List[Directory]:
+    """Descendants d'un dossier en une requête sur l'index (owner_id, ancestors)."""
+    return await Directory.find(
+        {"owner_id": owner_id, "ancestors": root.id}
+    ).sort("path").to_list()
+
+
+async def compute_subtree_size(owner_id: str, root: Directory) -> dict:
+    """Taille récursive : somme des agrégats des dossiers du sous-arbre, sans lire les fichiers."""
+    result = await Directory.aggregate([
+        {"$match": {"owner_id": owner_id, "$or": [{"_id": root.id}, {"ancestors": root.id}]}},
+        {"$group": {
+            "_id": None,
+            "file_count": {"$sum": "$file_count"},
+            "total_bytes": {"$sum": "$total_bytes"},
+        }},
+    ]).to_list()
+    stats = result[0] if result else {"file_count": 0, "total_bytes": 0}
+    return {"path": root.path, "file_count": stats["file_count"], "total_bytes": stats["total_bytes"]}
+
+
+async def apply_directory_delta(directory_id, file_delta: int, bytes_delta: int):
+    """Met à jour atomiquement les agrégats d'un dossier après une mutation de fichier."""
+    await get_collection(Directory.Settings.name).update_one(
+        {"_id": directory_id},
+        {
+            "$inc": {"file_count": file_delta, "total_bytes": bytes_delta},
+            "$max": {"last_modified": datetime.utcnow()},
+        }
+    )
+
+
+async def repair_directory_stats(owner_id: Optional[str] = None):
+    """Recalcule tous les agrégats en une agrégation fusionnée côté serveur ($merge).
+
+    Les dossiers sans fichier sont injectés via $unionWith pour être remis à zéro.
+    """
+    scope = {"owner_id": owner_id} if owner_id else {}
+    await File.aggregate([
+        {"$match": {**scope, "trashed": {"$ne": True}}},
+        {"$group": {
+            "_id": {"$last": "$ancestors"},
+            "file_count": {"$sum": 1},
+            "total_bytes": {"$sum": "$file_size_bytes"},
+            "last_modified": {"$max": "$created_at"},
+        }},
+        {"$unionWith": {"coll": Directory.Settings.name, "pipeline": [
+            {"$match": scope},
+            {"$project": {
+                "file_count": {"$literal": 0},
+                "total_bytes": {"$literal": 0},
+                "last_modified": "$created_at",
+            }},
+        ]}},
+        {"$group": {
+            "_id": "$_id",
+            "file_count": {"$sum": "$file_count"},
+            "total_bytes": {"$sum": "$total_bytes"},
+            "last_modified": {"$max": "$last_modified"},
+        }},
+        {"$match": {"_id": {"$ne": None}}},
+        {"$merge": {
+            "into": Directory.Settings.name,
+            "on": "_id",
+            "whenMatched": "merge",
+            "whenNotMatched": "discard",
+        }},
+    ]).to_list()
+
+
+async def rename_subtree(owner_id: str, directory: Directory, new_path: str):
+    """Renomme un dossier et réécrit les chemins des descendants en un seul update_many."""
+    old_path = directory.path
+    await get_collection(Directory.Settings.name).update_many(
+        {"owner_id": owner_id, "ancestors": directory.id},
+        [{"$set": {"path": {"$concat": [
+            new_path,
+            {"$substrCP": ["$path", len(old_path), {"$strLenCP": "$path"}]},
+        ]}}}]
+    )
+    directory.dir_name = new_path.rsplit(PATH_SEPARATOR, 1)[1]
+    directory.path = new_path
+    # $set ciblé : ne pas écraser les agrégats incrémentés en parallèle
+    await get_collection(Directory.Settings.name).update_one(
+        {"_id": directory.id},
+        {"$set": {"dir_name": directory.dir_name, "path": new_path}}
+    )
+
+
+async def move_subtree(owner_id: str, directory: Directory, new_parent: Optional[Directory]):
+    """Déplace un sous-arbre : dossiers et fichiers réécrits par des updates en masse."""
+    new_prefix = child_ancestors(new_parent) if new_parent else []
+    new_path = join_path(new_parent.path if new_parent else None, directory.dir_name)
+    old_path = directory.path
+
+    # Les ancêtres des descendants commencent tous par [..., directory.id, ...] :
+    # on remplace tout ce qui précède directory.id par le nouveau préfixe.
+    rebased_ancestors = {"$concatArrays": [
+        new_prefix,
+        {"$slice": [
+            "$ancestors",
+            {"$indexOfArray": ["$ancestors", directory.id]},
+            {"$size": "$ancestors"},
+        ]},
+    ]}
+    await get_collection(Directory.Settings.name).update_many(
+        {"owner_id": owner_id, "ancestors": directory.id},
+        [
+            {"$set": {
+                "ancestors": rebased_ancestors,
+                "path": {"$concat": [
+                    new_path,
+                    {"$substrCP": ["$path", len(old_path), {"$strLenCP": "$path"}]},
+                ]},
+            }},
+            {"$set": {"depth": {"$size": "$ancestors"}}},
+        ]
+    )
+    await get_collection(File.Settings.name).update_many(
+        {"owner_id": owner_id, "ancestors": directory.id},
+        [{"$set": {"ancestors": rebased_ancestors}}]
+    )
+
+    directory.parent_id = new_parent.id if new_parent else None
+    directory.ancestors = new_prefix
+    directory.depth = len(new_prefix)
+    directory.path = new_path
+    await get_collection(Directory.Settings.name).update_one(
+        {"_id": directory.id},
+        {"$set": {
+            "parent_id": directory.parent_id,
+            "ancestors": new_prefix,
+            "depth": directory.depth,
+            "path": new_path,
+        }}
+    )
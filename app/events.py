@@ -0,0 +1,28 @@
+"""Bus d'événements applicatifs en mémoire.
+
+Les émetteurs (tâches de fond, routes) publient un événement nommé ; chaque
+abonné s'exécute dans sa propre tâche de fond, si bien qu'un abonné lent ou en
+échec (envoi d'email) ne retarde ni ne fait échouer l'émetteur.
+"""
+from collections import defaultdict
+from functools import partial
+from typing import Awaitable, Callable, Dict, List
+
+from app.tasks import spawn
+
+SUBSCRIPTION_EXPIRED = "subscription.expired"
+
+_handlers: Dict[str, List[Callable[..., Awaitable]]] = defaultdict(list)
+
+
+def subscribe(name: str):
+    """Décorateur : enregistre un abonné asynchrone à l'événement `name`."""
+    def register(handler: Callable[..., Awaitable]):
+        _handlers[name].append(handler)
+        return handler
+    return register
+
+
+def emit(name: str, **payload):
+    for handler in _handlers[name]:
+        spawn(f"{name}:{handler.__name__}", partial(handler, **payload))
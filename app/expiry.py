@@ -0,0 +1,80 @@
+"""Expiration planifiée des abonnements, par lots ensemblistes.
+
+Chaque lot est un seul UPDATE : la CTE verrouille (FOR UPDATE SKIP LOCKED) au
+plus `subscription_expiry_batch_size` abonnements actifs échus, repérés par
+l'index partiel ix_subscriptions_active_end_date, et RETURNING fournit de quoi
+invalider les caches et notifier. SKIP LOCKED permet à tous les workers
+d'exécuter la tâche sans se bloquer ni traiter deux fois le même abonnement.
+"""
+import asyncio
+import logging
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app.bandwidth import invalidate_entitlement
+from app.config import settings
+from app.events import SUBSCRIPTION_EXPIRED, emit, subscribe
+from app.metrics import Counter
+from app.plans import plan_catalogue
+from app.postgres_connect import AsyncSessionLocal
+from app.utils import send_subscription_expired_email
+
+logger = logging.getLogger(__name__)
+
+expired_subscriptions = Counter("subscriptions_expired_total", "Abonnements passés à l'état expiré")
+
+_EXPIRE_BATCH = text("""
+    WITH due AS (
+        SELECT id FROM subscriptions
+        WHERE status = 'active' AND end_date IS NOT NULL AND end_date < :now
+        ORDER BY end_date
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE subscriptions AS s
+    SET status = 'expired', updated_at = :now
+    FROM due, users AS u
+    WHERE s.id = due.id AND u.id = s.user_id
+    RETURNING s.id, s.user_id, s.plan_id, s.end_date, u.email
+""")
+
+_email_slots = asyncio.Semaphore(settings.subscription_expiry_email_concurrency)
+
+
+async def expire_subscriptions():
+    total = 0
+    while True:
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(_EXPIRE_BATCH, {
+                "now": datetime.utcnow(),
+                "batch_size": settings.subscription_expiry_batch_size,
+            })).all()
+            await session.commit()
+
+        # Après le commit seulement : un rollback ne doit ni invalider ni notifier
+        for row in rows:
+            invalidate_entitlement(row.user_id)
+            emit(
+                SUBSCRIPTION_EXPIRED,
+                user_id=row.user_id,
+                subscription_id=row.id,
+                plan_id=row.plan_id,
+                end_date=row.end_date,
+                email=row.email,
+            )
+        total += len(rows)
+        expired_subscriptions.inc(len(rows))
+        if len(rows) < settings.subscription_expiry_batch_size:
+            break
+    if total:
+        logger.info("%d abonnement(s) expiré(s)", total)
+
+
+@subscribe(SUBSCRIPTION_EXPIRED)
+async def notify_expired_subscription(user_id, subscription_id, plan_id, end_date, email):
+    if not settings.subscription_expiry_emails:
+        return
+    plan = await plan_catalogue.get(plan_id)
+    async with _email_slots:
+        await send_subscription_expired_email(email, plan.name if plan else "Inconnu", end_date)
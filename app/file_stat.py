@@ -0,0 +1,97 @@
+"""Stat groupé : métadonnées de nombreux fichiers en deux requêtes Mongo.
+
+Les dossiers demandés sont résolus par un seul $in sur leurs chemins, puis tous
+les fichiers par un seul find dont le $or regroupe les noms par dossier (index
+parent_file_name_live) et les identifiants directs (index _id).
+"""
+from typing import Dict, List, Optional, Tuple, get_args
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+
+from app.directories import normalize_path
+from app.models.file import Directory, File
+from app.mongo_connect import get_collection
+from app.schemas.file import FileStatRef, StatField
+
+MAX_STAT_ENTRIES = 1000
+STAT_FIELDS = get_args(StatField)
+
+
+def _echo(ref: FileStatRef) -> dict:
+    if ref.id is not None:
+        return {"id": ref.id}
+    return {"directory": ref.directory, "filename": ref.filename}
+
+
+def _parse_id(value: str) -> Optional[ObjectId]:
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+def _normalize(directory: str) -> Optional[str]:
+    try:
+        return normalize_path(directory)
+    except HTTPException:
+        return None
+
+
+async def stat_files(owner_id: str, refs: List[FileStatRef], fields: Optional[List[str]] = None) -> List[dict]:
+    """Une entrée par référence, dans l'ordre ; `found` à False si le fichier n'existe pas."""
+    fields = list(dict.fromkeys(fields)) if fields else list(STAT_FIELDS)
+    file_ids = {ref.id: _parse_id(ref.id) for ref in refs if ref.id is not None}
+    paths = {ref.directory: _normalize(ref.directory) for ref in refs if ref.id is None}
+
+    directories: Dict[str, ObjectId] = {}
+    wanted_paths = list({path for path in paths.values() if path})
+    if wanted_paths:
+        directories = {
+            doc["path"]: doc["_id"]
+            async for doc in get_collection(Directory.Settings.name).find(
+                {"owner_id": owner_id, "path": {"$in": wanted_paths}}, {"path": 1}
+            )
+        }
+
+    names_by_directory: Dict[ObjectId, set] = {}
+    for ref in refs:
+        if ref.id is None and directories.get(paths[ref.directory]):
+            names_by_directory.setdefault(directories[paths[ref.directory]], set()).add(ref.filename)
+
+    clauses = [
+        {"parent.$id": directory_id, "file_name": {"$in": list(names)}}
+        for directory_id, names in names_by_directory.items()
+    ]
+    valid_ids = list({file_id for file_id in file_ids.values() if file_id})
+    if valid_ids:
+        clauses.append({"_id": {"$in": valid_ids}})
+
+    by_id: Dict[ObjectId, dict] = {}
+    by_name: Dict[Tuple[ObjectId, str], dict] = {}
+    if clauses:
+        projection = {field: 1 for field in fields}
+        projection.update({"file_name": 1, "ancestors": {"$slice": -1}})
+        async for doc in get_collection(File.Settings.name).find(
+            {"owner_id": owner_id, "trashed": False, "$or": clauses}, projection
+        ):
+            by_id[doc["_id"]] = doc
+            if doc.get("ancestors"):
+                by_name[(doc["ancestors"][-1], doc["file_name"])] = doc
+
+    items = []
+    for ref in refs:
+        if ref.id is not None:
+            doc = by_id.get(file_ids[ref.id])
+        else:
+            directory_id = directories.get(paths[ref.directory])
+            doc = by_name.get((directory_id, ref.filename)) if directory_id else None
+
+        item = {**_echo(ref), "found": doc is not None}
+        if doc is not None:
+            # Réponse clairsemée : seuls les champs demandés, même s'ils sont nuls
+            item.update({field: doc.get(field) for field in fields})
+            item["id"] = str(doc["_id"])
+        items.append(item)
+    return items
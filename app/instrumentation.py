@@ -0,0 +1,158 @@
+"""Instrumentation exposée sur /metrics : requêtes HTTP, requêtes de base et boucle asyncio.
+
+Le coût reste de l'ordre de quelques microsecondes par événement : un
+perf_counter, une recherche de dictionnaire et une incrémentation par
+observation, sans verrou côté asyncio. Le label de route est le gabarit
+FastAPI (`/files/{file_id}`) et non le chemin brut, pour borner la cardinalité.
+"""
+import asyncio
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from pymongo.monitoring import CommandListener
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.admission import classify
+from app.config import settings
+from app.metrics import Gauge, Histogram, exponential_buckets
+
+SIZE_BUCKETS = exponential_buckets(1024, 4, 12)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Durée des requêtes HTTP", ("method", "route", "status")
+)
+requests_in_flight = Gauge("http_requests_in_flight", "Requêtes HTTP en cours de traitement")
+upload_size = Histogram("http_upload_size_bytes", "Taille des corps de requête d'upload", buckets=SIZE_BUCKETS)
+download_size = Histogram("http_download_size_bytes", "Taille des réponses de téléchargement", buckets=SIZE_BUCKETS)
+query_duration = Histogram(
+    "db_query_duration_seconds", "Durée des requêtes de base de données", ("db", "operation"), buckets=QUERY_BUCKETS
+)
+event_loop_lag = Gauge("event_loop_lag_seconds", "Dernier retard mesuré de la boucle asyncio")
+event_loop_lag_histogram = Histogram(
+    "event_loop_lag_distribution_seconds", "Retards de la boucle asyncio", buckets=LAG_BUCKETS
+)
+
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "CREATE", "ALTER", "DROP"}
+
+_request_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+
+
+def route_template(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def current_route() -> Optional[str]:
+    """« MÉTHODE /gabarit » de la requête en cours, None hors requête (tâches de fond)."""
+    scope = _request_scope.get()
+    return f"{scope['method']} {route_template(scope)}" if scope is not None else None
+
+
+class MetricsMiddleware:
+    """Middleware ASGI pur : latence par route et statut, requêtes en vol, volumes échangés."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        pool = classify(scope["method"], scope["path"])
+        state = {"status": 500, "received": 0, "sent": 0}
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                state["received"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["sent"] += len(message.get("body", b""))
+            await send(message)
+
+        requests_in_flight.inc()
+        started = time.perf_counter()
+        token = _request_scope.set(scope)
+        try:
+            await self.app(scope, counting_receive if pool == "upload" else receive, counting_send)
+        finally:
+            _request_scope.reset(token)
+            requests_in_flight.dec()
+            request_duration.observe(
+                time.perf_counter() - started,
+                method=scope["method"], route=route_template(scope), status=state["status"]
+            )
+            if pool == "upload":
+                upload_size.observe(state["received"])
+            elif pool == "download" and state["status"] < 300:
+                download_size.observe(state["sent"])
+
+
+def _sql_operation(statement: str) -> str:
+    keyword = statement.lstrip()[:8].split(None, 1)
+    operation = keyword[0].upper() if keyword else ""
+    return operation if operation in SQL_OPERATIONS else "OTHER"
+
+
+def instrument_queries(engine: AsyncEngine, label: str = "postgres"):
+    """Chronomètre chaque requête SQL ; la pile dans conn.info supporte les exécutions imbriquées."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        query_duration.observe(time.perf_counter() - started, db=label, operation=_sql_operation(statement))
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _on_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            started = connection.info["query_started"].pop()
+            query_duration.observe(
+                time.perf_counter() - started,
+                db=label, operation=_sql_operation(exception_context.statement or "")
+            )
+
+
+class MongoCommandListener(CommandListener):
+    """pymongo fournit la durée de chaque commande ; ses threads d'E/S imposent le verrou."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        with self._lock:
+            query_duration.observe(event.duration_micros / 1e6, db="mongo", operation=event.command_name)
+
+    def failed(self, event):
+        with self._lock:
+            query_duration.observe(event.duration_micros / 1e6, db="mongo", operation=event.command_name)
+
+
+async def monitor_event_loop_lag():
+    """Retard d'un sleep sur sa durée demandée : temps passé par la boucle sur du code bloquant."""
+    loop = asyncio.get_running_loop()
+    interval = settings.event_loop_lag_interval_seconds
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        event_loop_lag.set(lag)
+        event_loop_lag_histogram.observe(lag)
@@ -0,0 +1,153 @@
+"""Journal des modifications par utilisateur, ordonné par un numéro de séquence monotone."""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from app.config import settings
+from app.models.change import Change, ChangeEvent, ChangeKind
+from app.mongo_connect import get_collection
+
+COUNTERS_COLLECTION = "change_counters"
+# Un trou de séquence plus récent que ce délai correspond à une écriture encore en cours
+GAP_GRACE_SECONDS = 5
+
+_waiters: Dict[str, asyncio.Event] = {}
+
+
+async def _next_seq(owner_id: str) -> int:
+    counter = await get_collection(COUNTERS_COLLECTION).find_one_and_update(
+        {"_id": owner_id},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return counter["seq"]
+
+
+def _notify(owner_id: str):
+    event = _waiters.pop(owner_id, None)
+    if event:
+        event.set()
+
+
+async def record_change(
+    owner_id: str,
+    event: ChangeEvent,
+    kind: ChangeKind,
+    entity_id,
+    path: str,
+    old_path: Optional[str] = None,
+    file_size_bytes: Optional[int] = None,
+):
+    """Ajoute une entrée au journal juste après la mutation et réveille les long-polls."""
+    change = Change(
+        owner_id=owner_id,
+        seq=await _next_seq(owner_id),
+        event=event,
+        kind=kind,
+        entity_id=str(entity_id),
+        path=path,
+        old_path=old_path,
+        file_size_bytes=file_size_bytes,
+    )
+    await change.insert()
+    _notify(owner_id)
+
+
+async def record_changes(owner_id: str, entries: List[dict]):
+    """Variante groupée de record_change : un bloc de séquences alloué en un seul $inc."""
+    if not entries:
+        return
+    counter = await get_collection(COUNTERS_COLLECTION).find_one_and_update(
+        {"_id": owner_id},
+        {"$inc": {"seq": len(entries)}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    first_seq = counter["seq"] - len(entries) + 1
+    await Change.insert_many([
+        Change(owner_id=owner_id, seq=first_seq + offset, **{**entry, "entity_id": str(entry["entity_id"])})
+        for offset, entry in enumerate(entries)
+    ])
+    _notify(owner_id)
+
+
+async def _read_changes(owner_id: str, cursor: int, limit: int) -> dict:
+    counter = await get_collection(COUNTERS_COLLECTION).find_one({"_id": owner_id}) or {}
+    if cursor < counter.get("purged_seq", 0):
+        # Les entrées suivant ce curseur ont été purgées : resynchronisation complète
+        return {"changes": [], "cursor": counter.get("seq", 0), "has_more": False, "reset": True}
+
+    rows = await Change.find(
+        {"owner_id": owner_id, "seq": {"$gt": cursor}}
+    ).sort("seq").limit(limit + 1).to_list()
+
+    # On s'arrête avant un trou récent : une séquence allouée mais pas encore insérée
+    # ne doit pas être sautée. Les trous anciens (compaction, écriture échouée) sont ignorés.
+    grace_limit = datetime.utcnow() - timedelta(seconds=GAP_GRACE_SECONDS)
+    changes = []
+    expected = cursor + 1
+    for row in rows[:limit]:
+        if row.seq != expected and row.created_at > grace_limit:
+            break
+        changes.append(row)
+        expected = row.seq + 1
+
+    return {
+        "changes": changes,
+        "cursor": changes[-1].seq if changes else cursor,
+        "has_more": len(rows) > len(changes),
+        "reset": False,
+    }
+
+
+async def list_changes(owner_id: str, cursor: int = 0, limit: int = 100, wait: float = 0) -> dict:
+    """Page de changements après `cursor` ; attend jusqu'à `wait` secondes si elle est vide."""
+    deadline = time.monotonic() + min(wait, settings.changes_long_poll_max_seconds)
+    while True:
+        # Enregistré avant la lecture pour ne manquer aucune notification
+        event = _waiters.setdefault(owner_id, asyncio.Event())
+        page = await _read_changes(owner_id, cursor, limit)
+        remaining = deadline - time.monotonic()
+        if page["changes"] or page["reset"] or remaining <= 0:
+            return page
+        # Réveil immédiat pour ce worker ; relecture périodique pour les écritures des autres
+        try:
+            await asyncio.wait_for(event.wait(), timeout=min(remaining, settings.changes_poll_interval_seconds))
+        except asyncio.TimeoutError:
+            pass
+
+
+async def compact_journal():
+    """Rétention puis compaction : seule la dernière entrée ancienne de chaque élément est gardée."""
+    changes = get_collection(Change.Settings.name)
+    counters = get_collection(COUNTERS_COLLECTION)
+
+    retention_cutoff = datetime.utcnow() - timedelta(days=settings.change_journal_retention_days)
+    purged = await changes.aggregate([
+        {"$match": {"created_at": {"$lt": retention_cutoff}}},
+        {"$group": {"_id": "$owner_id", "max_seq": {"$max": "$seq"}}},
+    ]).to_list(length=None)
+    for row in purged:
+        await counters.update_one({"_id": row["_id"]}, {"$max": {"purged_seq": row["max_seq"]}})
+    await changes.delete_many({"created_at": {"$lt": retention_cutoff}})
+
+    compact_cutoff = datetime.utcnow() - timedelta(hours=settings.change_journal_compact_after_hours)
+    superseded = changes.aggregate([
+        {"$match": {"created_at": {"$lt": compact_cutoff}}},
+        {"$sort": {"seq": 1}},
+        {"$group": {"_id": {"owner_id": "$owner_id", "entity_id": "$entity_id"}, "ids": {"$push": "$_id"}}},
+        {"$match": {"ids.1": {"$exists": True}}},
+        {"$project": {"ids": {"$slice": ["$ids", {"$subtract": [{"$size": "$ids"}, 1]}]}}},
+    ], allowDiskUse=True)
+    batch = []
+    async for row in superseded:
+        batch.extend(row["ids"])
+        if len(batch) >= settings.change_journal_compact_batch_size:
+            await changes.delete_many({"_id": {"$in": batch}})
+            batch = []
+    if batch:
+        await changes.delete_many({"_id": {"$in": batch}})
@@ -1,11 +1,28 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from rich.console import Console
-from app.mongo_connect import connect_database, disconnect_from_database
+from app.mongo_connect import connect_database, disconnect_from_database, warm_up_pool as warm_up_mongo_pool
+from app.postgres_connect import check_replica_lag, read_engine, warm_up_pool as warm_up_postgres_pool
+from app.config import settings
+from app.access import access_buffer
+from app.admission import AdmissionMiddleware
+from app.analytics import rollup_storage_analytics
+from app.expiry import expire_subscriptions
+from app.instrumentation import MetricsMiddleware, monitor_event_loop_lag
+from app.journal import compact_journal
+from app.metrics import registry
+from app.plans import listen_for_plan_changes, plan_catalogue
+from app.tasks import spawn, start_periodic, stop_background_tasks
+from app.tiering import tier_cold_files
+from app.tracing import TracingMiddleware, configure_access_log, trace_exporter
+from app.trash import purge_trash
+from app.versions import prune_versions
 
-from app.routers import user, auth, storage, subscription, payment
+from app.routers import user, auth, storage, subscription, payment, share, admin
 console = Console()
 
 
@@ -13,13 +30,37 @@ console = Console()
 async def lifespan(_app: FastAPI):
 
     console.print(":banana: [cyan underline]Drive Storage Api is starting ...[/]")
+    configure_access_log()
     await connect_database()
+    await asyncio.gather(warm_up_mongo_pool(), warm_up_postgres_pool())
+    await plan_catalogue.reload()
+    spawn("plans-listener", listen_for_plan_changes)
+    spawn("event-loop-lag", monitor_event_loop_lag)
+    start_periodic("plans-refresh", plan_catalogue.reload, settings.plans_refresh_interval_seconds)
+    start_periodic("subscription-expiry", expire_subscriptions, settings.subscription_expiry_interval_seconds)
+    start_periodic("journal-compaction", compact_journal, settings.change_journal_maintenance_interval_seconds)
+    start_periodic("trash-purge", purge_trash, settings.trash_purge_interval_seconds)
+    start_periodic("version-prune", prune_versions, settings.version_prune_interval_seconds)
+    start_periodic("analytics-rollup", rollup_storage_analytics, settings.analytics_rollup_interval_seconds)
+    start_periodic("access-flush", access_buffer.flush, settings.access_flush_interval_seconds)
+    start_periodic("tiering", tier_cold_files, settings.tiering_interval_seconds)
+    if read_engine is not None:
+        start_periodic("replica-lag", check_replica_lag, settings.postgres_replica_check_interval_seconds)
+    if trace_exporter.path:
+        start_periodic("trace-export", trace_exporter.flush, settings.tracing_export_interval_seconds)
     yield
     console.print(":mango: [bold red underline]Drive Storage Api shutting down ...[/]")
+    await stop_background_tasks()
+    # Derniers accès encore en mémoire
+    await access_buffer.flush()
+    await trace_exporter.flush()
     await disconnect_from_database()
 
 app = FastAPI(lifespan=lifespan)
 
+# Ajouté avant CORS pour que les réponses 503 portent aussi les en-têtes CORS
+app.add_middleware(AdmissionMiddleware)
+
 origins = ["*"]
 
 app.add_middleware(
@@ -30,6 +71,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(TracingMiddleware)
+
+# Le plus externe : la latence mesurée inclut l'attente d'admission et les 503
+app.add_middleware(MetricsMiddleware)
+
 # Ajout de la route racine
 @app.get("/")
 async def root():
@@ -46,10 +92,16 @@ async def root():
         ]
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 # Inclusion des routeurs
 app.include_router(auth.router)
 app.include_router(user.router)
 app.include_router(storage.router)
+app.include_router(share.router)
 app.include_router(subscription.router)
 app.include_router(payment.router)
+app.include_router(admin.router)
 
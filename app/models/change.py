@@ -0,0 +1,45 @@
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+
+from beanie import Document
+from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+
+
+class ChangeEvent(str, Enum):
+    CREATE = "create"
+    RENAME = "rename"
+    REPLACE = "replace"
+    DELETE = "delete"
+    MOVE = "move"
+
+
+class ChangeKind(str, Enum):
+    FILE = "file"
+    DIRECTORY = "directory"
+
+
+# =========================
+# Journal des modifications (synchronisation incrémentale)
+# =========================
+class Change(Document):
+    owner_id: str
+    seq: int
+    event: ChangeEvent
+    kind: ChangeKind
+    entity_id: str
+    path: str
+    old_path: Optional[str] = None
+    file_size_bytes: Optional[int] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "changes"
+        indexes = [
+            IndexModel([("owner_id", ASCENDING), ("seq", ASCENDING)], name="owner_seq_unique", unique=True),
+            IndexModel(
+                [("created_at", ASCENDING), ("owner_id", ASCENDING), ("entity_id", ASCENDING)],
+                name="created_at_entity",
+            ),
+        ]
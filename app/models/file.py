@@ -1,7 +1,10 @@
+import os
+import re
 from datetime import datetime
-from beanie import Document, Link
-from pydantic import Field
-from typing import Optional
+from beanie import Document, Link, PydanticObjectId
+from pydantic import Field, model_validator
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from typing import List, Optional
 from bson import ObjectId
 
 # =========================
@@ -25,6 +28,30 @@ class PyObjectId(ObjectId):
         return {"type": "string"}
 
 
+# =========================
+# Champs dérivés pour la recherche
+# =========================
+_TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Découpe un nom en jetons alphanumériques minuscules, sans doublons."""
+    return list(dict.fromkeys(_TOKEN_PATTERN.findall(text.lower())))
+
+
+def search_fields(file_name: str) -> dict:
+    name_lower = file_name.lower()
+    return {
+        "name_lower": name_lower,
+        "extension": os.path.splitext(name_lower)[1].lstrip("."),
+        "search_tokens": tokenize(name_lower),
+    }
+
+
+LIVE_FILES = {"trashed": False}
+TRASHED_FILES = {"trashed": True}
+
+
 # =========================
 # Directory Document
 # =========================
@@ -33,9 +60,34 @@ class Directory(Document):
     owner_id: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
     owner: str
+    # Chemin matérialisé ("/photos/2024") et ancêtres de la racine vers le parent
+    path: str = ""
+    parent_id: Optional[PydanticObjectId] = None
+    ancestors: List[PydanticObjectId] = Field(default_factory=list)
+    depth: int = 0
+    # Agrégats des fichiers directs, maintenus par $inc à chaque mutation
+    file_count: int = 0
+    total_bytes: int = 0
+    last_modified: Optional[datetime] = None
 
     class Settings:
         name = "directories"
+        indexes = [
+            IndexModel(
+                [("owner_id", ASCENDING), ("path", ASCENDING)],
+                name="owner_path_unique",
+                unique=True,
+                partialFilterExpression={"path": {"$type": "string"}},
+            ),
+            IndexModel(
+                [("owner_id", ASCENDING), ("parent_id", ASCENDING), ("dir_name", ASCENDING)],
+                name="owner_parent_name",
+            ),
+            IndexModel(
+                [("owner_id", ASCENDING), ("ancestors", ASCENDING)],
+                name="owner_ancestors",
+            ),
+        ]
 
 
 # =========================
@@ -51,9 +103,130 @@ class File(Document):
     parent: Optional[Link[Directory]] = None
     gridfs_id: PyObjectId = Field(default_factory=PyObjectId)  # ✅ généré automatiquement si non fourni
     file_size_bytes: int = Field(default=0)
+    # Dossiers contenant le fichier, de la racine jusqu'au parent direct
+    ancestors: List[PydanticObjectId] = Field(default_factory=list)
+    # Champs de recherche, recalculés à partir de file_name
+    name_lower: str = ""
+    extension: str = ""
+    search_tokens: List[str] = Field(default_factory=list)
+    # Corbeille : suppression logique, purge asynchrone après purge_at
+    trashed: bool = False
+    trashed_at: Optional[datetime] = None
+    purge_at: Optional[datetime] = None
+    # Version courante : gridfs_id, file_size_bytes et digest pointent vers elle
+    version: int = 1
+    digest: Optional[str] = None
+    updated_at: Optional[datetime] = None
+    # Stockage hiérarchisé : "hot" (GridFS) ou "cold" (backend compressé)
+    last_accessed_at: datetime = Field(default_factory=datetime.utcnow)
+    storage_tier: str = "hot"
+
+    @model_validator(mode="before")
+    @classmethod
+    def _derive_search_fields(cls, data):
+        if isinstance(data, dict) and data.get("file_name"):
+            data = {**data, **search_fields(data["file_name"])}
+        return data
 
     class Settings:
         name = "files"
+        indexes = [
+            # Index partiels : la corbeille n'alourdit ni les listings ni la recherche
+            IndexModel(
+                [("parent.$id", ASCENDING), ("file_name", ASCENDING)],
+                name="parent_file_name_live",
+                partialFilterExpression=LIVE_FILES,
+            ),
+            IndexModel(
+                [("owner_id", ASCENDING), ("ancestors", ASCENDING)],
+                name="owner_ancestors",
+            ),
+            IndexModel([("owner_id", ASCENDING), ("_id", DESCENDING)], name="owner_recent_live",
+                       partialFilterExpression=LIVE_FILES),
+            IndexModel(
+                [("owner_id", ASCENDING), ("search_tokens", ASCENDING)],
+                name="owner_search_tokens_live",
+                partialFilterExpression=LIVE_FILES,
+            ),
+            IndexModel(
+                [("owner_id", ASCENDING), ("extension", ASCENDING), ("_id", DESCENDING)],
+                name="owner_extension_live",
+                partialFilterExpression=LIVE_FILES,
+            ),
+            IndexModel(
+                [("owner_id", ASCENDING), ("content_type", ASCENDING), ("_id", DESCENDING)],
+                name="owner_content_type_live",
+                partialFilterExpression=LIVE_FILES,
+            ),
+            IndexModel(
+                [("owner_id", ASCENDING), ("created_at", DESCENDING)],
+                name="owner_created_at_live",
+                partialFilterExpression=LIVE_FILES,
+            ),
+            IndexModel(
+                [("owner_id", ASCENDING), ("file_size_bytes", ASCENDING)],
+                name="owner_size_live",
+                partialFilterExpression=LIVE_FILES,
+            ),
+            IndexModel(
+                [("owner_id", ASCENDING), ("trashed_at", DESCENDING)],
+                name="owner_trash",
+                partialFilterExpression=TRASHED_FILES,
+            ),
+            IndexModel([("purge_at", ASCENDING)], name="trash_purge", partialFilterExpression=TRASHED_FILES),
+            IndexModel([("gridfs_id", ASCENDING)], name="gridfs_id"),
+            # Candidats au passage en stockage froid
+            IndexModel([("last_accessed_at", ASCENDING)], name="tiering_hot",
+                       partialFilterExpression={"storage_tier": "hot"}),
+        ]
 
     class Config:
         json_encoders = {ObjectId: str}  # ✅ conversion automatique pour JSON
+
+
+# =========================
+# FileVersion Document
+# =========================
+class FileVersion(Document):
+    file_id: PydanticObjectId
+    owner_id: str
+    version: int
+    gridfs_id: PyObjectId
+    file_size_bytes: int = 0
+    content_type: str
+    digest: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Au-delà de la rétention du plan : à supprimer par le purgeur de versions
+    prunable: bool = False
+
+    class Settings:
+        name = "file_versions"
+        indexes = [
+            IndexModel(
+                [("file_id", ASCENDING), ("version", DESCENDING)],
+                name="file_version_unique",
+                unique=True,
+            ),
+            IndexModel([("file_id", ASCENDING), ("digest", ASCENDING)], name="file_digest"),
+            IndexModel([("gridfs_id", ASCENDING)], name="gridfs_id"),
+            IndexModel([("prunable", ASCENDING)], name="prunable", partialFilterExpression={"prunable": True}),
+        ]
+
+    class Config:
+        json_encoders = {ObjectId: str}
+
+
+# =========================
+# FileStats Document
+# =========================
+class FileStats(Document):
+    """Compteurs d'accès par fichier (_id = id du File), alimentés par le tampon write-behind."""
+    owner_id: str
+    download_count: int = 0
+    last_opened_at: Optional[datetime] = None
+
+    class Settings:
+        name = "file_stats"
+        indexes = [
+            IndexModel([("owner_id", ASCENDING), ("download_count", DESCENDING)], name="owner_hot_files"),
+        ]
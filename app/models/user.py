@@ -9,6 +9,8 @@ from sqlalchemy import (
     Integer,
     Float,
     ForeignKey,
+    Index,
+    text,
 )
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
@@ -53,6 +55,7 @@ class User(Base):
     name: Mapped[str] = mapped_column(String, nullable=False)
     password: Mapped[str] = mapped_column(String, nullable=False)
     is_active: Mapped[bool] = mapped_column(Boolean, default=False)
+    is_admin: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     storage_quota_mb: Mapped[int] = mapped_column(Integer, default=300, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
 
@@ -74,6 +77,7 @@ class Plan(Base):
     wave_payment_link_monthly: Mapped[str] = mapped_column(String, nullable=True)
     wave_payment_link_yearly: Mapped[str] = mapped_column(String, nullable=True)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+    max_file_versions: Mapped[int] = mapped_column(Integer, nullable=False, default=10)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
     
 
@@ -110,6 +114,25 @@ class Subscription(Base):
     # Optionnel : relation vers User si tu veux
     user = relationship("User", backref="subscriptions")
 
+    __table_args__ = (
+        # Abonnement actif le plus récent d'un utilisateur (get_active_plan, statut, quota)
+        Index("ix_subscriptions_user_status_created", "user_id", "status", text("created_at DESC")),
+        # Rend l'INSERT ... ON CONFLICT de confirm_wave_payment idempotent
+        Index("uq_subscriptions_wave_transaction_id", "wave_transaction_id", unique=True),
+        Index(
+            "uq_subscriptions_one_active_per_user",
+            "user_id",
+            unique=True,
+            postgresql_where=text("status = 'active'"),
+        ),
+        # Abonnements actifs à échéance, parcourus par l'expiration planifiée (app.expiry)
+        Index(
+            "ix_subscriptions_active_end_date",
+            "end_date",
+            postgresql_where=text("status = 'active' AND end_date IS NOT NULL"),
+        ),
+    )
+
 class StorageUsage(Base):
     __tablename__ = "storage_usage"
 
@@ -1,7 +1,16 @@
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
 from beanie import init_beanie
-from app.models.file import Directory, File
+from gridfs.errors import NoFile
+from app.models.file import Directory, File, FileStats, FileVersion
+from app.models.change import Change
 from app.config import settings
+from app.instrumentation import MongoCommandListener
+from app.metrics import Counter
+from app.pool_metrics import MongoPoolListener
+from app.slow_queries import SlowCommandListener
+from app.tracing import span
+
+gridfs_bytes = Counter("gridfs_bytes_total", "Octets lus et écrits dans GridFS", ("direction",))
 
 client: AsyncIOMotorClient = None
 db = None
@@ -9,15 +18,27 @@ grid_fs_bucket: AsyncIOMotorGridFSBucket = None
 
 async def connect_database():
     global client, db, grid_fs_bucket
-    client = AsyncIOMotorClient(settings.mongo_database_url)
+    client = AsyncIOMotorClient(
+        settings.mongo_database_url,
+        maxPoolSize=settings.mongo_max_pool_size,
+        minPoolSize=settings.mongo_min_pool_size,
+        maxIdleTimeMS=settings.mongo_max_idle_time_ms,
+        waitQueueTimeoutMS=settings.mongo_wait_queue_timeout_ms,
+        event_listeners=[MongoPoolListener(), MongoCommandListener(), SlowCommandListener()],
+    )
     db = client.get_default_database()
     grid_fs_bucket = AsyncIOMotorGridFSBucket(db)
 
     await init_beanie(
         database=db,
-        document_models=[Directory, File]
+        document_models=[Directory, File, FileVersion, FileStats, Change],
+        # Aucun index supprimé au démarrage : voir drop_replaced_indexes dans scripts/migrate_mongo.py
     )
 
+async def warm_up_pool():
+    """Ping : sélection du serveur et première connexion ; pymongo complète ensuite jusqu'à minPoolSize."""
+    await client.admin.command("ping")
+
 async def disconnect_from_database():
     global client
     if client:
@@ -25,15 +46,58 @@ async def disconnect_from_database():
 
 async def iter_chunks(file_id, chunk_size: int = 1024):
     stream = await grid_fs_bucket.open_download_stream(file_id)
-    while True:
-        chunk = await stream.read(chunk_size)
+    async for chunk in iter_stream(stream, chunk_size):
+        yield chunk
+
+async def iter_stream(stream, chunk_size: int = 1024, start: int = 0, end: int | None = None):
+    """Lit un flux GridFS déjà ouvert, éventuellement restreint à [start, end)."""
+    if start:
+        stream.seek(start)
+    remaining = (end - start) if end is not None else None
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        with span("gridfs_read"):
+            chunk = await stream.read(size)
         if not chunk:
             break
+        if remaining is not None:
+            remaining -= len(chunk)
+        gridfs_bytes.inc(len(chunk), direction="read")
         yield chunk
 
+def record_gridfs_write(nbytes: int):
+    gridfs_bytes.inc(nbytes, direction="write")
+
+async def delete_blobs(gridfs_ids):
+    """Supprime des blobs GridFS en ignorant ceux déjà supprimés."""
+    gridfs_ids = list(gridfs_ids)
+    for gridfs_id in gridfs_ids:
+        try:
+            await grid_fs_bucket.delete(gridfs_id)
+        except NoFile:
+            pass
+    if gridfs_ids:
+        from app.tiering import delete_cold_blobs
+
+        # Signatures de blocs des uploads différentiels (app.delta) et copies froides (app.tiering)
+        await db["block_signatures"].delete_many({"_id": {"$in": gridfs_ids}})
+        await delete_cold_blobs(gridfs_ids)
+
 def get_gridfs_bucket() -> AsyncIOMotorGridFSBucket:
     """Retourne l'instance du GridFS bucket."""
     global grid_fs_bucket
     if grid_fs_bucket is None:
         raise RuntimeError("GridFS bucket non initialisé. Vérifiez la connexion à la base de données.")
     return grid_fs_bucket
+
+def get_collection(name: str):
+    """Retourne une collection Motor brute (pipelines d'update, bulk_write)."""
+    if db is None:
+        raise RuntimeError("Base MongoDB non initialisée. Vérifiez la connexion à la base de données.")
+    return db[name]
+
+def get_database():
+    """Retourne la base Motor (commandes serveur comme filemd5)."""
+    if db is None:
+        raise RuntimeError("Base MongoDB non initialisée. Vérifiez la connexion à la base de données.")
+    return db
@@ -8,9 +8,10 @@ from typing import Annotated
 from datetime import datetime, timedelta
 
 from app.config import settings
-from app.postgres_connect import get_db_session
+from app.postgres_connect import get_read_db_session
 from app.models.user import User
 from app.schemas.token import TokenData
+from app.tracing import set_attribute, span
 
 oauth2_schema = OAuth2PasswordBearer(tokenUrl="auth/login")
 
@@ -37,7 +38,7 @@ def verify_token(token: str):
 # Rendre la fonction de dépendance asynchrone
 async def get_current_user(
     token: Annotated[str, Depends(oauth2_schema)],
-    db: Annotated[AsyncSession, Depends(get_db_session)] # Utiliser la dépendance asynchrone
+    db: Annotated[AsyncSession, Depends(get_read_db_session)] # Lecture seule : réplica si disponible
 ) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -45,18 +46,30 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"}
     )
 
-    payload = verify_token(token)
+    with span("jwt"):
+        payload = verify_token(token)
 
     try:
         token_data = TokenData(**payload)
         
         # Exécuter la requête de manière asynchrone
-        result = await db.execute(select(User).where(User.id == token_data.user_id))
+        with span("pg_user"):
+            result = await db.execute(select(User).where(User.id == token_data.user_id))
         user = result.scalars().first()
 
         if user is None:
             raise credentials_exception
+        set_attribute("enduser.id", str(user.id))
         return user
     except Exception:
         raise credentials_exception
-    
\ No newline at end of file
+
+async def get_current_admin(
+    current_user: Annotated[User, Depends(get_current_user)]
+) -> User:
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Accès refusé. Droits administrateur requis."
+        )
+    return current_user
@@ -0,0 +1,126 @@
+"""Catalogue des plans en mémoire, rechargé sur notification PostgreSQL.
+
+Les plans changent rarement : ils sont chargés au démarrage, indexés par id et
+par type, et le corps JSON de GET /subscriptions/plans est pré-sérialisé avec
+son ETag. Toute modification publie un NOTIFY sur `plans_changed` dans la même
+transaction ; chaque worker l'écoute sur une connexion asyncpg dédiée et
+recharge. Un rechargement périodique couvre les notifications manquées.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from typing import Dict, List, Optional, Union
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.config import settings
+from app.metrics import cache_requests
+from app.models.user import Plan, PlanType
+from app.postgres_connect import AsyncSessionLocal
+from app.schemas.subscription import PlanOut
+from app.tasks import spawn
+
+logger = logging.getLogger(__name__)
+
+PLANS_CHANNEL = "plans_changed"
+
+
+async def notify_plans_changed(session: AsyncSession):
+    """NOTIFY transactionnel : émis au commit de `session`, jamais en cas de rollback."""
+    await session.execute(text("SELECT pg_notify(:channel, '')"), {"channel": PLANS_CHANNEL})
+
+
+class PlanCatalogue:
+    def __init__(self):
+        self._by_id: Dict[uuid.UUID, PlanOut] = {}
+        self._by_type: Dict[str, PlanOut] = {}
+        self._active: List[PlanOut] = []
+        self.body = b"[]"
+        self.etag = '""'
+        self._lock = asyncio.Lock()
+        self._last_miss_reload = 0.0
+
+    def _build(self, plans: List[PlanOut]):
+        self._by_id = {plan.id: plan for plan in plans}
+        # Plusieurs plans d'un même type : le plan actif le plus ancien fait référence
+        self._by_type = {}
+        for plan in sorted(plans, key=lambda p: (not p.is_active, p.created_at)):
+            self._by_type.setdefault(plan.plan_type, plan)
+        self._active = sorted((p for p in plans if p.is_active), key=lambda p: p.storage_limit_mb)
+        self.body = json.dumps(
+            [plan.model_dump(mode="json") for plan in self._active], separators=(",", ":")
+        ).encode()
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+
+    async def reload(self):
+        async with self._lock:
+            async with AsyncSessionLocal() as session:
+                plans = (await session.execute(select(Plan))).scalars().all()
+            self._build([PlanOut.model_validate(plan) for plan in plans])
+        logger.info("Catalogue des plans chargé : %d plan(s)", len(self._by_id))
+
+    def active(self) -> List[PlanOut]:
+        return self._active
+
+    def by_type(self, plan_type: Union[PlanType, str]) -> Optional[PlanOut]:
+        return self._by_type.get(PlanType(plan_type))
+
+    def ids_for_type(self, plan_type: Union[PlanType, str]) -> List[uuid.UUID]:
+        """Tous les plans d'un type, actifs ou non (filtres SQL sans jointure sur plans)."""
+        plan_type = PlanType(plan_type)
+        return [plan.id for plan in self._by_id.values() if plan.plan_type == plan_type]
+
+    async def get(self, plan_id: Union[uuid.UUID, str, None]) -> Optional[PlanOut]:
+        """Plan par id ; un id inconnu déclenche au plus un rechargement par seconde (plan tout juste créé)."""
+        try:
+            plan_id = plan_id if isinstance(plan_id, uuid.UUID) else uuid.UUID(str(plan_id))
+        except ValueError:
+            return None
+        plan = self._by_id.get(plan_id)
+        cache_requests.inc(cache="plans", result="miss" if plan is None else "hit")
+        if plan is None and time.monotonic() - self._last_miss_reload > 1:
+            self._last_miss_reload = time.monotonic()
+            await self.reload()
+            plan = self._by_id.get(plan_id)
+        return plan
+
+
+plan_catalogue = PlanCatalogue()
+
+
+def _on_notification(connection, pid, channel, payload):
+    spawn("plans-reload", plan_catalogue.reload)
+
+
+async def listen_for_plan_changes():
+    """LISTEN permanent ; après une reconnexion, recharge pour rattraper les NOTIFY perdus."""
+    dsn = settings.postgres_database_url.split("?")[0]
+    while True:
+        try:
+            connection = await asyncpg.connect(dsn, ssl="require")
+        except Exception:
+            logger.warning("Écoute de '%s' impossible, nouvel essai", PLANS_CHANNEL, exc_info=True)
+            await asyncio.sleep(settings.plans_listen_retry_seconds)
+            continue
+
+        closed = asyncio.Event()
+        connection.add_termination_listener(lambda _connection: closed.set())
+        try:
+            await connection.add_listener(PLANS_CHANNEL, _on_notification)
+            await plan_catalogue.reload()
+            await closed.wait()
+            logger.warning("Connexion d'écoute de '%s' perdue", PLANS_CHANNEL)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning("Écoute de '%s' interrompue", PLANS_CHANNEL, exc_info=True)
+        finally:
+            if not connection.is_closed():
+                await connection.close()
+        await asyncio.sleep(settings.plans_listen_retry_seconds)
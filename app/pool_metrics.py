@@ -0,0 +1,113 @@
+"""Métriques des pools de connexions PostgreSQL (SQLAlchemy/asyncpg) et MongoDB (pymongo).
+
+Côté SQLAlchemy, l'attente d'une connexion est mesurée autour de `_do_get` du
+pool et les débordements (connexions au-delà de pool_size) via l'événement
+"connect". Côté Mongo, un ConnectionPoolListener reçoit les événements CMAP,
+dont la durée d'attente de chaque checkout ; pymongo les émet depuis ses
+threads, d'où le verrou.
+"""
+import threading
+import time
+
+from pymongo.monitoring import ConnectionCheckOutFailedReason, ConnectionPoolListener
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.metrics import Counter, Gauge
+
+open_connections = Gauge("db_pool_connections", "Connexions ouvertes", ("pool",))
+checked_out = Gauge("db_pool_checked_out", "Connexions empruntées en cours d'utilisation", ("pool",))
+checkouts = Counter("db_pool_checkouts_total", "Connexions obtenues du pool", ("pool",))
+wait_seconds = Counter("db_pool_wait_seconds_total", "Temps cumulé d'attente d'une connexion", ("pool",))
+timeouts = Counter("db_pool_timeouts_total", "Attentes de connexion abandonnées (délai dépassé)", ("pool",))
+overflows = Counter("db_pool_overflow_total", "Connexions ouvertes au-delà de la taille du pool", ("pool",))
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Pool SQLAlchemy qui mesure le temps d'attente de chaque checkout."""
+
+    label = "postgres"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            timeouts.inc(pool=self.label)
+            raise
+        finally:
+            wait_seconds.inc(time.perf_counter() - started, pool=self.label)
+        checkouts.inc(pool=self.label)
+        return connection
+
+
+def instrument_engine(engine: AsyncEngine, label: str = "postgres"):
+    """Abonne les métriques aux événements du pool ; `label` distingue primaire et réplica."""
+    pool = engine.sync_engine.pool
+    pool.label = label
+
+    @event.listens_for(pool, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        open_connections.inc(pool=label)
+        if pool.overflow() > 0:
+            overflows.inc(pool=label)
+
+    @event.listens_for(pool, "close")
+    def _on_close(dbapi_connection, connection_record):
+        open_connections.dec(pool=label)
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out.inc(pool=label)
+
+    @event.listens_for(pool, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        checked_out.dec(pool=label)
+
+
+class MongoPoolListener(ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def connection_created(self, event):
+        with self._lock:
+            open_connections.inc(pool="mongo")
+
+    def connection_closed(self, event):
+        with self._lock:
+            open_connections.dec(pool="mongo")
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            checked_out.inc(pool="mongo")
+            checkouts.inc(pool="mongo")
+            wait_seconds.inc(event.duration, pool="mongo")
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            wait_seconds.inc(event.duration, pool="mongo")
+            if event.reason == ConnectionCheckOutFailedReason.TIMEOUT:
+                timeouts.inc(pool="mongo")
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            checked_out.dec(pool="mongo")
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
@@ -1,17 +1,53 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import time
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+from jose import JWTError, jwt
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
+from app.instrumentation import instrument_queries
+from app.metrics import Counter, Gauge
+from app.pool_metrics import InstrumentedQueuePool, instrument_engine
+from app.slow_queries import watch_engine
 
-SQLALCHEMY_DATABASE_URL = settings.postgres_database_url.replace(
-    "postgresql://", "postgresql+asyncpg://"
-).split('?')[0]
+logger = logging.getLogger(__name__)
 
-async_engine = create_async_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={
-        "ssl": "require",
-    },
-)
+replica_lag = Gauge("postgres_replica_lag_seconds", "Retard de réplication mesuré sur le réplica de lecture")
+read_routing = Counter("postgres_read_routing_total", "Sessions de lecture par cible", ("target",))
+
+
+def _asyncpg_url(url: str) -> str:
+    return url.replace("postgresql://", "postgresql+asyncpg://").split('?')[0]
+
+
+def _create_engine(url: str, **connect_args):
+    return create_async_engine(
+        _asyncpg_url(url),
+        connect_args={
+            "statement_cache_size": settings.postgres_statement_cache_size,
+            **connect_args,
+        },
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.postgres_pool_size,
+        max_overflow=settings.postgres_max_overflow,
+        pool_timeout=settings.postgres_pool_timeout_seconds,
+        pool_recycle=settings.postgres_pool_recycle_seconds,
+        pool_pre_ping=settings.postgres_pool_pre_ping,
+    )
+
+
+SQLALCHEMY_DATABASE_URL = _asyncpg_url(settings.postgres_database_url)
+
+async_engine = _create_engine(settings.postgres_database_url, ssl="require")
+instrument_engine(async_engine)
+instrument_queries(async_engine)
+watch_engine(async_engine)
 
 AsyncSessionLocal = sessionmaker(
     async_engine,
@@ -20,8 +56,139 @@ AsyncSessionLocal = sessionmaker(
     autoflush=False
 )
 
+# Réplica optionnel ; les sessions y sont en lecture seule, même pointées sur le primaire
+read_engine = None
+AsyncReadSessionLocal = None
+if settings.postgres_read_url:
+    read_engine = _create_engine(
+        settings.postgres_read_url,
+        ssl=settings.postgres_read_ssl,
+        server_settings={"default_transaction_read_only": "on"},
+    )
+    instrument_engine(read_engine, "postgres_read")
+    instrument_queries(read_engine, "postgres_read")
+    watch_engine(read_engine, "postgres_read")
+    AsyncReadSessionLocal = sessionmaker(
+        read_engine,
+        class_=AsyncSession,
+        expire_on_commit=False,
+        autoflush=False
+    )
+
+_replica_healthy = False
+# user_id -> échéance (monotonic) de la fenêtre read-your-writes, pour ce worker
+_recent_writes: Dict[str, float] = {}
+# Même fenêtre portée par le client, pour les requêtes servies par un autre worker
+READ_AFTER_COOKIE = "read_after"
+
 async def get_db_session():
     async with AsyncSessionLocal() as session:
         yield session
 
-        
\ No newline at end of file
+def _read_after_signature(user_id: str, until: int) -> str:
+    message = f"{user_id}.{until}".encode()
+    return hmac.new(settings.secret_key.encode(), message, hashlib.sha256).hexdigest()
+
+def mark_recent_write(user_id, response: Optional[Response] = None):
+    """À appeler après une écriture que l'utilisateur doit relire aussitôt (abonnement, paiement).
+
+    Le cookie signé renvoyé sur `response` étend la fenêtre à tous les workers.
+    """
+    window = settings.postgres_read_your_writes_seconds
+    _recent_writes[str(user_id)] = time.monotonic() + window
+    if response is not None:
+        until = int(time.time() + window)
+        response.set_cookie(
+            READ_AFTER_COOKIE,
+            f"{until}.{_read_after_signature(str(user_id), until)}",
+            max_age=int(window) + 1,
+            httponly=True,
+            samesite="lax",
+        )
+
+def _in_read_after_window(request: Optional[Request], user_id: str) -> bool:
+    if _recent_writes.get(user_id, 0) > time.monotonic():
+        return True
+    cookie = request.cookies.get(READ_AFTER_COOKIE) if request is not None else None
+    if not cookie:
+        return False
+    until, _, signature = cookie.partition(".")
+    if not until.isdigit() or int(until) < time.time():
+        return False
+    return hmac.compare_digest(signature, _read_after_signature(user_id, int(until)))
+
+def use_replica(user_id: Optional[str] = None, request: Optional[Request] = None) -> bool:
+    if read_engine is None or not _replica_healthy:
+        return False
+    if user_id and _in_read_after_window(request, user_id):
+        return False
+    return True
+
+def _request_user_id(request: Request) -> Optional[str]:
+    authorization = request.headers.get("authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        user_id = jwt.decode(authorization[7:], settings.secret_key, algorithms=[settings.algorithm]).get("user_id")
+    except JWTError:
+        return None
+    return str(user_id) if user_id else None
+
+def read_sessionmaker(user_id: Optional[str] = None, request: Optional[Request] = None):
+    """Fabrique de sessions de lecture : réplica s'il est à jour, sinon primaire."""
+    if use_replica(user_id, request):
+        read_routing.inc(target="replica")
+        return AsyncReadSessionLocal
+    read_routing.inc(target="primary")
+    return AsyncSessionLocal
+
+async def get_read_db_session(request: Request):
+    """Session pour les handlers en lecture seule."""
+    async with read_sessionmaker(_request_user_id(request), request)() as session:
+        yield session
+
+async def check_replica_lag():
+    """Mesure le retard du réplica ; au-delà de `postgres_read_max_lag_seconds`, les lectures vont au primaire."""
+    global _replica_healthy
+    if read_engine is None:
+        return
+    now = time.monotonic()
+    for user_id in [user_id for user_id, until in _recent_writes.items() if until <= now]:
+        del _recent_writes[user_id]
+
+    try:
+        async with read_engine.connect() as connection:
+            # Réplica à jour de tout le WAL reçu : aucun retard, même si le primaire est inactif
+            lag = (await connection.execute(text(
+                "SELECT CASE"
+                " WHEN NOT pg_is_in_recovery() THEN 0"
+                " WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+                " ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+                " END"
+            ))).scalar_one()
+    except Exception:
+        _replica_healthy = False
+        logger.warning("Réplica PostgreSQL injoignable, lectures redirigées vers le primaire", exc_info=True)
+        return
+    replica_lag.set(float(lag))
+    healthy = float(lag) <= settings.postgres_read_max_lag_seconds
+    if healthy != _replica_healthy:
+        logger.info("Réplica PostgreSQL %s (retard %.1f s)", "utilisé" if healthy else "écarté", float(lag))
+    _replica_healthy = healthy
+
+async def _warm_up_engine(engine, name: str):
+    count = min(settings.postgres_pool_warmup, settings.postgres_pool_size)
+    if count <= 0:
+        return
+    connections = await asyncio.gather(*(engine.connect() for _ in range(count)), return_exceptions=True)
+    opened = [c for c in connections if not isinstance(c, BaseException)]
+    await asyncio.gather(*(c.close() for c in opened))
+    if len(opened) < count:
+        logger.warning("Préchauffage %s partiel : %d/%d connexions", name, len(opened), count)
+
+async def warm_up_pool():
+    """Ouvre `postgres_pool_warmup` connexions en parallèle puis les rend au pool."""
+    await _warm_up_engine(async_engine, "PostgreSQL")
+    if read_engine is not None:
+        await _warm_up_engine(read_engine, "du réplica PostgreSQL")
+        await check_replica_lag()
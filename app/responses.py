@@ -0,0 +1,50 @@
+"""Réponses de liste rapides : projections encodées directement par orjson.
+
+Renvoyer des documents Beanie ou des objets ORM fait valider chaque élément
+contre le response_model, puis encoder le résultat avec le module json. Ici,
+les handlers lisent des projections (dicts Mongo, lignes SQL), complètent les
+valeurs par défaut du modèle et renvoient un ORJSONResponse, que FastAPI
+transmet tel quel. Le response_model reste déclaré pour la documentation.
+`?fields=a,b` restreint les champs de premier niveau.
+"""
+from typing import Dict, Iterable, List, Optional, Type
+
+from fastapi import HTTPException, status
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+_defaults_cache: Dict[type, dict] = {}
+
+
+def _defaults(model: Type[BaseModel]) -> dict:
+    if model not in _defaults_cache:
+        _defaults_cache[model] = {
+            name: field.get_default(call_default_factory=True)
+            for name, field in model.model_fields.items()
+            if not field.is_required()
+        }
+    return _defaults_cache[model]
+
+
+def parse_fields(model: Type[BaseModel], fields: Optional[str]) -> List[str]:
+    """Champs demandés par `?fields=` (tous par défaut) ; un champ inconnu donne une 400."""
+    if not fields:
+        return list(model.model_fields)
+    requested = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in requested if name not in model.model_fields]
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Champs inconnus : {', '.join(unknown)}" if unknown else "Aucun champ demandé"
+        )
+    return requested
+
+
+def project_row(model: Type[BaseModel], row: dict, fields: Optional[List[str]] = None) -> dict:
+    """Ligne réduite aux `fields` du modèle, complétée par ses valeurs par défaut."""
+    defaults = _defaults(model)
+    return {name: row.get(name, defaults.get(name)) for name in fields or model.model_fields}
+
+
+def list_response(model: Type[BaseModel], rows: Iterable[dict], fields: List[str], headers: Optional[dict] = None):
+    return ORJSONResponse([project_row(model, row, fields) for row in rows], headers=headers)
@@ -0,0 +1,57 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, status
+
+from app.analytics import format_analytics, get_rollup_summary, get_user_analytics, rollup_storage_analytics
+from app.models.user import User
+from app.oauth2 import get_current_admin
+from app.schemas.analytics import StorageAnalyticsOut, StorageRollupOut
+from app.schemas.slow_query import SlowQueryOrder, SlowQueryReportOut
+from app.slow_queries import slow_query_log
+from app.tasks import spawn
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+@router.get("/analytics", response_model=StorageRollupOut, status_code=status.HTTP_200_OK)
+async def get_storage_rollup(
+    current_admin: Annotated[User, Depends(get_current_admin)],
+    limit: int = 50,
+):
+    """Synthèse issue du dernier passage du batch (aucun calcul à la requête)."""
+    return await get_rollup_summary(min(limit, 500))
+
+
+@router.post("/analytics/rollup", status_code=status.HTTP_202_ACCEPTED)
+async def trigger_storage_rollup(current_admin: Annotated[User, Depends(get_current_admin)]):
+    spawn("analytics-rollup", rollup_storage_analytics)
+    return {"message": "Recalcul des statistiques lancé"}
+
+
+@router.get("/slow-queries", response_model=SlowQueryReportOut, status_code=status.HTTP_200_OK)
+async def get_slow_queries(
+    current_admin: Annotated[User, Depends(get_current_admin)],
+    limit: int = 20,
+    order_by: SlowQueryOrder = "total_ms",
+):
+    """Formes de requêtes lentes de ce worker depuis son démarrage (ou la dernière remise à zéro)."""
+    limit = min(limit, 200)
+    return {
+        "threshold_ms": slow_query_log.threshold_ms,
+        "since": slow_query_log.since,
+        "top": slow_query_log.top(limit, order_by),
+        "recent": slow_query_log.recent(limit),
+    }
+
+
+@router.delete("/slow-queries", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_slow_queries(current_admin: Annotated[User, Depends(get_current_admin)]):
+    slow_query_log.reset()
+
+
+@router.get("/analytics/{user_id}", response_model=StorageAnalyticsOut, status_code=status.HTTP_200_OK)
+async def get_user_storage_analytics(
+    user_id: str,
+    current_admin: Annotated[User, Depends(get_current_admin)],
+):
+    return await format_analytics(await get_user_analytics(user_id))
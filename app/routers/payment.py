@@ -1,14 +1,19 @@
 from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.future import select
 from datetime import datetime, timedelta
 import uuid
 
-from app.postgres_connect import get_db_session
+from app.postgres_connect import get_db_session, get_read_db_session, mark_recent_write
 from app.models.user import User
-from app.models.user import Plan, Subscription, SubscriptionStatus
+from app.models.user import Subscription, SubscriptionStatus
 from app.oauth2 import get_current_user
+from app.bandwidth import invalidate_entitlement
+from app.plans import plan_catalogue
 from app.utils import send_subscription_confirmation_email
 
 router = APIRouter(prefix="/payments", tags=["Payments"])
@@ -18,15 +23,11 @@ async def get_wave_payment_link(
     plan_id: str,
     is_yearly: bool = False,
     current_user: Annotated[User, Depends(get_current_user)] = None,
-    db: AsyncSession = Depends(get_db_session)
 ):
     """Récupérer le lien de paiement Wave pour un plan spécifique"""
     
     # Vérifier que le plan existe
-    plan_result = await db.execute(
-        select(Plan).where(Plan.id == plan_id)
-    )
-    plan = plan_result.scalars().first()
+    plan = await plan_catalogue.get(plan_id)
     
     if not plan:
         raise HTTPException(
@@ -57,6 +58,7 @@ async def get_wave_payment_link(
 
 @router.post("/confirm-payment")
 async def confirm_wave_payment(
+    response: Response,
     plan_id: str,
     is_yearly: bool,
     transaction_id: str,
@@ -66,10 +68,7 @@ async def confirm_wave_payment(
     """Confirmer un paiement Wave et activer l'abonnement"""
     
     # Vérifier que le plan existe
-    plan_result = await db.execute(
-        select(Plan).where(Plan.id == plan_id)
-    )
-    plan = plan_result.scalars().first()
+    plan = await plan_catalogue.get(plan_id)
     
     if not plan:
         raise HTTPException(
@@ -77,43 +76,55 @@ async def confirm_wave_payment(
             detail="Plan non trouvé"
         )
     
-    existing_sub_result = await db.execute(
-        select(Subscription).where(Subscription.wave_transaction_id == transaction_id)
+    # Désactiver l'abonnement actuel s'il existe (avant l'insertion : un seul actif par utilisateur)
+    now = datetime.utcnow()
+    await db.execute(
+        update(Subscription)
+        .where(Subscription.user_id == current_user.id)
+        .where(Subscription.status == SubscriptionStatus.ACTIVE)
+        .values(status=SubscriptionStatus.CANCELLED, end_date=now, updated_at=now)
     )
-    existing_sub = existing_sub_result.scalars().first()
     
-    if existing_sub:
+    end_date = now + timedelta(days=365 if is_yearly else 30)
+    
+    # L'index unique sur wave_transaction_id remplace la vérification préalable (sans course)
+    try:
+        inserted = await db.execute(
+            insert(Subscription)
+            .values(
+                id=uuid.uuid4(),
+                user_id=current_user.id,
+                plan_id=plan.id,
+                status=SubscriptionStatus.ACTIVE,
+                start_date=now,
+                end_date=end_date,
+                is_yearly=is_yearly,
+                wave_transaction_id=transaction_id,
+                created_at=now,
+                updated_at=now,
+            )
+            .on_conflict_do_nothing(index_elements=[Subscription.wave_transaction_id])
+            .returning(Subscription.id)
+        )
+        new_subscription_id = inserted.scalar_one_or_none()
+    except IntegrityError:
+        # Un autre paiement du même utilisateur a activé un abonnement entre-temps
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Un autre paiement est en cours de traitement, veuillez réessayer"
+        )
+    
+    if new_subscription_id is None:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Cette transaction a déjà été utilisée"
         )
     
-    # Désactiver l'abonnement actuel s'il existe
-    current_subscription_result = await db.execute(
-        select(Subscription)
-        .where(Subscription.user_id == current_user.id)
-        .where(Subscription.status == SubscriptionStatus.ACTIVE)
-    )
-    current_subscription = current_subscription_result.scalars().first()
-    
-    if current_subscription:
-        current_subscription.status = SubscriptionStatus.CANCELLED
-        current_subscription.end_date = datetime.utcnow()
-    
-    end_date = datetime.utcnow() + timedelta(days=365 if is_yearly else 30)
-    
-    new_subscription = Subscription(
-        user_id=current_user.id,
-        plan_id=uuid.UUID(plan_id),
-        status=SubscriptionStatus.ACTIVE,
-        start_date=datetime.utcnow(),
-        end_date=end_date,
-        is_yearly=is_yearly,
-        wave_transaction_id=transaction_id
-    )
-    
-    db.add(new_subscription)
     await db.commit()
+    invalidate_entitlement(current_user.id)
+    mark_recent_write(current_user.id, response)
     
     await send_subscription_confirmation_email(
     to_email=current_user.email,
@@ -135,9 +146,9 @@ async def confirm_wave_payment(
 @router.get("/subscription-status")
 async def get_subscription_status(
     current_user: Annotated[User, Depends(get_current_user)],
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_read_db_session)
 ):
-    """Vérifier le statut d'abonnement de l'utilisateur connecté"""
+    """Vérifier le statut d'abonnement de l'utilisateur connecté (lecture seule)"""
     result = await db.execute(
         select(Subscription)
         .where(Subscription.user_id == current_user.id)
@@ -148,15 +159,11 @@ async def get_subscription_status(
     
     if subscription:
         # Vérifier si l'abonnement n'a pas expiré
+        # Échu : app.expiry l'enregistrera au prochain passage, la lecture n'écrit rien
         if subscription.end_date and subscription.end_date < datetime.utcnow():
-            subscription.status = SubscriptionStatus.EXPIRED
-            await db.commit()
             return {"has_active_subscription": False, "status": "expired"}
         
-        plan_result = await db.execute(
-            select(Plan).where(Plan.id == subscription.plan_id)
-        )
-        plan = plan_result.scalars().first()
+        plan = await plan_catalogue.get(subscription.plan_id)
         
         return {
             "has_active_subscription": True,
@@ -0,0 +1,137 @@
+import time
+from typing import Annotated
+
+from bson import ObjectId
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from gridfs.errors import NoFile
+
+from app.bandwidth import throttle
+from app.config import settings
+from app.directories import find_directory
+from app.models.file import File
+from app.models.user import User
+from app.access import access_buffer
+from app.mongo_connect import get_collection, iter_stream
+from app.tiering import open_blob
+from app.oauth2 import get_current_user
+from app.schemas.file import ShareLinkOut
+from app import share_links
+
+router = APIRouter(prefix="/share", tags=["Sharing"])
+
+
+@router.post("/{directory:path}/{filename}", response_model=ShareLinkOut, status_code=status.HTTP_201_CREATED)
+async def create_share_link(
+    directory: str,
+    filename: str,
+    request: Request,
+    current_user: Annotated[User, Depends(get_current_user)],
+    expires_in: int = 3600,
+    byte_range: str | None = None,
+):
+    if not 0 < expires_in <= settings.share_link_max_ttl_seconds:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Durée de validité invalide (max {settings.share_link_max_ttl_seconds} secondes)"
+        )
+    share_links.parse_range(byte_range)
+
+    found_dir = await find_directory(str(current_user.id), directory)
+    if not found_dir:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Dossier '{directory}' introuvable")
+
+    file = await File.find_one(
+        File.file_name == filename,
+        File.parent.id == found_dir.id,
+        File.trashed == False
+    )
+    if not file:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Fichier '{filename}' introuvable dans '{directory}'")
+
+    blob_id = str(file.gridfs_id)
+    expires = int(time.time()) + expires_in
+    signature = share_links.sign(blob_id, expires, byte_range)
+    url = request.url_for("download_shared_file", blob_id=blob_id).include_query_params(
+        exp=expires, sig=signature, **({"range": byte_range} if byte_range else {})
+    )
+    return {"url": str(url), "expires": expires, "signature": signature}
+
+
+@router.delete("/revoke", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_share_link(
+    blob_id: str,
+    exp: int,
+    sig: str,
+    current_user: Annotated[User, Depends(get_current_user)],
+    range: str | None = None,
+):
+    share_links.verify(blob_id, exp, range, sig)
+    if not ObjectId.is_valid(blob_id) or not await File.find_one(
+        File.gridfs_id == ObjectId(blob_id),
+        File.owner_id == str(current_user.id)
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Non autorisé à révoquer ce lien")
+    share_links.revoke(sig, exp)
+
+
+@router.get("/{blob_id}", name="download_shared_file", status_code=status.HTTP_200_OK)
+async def download_shared_file(
+    blob_id: str,
+    exp: int,
+    sig: str,
+    range: str | None = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+):
+    # Aucune dépendance d'authentification : la signature fait foi
+    remaining = share_links.verify(blob_id, exp, range, sig)
+    byte_range = share_links.parse_range(range)
+
+    # Un fichier mis à la corbeille n'est plus servi, sans attendre la purge du blob ;
+    # une copie vivante (déduplication) reste prioritaire sur une copie à la corbeille
+    shared_file = await get_collection(File.Settings.name).find_one(
+        {"gridfs_id": ObjectId(blob_id)}, {"_id": 1, "owner_id": 1, "trashed": 1}, sort=[("trashed", 1)]
+    )
+    if shared_file and shared_file.get("trashed"):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Fichier partagé introuvable")
+
+    etag = f'"{blob_id}{"-" + range if range else ""}"'
+    cache_headers = {
+        "Cache-Control": f"public, max-age={min(remaining, settings.share_link_cache_max_age)}, immutable",
+        "ETag": etag,
+    }
+    if if_none_match == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+
+    try:
+        stream = await open_blob(ObjectId(blob_id))
+    except NoFile:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Fichier partagé introuvable")
+    if shared_file:
+        access_buffer.record(shared_file["_id"], shared_file["owner_id"])
+
+    metadata = stream.metadata or {}
+    headers = {
+        **cache_headers,
+        "Content-Disposition": f"attachment; filename={stream.filename}",
+        "Accept-Ranges": "bytes",
+    }
+    if byte_range:
+        start, end = byte_range[0], min(byte_range[1], stream.length)
+        if start >= stream.length:
+            raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, detail="Plage hors du fichier")
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{stream.length}"
+        headers["Content-Length"] = str(end - start)
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+    else:
+        start, end = 0, stream.length
+        headers["Content-Length"] = str(stream.length)
+        status_code = status.HTTP_200_OK
+
+    return StreamingResponse(
+        # Pas de requête Postgres ici : seul le plafond du worker s'applique
+        throttle(iter_stream(stream, settings.chunk_size, start, end)),
+        status_code=status_code,
+        media_type=metadata.get("content_type") or "application/octet-stream",
+        headers=headers,
+    )
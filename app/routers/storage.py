@@ -1,56 +1,173 @@
+import asyncio
+import hashlib
+import time
+from functools import partial
 from typing import Annotated, List
-from fastapi import APIRouter, HTTPException, UploadFile, Depends, status
+from fastapi import APIRouter, HTTPException, UploadFile, Depends, Form, status
 from fastapi.responses import StreamingResponse
 from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from beanie import PydanticObjectId
+from pydantic import ValidationError
+from gridfs.errors import NoFile
+from bson import DBRef
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.mongo_connect import iter_chunks, get_gridfs_bucket
-from app.models.file import Directory, File
+from app.mongo_connect import iter_stream, get_collection, get_gridfs_bucket, record_gridfs_write
+from app.models.file import Directory, File, FileStats
 from app.models.user import User
-from app.schemas.file import DirectoryOut, FileOut
-from app.utils import get_filename, check_storage_quota, calculate_user_storage_usage
+from app.schemas.file import DirectoryOut, FileOut, DirectorySizeOut, FileSearchOut, ChangesPageOut, TrashedFileOut, FileVersionOut, BlockSignaturesOut, HotFileOut, ArchiveExtractOut, FileStatRequest, FileStatOut
+from app.schemas.analytics import StorageAnalyticsOut
+from app.search import search_files
+from app.responses import list_response, parse_fields, project_row
+from app.journal import record_change, list_changes
+from app.admission import record_write_latency
+from app.bandwidth import get_download_rate, throttle
+from app.access import access_buffer, get_file_stats
+from app.analytics import analytics_cache, format_analytics, get_user_analytics
+from app.archives import extract_zip
+from app.file_stat import MAX_STAT_ENTRIES, stat_files
+from app.delta import DeltaManifest, assemble_delta, get_block_signatures, record_assembled_digest
+from app.tiering import open_blob
+from app.tasks import spawn
+from app.tracing import span
+from app.trash import move_to_trash, restore_file, empty_trash
+from app.versions import (
+    commit_new_version,
+    find_reusable_blob,
+    get_version,
+    list_versions,
+    mark_prunable,
+    record_version,
+)
+from app.models.change import ChangeEvent, ChangeKind
+from app.directories import (
+    find_directory,
+    is_root_path,
+    join_path,
+    parent_path_of,
+    child_ancestors,
+    list_subtree,
+    compute_subtree_size,
+    rename_subtree,
+    move_subtree,
+    apply_directory_delta,
+)
+from app.utils import get_filename, check_storage_quota, calculate_user_storage_usage, get_version_retention
 from app.oauth2 import get_current_user
 from app.config import settings
-from app.mongo_connect import iter_chunks, grid_fs_bucket
-from app.postgres_connect import get_db_session
+from app.postgres_connect import get_db_session, get_read_db_session
 
 router = APIRouter(prefix="/files", tags=["Storage"])
 
 
+# -------------------- Stat --------------------
+# Déclarée avant POST /{directory}, qui capturerait sinon "/stat"
+@router.post("/stat", response_model=FileStatOut, response_model_exclude_unset=True, status_code=status.HTTP_200_OK)
+async def stat_files_batch(
+    request: FileStatRequest,
+    current_user: Annotated[User, Depends(get_current_user)],
+):
+    """Métadonnées de plusieurs fichiers (par id ou dossier + nom) en un seul appel."""
+    if len(request.entries) > MAX_STAT_ENTRIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Au plus {MAX_STAT_ENTRIES} entrées par requête"
+        )
+    return {"items": await stat_files(str(current_user.id), request.entries, request.fields)}
+
+
 # -------------------- Directory --------------------
 @router.post("/{directory}", response_model=DirectoryOut, status_code=status.HTTP_201_CREATED)
 async def create_directory(
     directory: str,
-    current_user: Annotated[User, Depends(get_current_user)]
+    current_user: Annotated[User, Depends(get_current_user)],
+    parent: str | None = None,
 ):
     if not directory:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Le nom du dossier est requis")
 
+    parent_dir = None
+    if parent and not is_root_path(parent):
+        parent_dir = await find_directory(str(current_user.id), parent)
+        if not parent_dir:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Le dossier parent n'existe pas")
+
+    path = join_path(parent_dir.path if parent_dir else None, directory)
     existing_dir = await Directory.find_one(
-        Directory.dir_name == directory,
+        Directory.path == path,
         Directory.owner_id == str(current_user.id)
     )
     if existing_dir:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Le dossier existe déjà")
 
+    ancestors = child_ancestors(parent_dir) if parent_dir else []
     new_dir = Directory(
         dir_name=directory,
         owner_id=str(current_user.id),
         owner=current_user.name,
-        created_at=datetime.utcnow()
+        created_at=datetime.utcnow(),
+        path=path,
+        parent_id=parent_dir.id if parent_dir else None,
+        ancestors=ancestors,
+        depth=len(ancestors),
     )
-    await new_dir.insert()
+    try:
+        await new_dir.insert()
+    except DuplicateKeyError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Le dossier existe déjà")
+    await record_change(str(current_user.id), ChangeEvent.CREATE, ChangeKind.DIRECTORY, new_dir.id, new_dir.path)
     return new_dir
 
 
 @router.get("/directories", response_model=List[DirectoryOut], status_code=status.HTTP_200_OK)
 async def get_user_directories(
-    current_user: Annotated[User, Depends(get_current_user)]
+    current_user: Annotated[User, Depends(get_current_user)],
+    parent: str | None = None,
+    fields: str | None = None,
+):
+    fields = parse_fields(DirectoryOut, fields)
+    projection = {name: 1 for name in fields}
+    if parent is None:
+        cursor = get_collection(Directory.Settings.name).find({"owner_id": str(current_user.id)}, projection)
+        return list_response(DirectoryOut, await cursor.to_list(length=None), fields)
+
+    parent_dir = None
+    if not is_root_path(parent):
+        parent_dir = await find_directory(str(current_user.id), parent)
+        if not parent_dir:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Dossier '{parent}' introuvable")
+    # Même requête que list_children, en projection
+    cursor = get_collection(Directory.Settings.name).find(
+        {"owner_id": str(current_user.id), "parent_id": parent_dir.id if parent_dir else None}, projection
+    ).sort("dir_name")
+    return list_response(DirectoryOut, await cursor.to_list(length=None), fields)
+
+
+@router.get("/directories/tree", response_model=List[DirectoryOut], status_code=status.HTTP_200_OK)
+async def get_directory_tree(
+    directory: str,
+    current_user: Annotated[User, Depends(get_current_user)],
+):
+    root = await find_directory(str(current_user.id), directory)
+    if not root:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Dossier '{directory}' introuvable")
+    return [root, *await list_subtree(str(current_user.id), root)]
+
+
+@router.get("/directories/size", response_model=DirectorySizeOut, status_code=status.HTTP_200_OK)
+async def get_directory_size(
+    directory: str,
+    current_user: Annotated[User, Depends(get_current_user)],
 ):
-    return await Directory.find(Directory.owner_id == str(current_user.id)).to_list()
+    root = await find_directory(str(current_user.id), directory)
+    if not root:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Dossier '{directory}' introuvable")
+    return await compute_subtree_size(str(current_user.id), root)
 
 
-@router.patch("/rename-directory/{current_directory_name}", status_code=status.HTTP_200_OK)
+@router.patch("/rename-directory/{current_directory_name:path}", status_code=status.HTTP_200_OK)
 async def rename_directory(
     current_directory_name: str,
     new_directory_name: str,
@@ -59,26 +176,63 @@ async def rename_directory(
     if not new_directory_name:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Le nouveau nom du dossier est requis")
 
-    existing_dir = await Directory.find_one(
-        Directory.dir_name == current_directory_name,
-        Directory.owner_id == str(current_user.id)
-    )
+    existing_dir = await find_directory(str(current_user.id), current_directory_name)
     if not existing_dir:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Le dossier actuel n'existe pas")
 
+    new_path = join_path(parent_path_of(existing_dir.path), new_directory_name)
     if await Directory.find_one(
-        Directory.dir_name == new_directory_name,
+        Directory.path == new_path,
         Directory.owner_id == str(current_user.id)
     ):
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Un dossier avec ce nom existe déjà")
 
-    existing_dir.dir_name = new_directory_name
-    await existing_dir.save()
+    old_path = existing_dir.path
+    await rename_subtree(str(current_user.id), existing_dir, new_path)
+    await record_change(
+        str(current_user.id), ChangeEvent.RENAME, ChangeKind.DIRECTORY, existing_dir.id, new_path, old_path=old_path
+    )
     return {"detail": "Dossier renommé avec succès"}
 
 
+@router.patch("/move-directory/{directory:path}", status_code=status.HTTP_200_OK)
+async def move_directory(
+    directory: str,
+    current_user: Annotated[User, Depends(get_current_user)],
+    new_parent: str | None = None,
+):
+    found_dir = await find_directory(str(current_user.id), directory)
+    if not found_dir:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Dossier '{directory}' introuvable")
+
+    target = None
+    if new_parent and not is_root_path(new_parent):
+        target = await find_directory(str(current_user.id), new_parent)
+        if not target:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Le dossier de destination n'existe pas")
+        if target.id == found_dir.id or found_dir.id in target.ancestors:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Impossible de déplacer un dossier dans son propre sous-arbre"
+            )
+
+    new_path = join_path(target.path if target else None, found_dir.dir_name)
+    if new_path != found_dir.path and await Directory.find_one(
+        Directory.path == new_path,
+        Directory.owner_id == str(current_user.id)
+    ):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Un dossier avec ce nom existe déjà")
+
+    old_path = found_dir.path
+    await move_subtree(str(current_user.id), found_dir, target)
+    await record_change(
+        str(current_user.id), ChangeEvent.MOVE, ChangeKind.DIRECTORY, found_dir.id, found_dir.path, old_path=old_path
+    )
+    return {"detail": "Dossier déplacé avec succès", "path": found_dir.path}
+
+
 # -------------------- Files --------------------
-@router.post("/upload/{directory}", response_model=FileOut, status_code=status.HTTP_201_CREATED)
+@router.post("/upload/{directory:path}", response_model=FileOut, status_code=status.HTTP_201_CREATED)
 async def upload_file(
     directory: str,
     file: UploadFile,
@@ -96,10 +250,7 @@ async def upload_file(
         )
 
     # Vérifie si le dossier existe
-    found_dir = await Directory.find_one(
-        Directory.dir_name == directory,
-        Directory.owner_id == str(current_user.id)
-    )
+    found_dir = await find_directory(str(current_user.id), directory)
     if not found_dir:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -107,12 +258,31 @@ async def upload_file(
         )
 
     # Lire le contenu pour obtenir la taille
-    content = await file.read()
+    with span("body_read"):
+        content = await file.read()
     file_size_bytes = len(content)
-    
+    with span("digest"):
+        # hashlib libère le GIL : le hachage d'un gros corps ne bloque pas la boucle
+        digest = (await asyncio.to_thread(hashlib.sha256, content)).hexdigest()
+
+    # Vérifie si le fichier existe déjà
+    found_file = await File.find_one(
+        File.file_name == filename,
+        File.parent.id == found_dir.id,
+        File.trashed == False
+    )
+    if found_file and keep:
+        filename = get_filename(filename)
+        found_file = None
+    elif found_file and found_file.digest == digest:
+        # Contenu inchangé : ni nouveau blob ni nouvelle version
+        found_file.parent = found_dir
+        return found_file
+
+    replaced_bytes = found_file.file_size_bytes if found_file else 0
     can_upload = await check_storage_quota(
         str(current_user.id), 
-        file_size_bytes, 
+        file_size_bytes - replaced_bytes, 
         db
     )
     
@@ -122,123 +292,417 @@ async def upload_file(
             detail="Quota de stockage dépassé. Veuillez upgrader votre abonnement."
         )
 
-    # Vérifie si le fichier existe déjà
-    found_file = await File.find_one(
-        File.file_name == filename,
-        File.parent.id == found_dir.id
-    )
-    if found_file:
-        if keep:
-            filename = get_filename(filename)
-        else:
-            await found_file.delete()
-            await gridfs_bucket.delete(found_file.gridfs_id)
-
-    # Upload vers GridFS
-    upload_stream = gridfs_bucket.open_upload_stream(filename, metadata={
-        "owner_id": str(current_user.id),
-        "directory": directory
-    })
-    await upload_stream.write(content)
-    await upload_stream.close()
+    # Un contenu identique à une version conservée réutilise son blob
+    gridfs_id = await find_reusable_blob(found_file, digest) if found_file else None
+    if gridfs_id is None:
+        # Upload vers GridFS
+        upload_stream = gridfs_bucket.open_upload_stream(filename, metadata={
+            "owner_id": str(current_user.id),
+            "directory": directory,
+            "content_type": file.content_type
+        })
+        started = time.perf_counter()
+        with span("gridfs_write"):
+            await upload_stream.write(content)
+            await upload_stream.close()
+        record_write_latency(time.perf_counter() - started, -(-file_size_bytes // upload_stream.chunk_size))
+        record_gridfs_write(file_size_bytes)
+        gridfs_id = upload_stream._id
 
-    # Créer le document File
-    new_file = File(
-        file_name=filename,
-        content_type=file.content_type,
-        owner_id=str(current_user.id),
-        owner=current_user.name,
-        created_at=datetime.utcnow(),
-        parent=found_dir,
-        gridfs_id=upload_stream._id,
-        file_size_bytes=file_size_bytes
-    )
-    await new_file.insert()
+    if found_file:
+        # Nouvelle version : l'identité du fichier ne change pas
+        bytes_delta = await commit_new_version(found_file, gridfs_id, file_size_bytes, digest, file.content_type)
+        await mark_prunable(found_file, await get_version_retention(str(current_user.id), db))
+        await apply_directory_delta(found_dir.id, 0, bytes_delta)
+        await record_change(
+            str(current_user.id),
+            ChangeEvent.REPLACE,
+            ChangeKind.FILE,
+            found_file.id,
+            f"{found_dir.path}/{filename}",
+            file_size_bytes=file_size_bytes,
+        )
+        found_file.parent = found_dir
+        new_file = found_file
+    else:
+        # Créer le document File
+        new_file = File(
+            file_name=filename,
+            content_type=file.content_type,
+            owner_id=str(current_user.id),
+            owner=current_user.name,
+            created_at=datetime.utcnow(),
+            parent=found_dir,
+            ancestors=child_ancestors(found_dir),
+            gridfs_id=gridfs_id,
+            file_size_bytes=file_size_bytes,
+            digest=digest
+        )
+        await new_file.insert()
+        await record_version(new_file)
+        await apply_directory_delta(found_dir.id, 1, file_size_bytes)
+        analytics_cache.apply(str(current_user.id), new_file, 1)
+        await record_change(
+            str(current_user.id),
+            ChangeEvent.CREATE,
+            ChangeKind.FILE,
+            new_file.id,
+            f"{found_dir.path}/{filename}",
+            file_size_bytes=file_size_bytes,
+        )
     
     await calculate_user_storage_usage(str(current_user.id), db, gridfs_bucket)
     
     return new_file
 
 
-@router.get("/download/{directory}/{filename}", status_code=status.HTTP_200_OK)
+@router.post("/extract/{directory:path}", response_model=ArchiveExtractOut, status_code=status.HTTP_201_CREATED)
+async def upload_and_extract_archive(
+    directory: str,
+    archive: UploadFile,
+    current_user: Annotated[User, Depends(get_current_user)],
+    gridfs_bucket: Annotated[AsyncIOMotorGridFSBucket, Depends(get_gridfs_bucket)],
+    db: Annotated[AsyncSession, Depends(get_db_session)],
+):
+    """Extrait une archive ZIP dans `directory`, en recréant son arborescence."""
+    found_dir = await find_directory(str(current_user.id), directory)
+    if not found_dir:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Le dossier '{directory}' n'existe pas"
+        )
+
+    try:
+        return await extract_zip(archive, found_dir, current_user, db)
+    finally:
+        await calculate_user_storage_usage(str(current_user.id), db, gridfs_bucket)
+
+
+@router.get("/download/{directory:path}/{filename}", status_code=status.HTTP_200_OK)
 async def download_file(
     directory: str,
     filename: str,
     current_user: Annotated[User, Depends(get_current_user)],
+    db: Annotated[AsyncSession, Depends(get_db_session)],
+    version: int | None = None,
 ):
-    found_dir = await Directory.find_one(
-        Directory.dir_name == directory,
-        Directory.owner_id == str(current_user.id)
-    )
+    found_dir = await find_directory(str(current_user.id), directory)
     if not found_dir:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Dossier '{directory}' introuvable")
 
     file = await File.find_one(
         File.file_name == filename,
-        File.parent.id == found_dir.id
+        File.parent.id == found_dir.id,
+        File.trashed == False
     )
     if not file:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Fichier '{filename}' introuvable dans '{directory}'")
 
+    gridfs_id, content_type = file.gridfs_id, file.content_type
+    if version is not None and version != file.version:
+        file_version = await get_version(file, version)
+        if not file_version or file_version.prunable:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Version {version} introuvable pour '{filename}'")
+        gridfs_id, content_type = file_version.gridfs_id, file_version.content_type
+
+    try:
+        stream = await open_blob(gridfs_id)
+    except NoFile:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Contenu du fichier '{filename}' introuvable")
+    access_buffer.record(file.id, file.owner_id)
+
+    rate = await get_download_rate(str(current_user.id), db)
     return StreamingResponse(
-        iter_chunks(file.gridfs_id, settings.chunk_size),
-        media_type=file.content_type,
+        throttle(iter_stream(stream, settings.chunk_size), str(current_user.id), rate),
+        media_type=content_type,
         headers={"Content-Disposition": f"attachment; filename={file.file_name}"}
     )
 
+
+@router.get("/versions/{directory:path}/{filename}", response_model=List[FileVersionOut], status_code=status.HTTP_200_OK)
+async def get_file_versions(
+    directory: str,
+    filename: str,
+    current_user: Annotated[User, Depends(get_current_user)],
+):
+    found_dir = await find_directory(str(current_user.id), directory)
+    if not found_dir:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Dossier '{directory}' introuvable")
+
+    file = await File.find_one(
+        File.file_name == filename,
+        File.parent.id == found_dir.id,
+        File.trashed == False
+    )
+    if not file:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Fichier '{filename}' introuvable dans '{directory}'")
+
+    return [
+        {
+            "version": v.version,
+            "file_size_bytes": v.file_size_bytes,
+            "content_type": v.content_type,
+            "digest": v.digest,
+            "created_at": v.created_at,
+            "is_current": v.version == file.version,
+        }
+        for v in await list_versions(file)
+        if not v.prunable
+    ]
+
+@router.get("/blocks/{directory:path}/{filename}", response_model=BlockSignaturesOut, status_code=status.HTTP_200_OK)
+async def get_file_blocks(
+    directory: str,
+    filename: str,
+    current_user: Annotated[User, Depends(get_current_user)],
+):
+    """Signatures par bloc de la version courante, base d'un upload différentiel."""
+    found_dir = await find_directory(str(current_user.id), directory)
+    if not found_dir:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Dossier '{directory}' introuvable")
+
+    file = await File.find_one(
+        File.file_name == filename,
+        File.parent.id == found_dir.id,
+        File.trashed == False
+    )
+    if not file:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Fichier '{filename}' introuvable dans '{directory}'")
+
+    signatures = await get_block_signatures(file.gridfs_id)
+    return {
+        "version": file.version,
+        "block_size": signatures["block_size"],
+        "length": signatures["length"],
+        "blocks": signatures["blocks"],
+    }
+
+
+@router.post("/delta/{directory:path}/{filename}", response_model=FileOut, status_code=status.HTTP_201_CREATED)
+async def upload_file_delta(
+    directory: str,
+    filename: str,
+    base_version: int,
+    manifest: Annotated[str, Form()],
+    literals: UploadFile,
+    current_user: Annotated[User, Depends(get_current_user)],
+    gridfs_bucket: Annotated[AsyncIOMotorGridFSBucket, Depends(get_gridfs_bucket)],
+    db: Annotated[AsyncSession, Depends(get_db_session)],
+    content_type: str | None = None,
+):
+    """Nouvelle version d'un fichier existant : seuls les blocs modifiés sont envoyés."""
+    try:
+        delta = DeltaManifest.model_validate_json(manifest)
+    except ValidationError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Manifeste invalide : {e.errors()[0]['msg']}")
+
+    found_dir = await find_directory(str(current_user.id), directory)
+    if not found_dir:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Dossier '{directory}' introuvable")
+
+    file = await File.find_one(
+        File.file_name == filename,
+        File.parent.id == found_dir.id,
+        File.trashed == False
+    )
+    if not file:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Fichier '{filename}' introuvable dans '{directory}'")
+    if file.version != base_version:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"La version de base {base_version} n'est plus la version courante ({file.version})"
+        )
+
+    digest = delta.sha256.lower()
+    if file.digest == digest:
+        file.parent = found_dir
+        return file
+
+    signatures = await get_block_signatures(file.gridfs_id)
+    new_size = sum(
+        block.literal if block.literal is not None
+        else min(signatures["block_size"], signatures["length"] - block.ref * signatures["block_size"])
+        for block in delta.blocks
+    )
+    if not await check_storage_quota(str(current_user.id), new_size - file.file_size_bytes, db):
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Quota de stockage dépassé. Veuillez upgrader votre abonnement."
+        )
+
+    content_type = content_type or file.content_type
+    blob = await assemble_delta(file.gridfs_id, delta, literals, filename, {
+        "owner_id": str(current_user.id),
+        "directory": directory,
+        "content_type": content_type
+    })
+
+    # Empreinte renseignée par la tâche de fond une fois le blob relu
+    bytes_delta = await commit_new_version(file, blob["gridfs_id"], blob["length"], None, content_type)
+    spawn("delta-digest", partial(record_assembled_digest, blob["gridfs_id"], digest))
+    await mark_prunable(file, await get_version_retention(str(current_user.id), db))
+    await apply_directory_delta(found_dir.id, 0, bytes_delta)
+    await record_change(
+        str(current_user.id),
+        ChangeEvent.REPLACE,
+        ChangeKind.FILE,
+        file.id,
+        f"{found_dir.path}/{filename}",
+        file_size_bytes=blob["length"],
+    )
+    await calculate_user_storage_usage(str(current_user.id), db, gridfs_bucket)
+
+    file.parent = found_dir
+    return file
+
+
+@router.get("/analytics", response_model=StorageAnalyticsOut, status_code=status.HTTP_200_OK)
+async def get_storage_analytics(
+    current_user: Annotated[User, Depends(get_current_user)],
+):
+    """Répartition du stockage par type, dossier, taille et ancienneté."""
+    return await format_analytics(await get_user_analytics(str(current_user.id)))
+
+
 @router.get("/list", response_model=List[FileOut], status_code=status.HTTP_200_OK)
 async def get_files_in_directory(
     current_user: Annotated[User, Depends(get_current_user)],
     directory: str | None = None,
     limit: int = 5,
     skip: int = 0,
+    fields: str | None = None,
 ):
+    fields = parse_fields(FileOut, fields)
+    match = {"owner_id": str(current_user.id), "trashed": False}
+    found_dir = None
     if directory:
-        found_dir = await Directory.find_one(
-            Directory.dir_name == directory,
-            Directory.owner_id == str(current_user.id)
-        )
+        found_dir = await find_directory(str(current_user.id), directory)
         if not found_dir:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Dossier '{directory}' introuvable"
             )
-        files = await File.find(
-            File.parent.id == found_dir.id,
-            File.owner_id == str(current_user.id)
-        ).skip(skip).limit(limit).to_list(length=limit)
-    else:
-        files = await File.find(
-            File.owner_id == str(current_user.id)
-        ).skip(skip).limit(limit).to_list(length=limit)
-
-    # Peupler parent avec fetch()
+        match["parent.$id"] = found_dir.id
+
+    # Projection : seuls les champs demandés quittent MongoDB
+    projection = {name: 1 for name in fields if name in File.model_fields}
+    projection["parent"] = 1
+    files = await get_collection(File.Settings.name).find(match, projection).skip(skip).limit(limit).to_list(length=limit)
+
+    # Dossiers parents en une seule requête $in (au lieu d'un fetch() par fichier)
+    parents = {}
+    if "parent" in fields:
+        if found_dir:
+            parents = {found_dir.id: found_dir.model_dump()}
+        else:
+            parent_ids = list({f["parent"].id for f in files if f.get("parent")})
+            if parent_ids:
+                parents = {
+                    d["_id"]: d
+                    async for d in get_collection(Directory.Settings.name).find(
+                        {"_id": {"$in": parent_ids}}, {name: 1 for name in DirectoryOut.model_fields}
+                    )
+                }
+
+    stats = {}
+    if "download_count" in fields or "last_opened_at" in fields:
+        stats = await get_file_stats([f["_id"] for f in files])
+
+    rows = []
     for f in files:
-        if f.parent:
-            f.parent = await f.parent.fetch()
+        parent = parents.get(f["parent"].id) if f.get("parent") else None
+        rows.append({
+            **f,
+            "parent": project_row(DirectoryOut, parent) if parent else None,
+            **stats.get(f["_id"], {}),
+        })
+    return list_response(FileOut, rows, fields)
 
-    return files
 
+@router.get("/hot", response_model=List[HotFileOut], status_code=status.HTTP_200_OK)
+async def get_hot_files(
+    current_user: Annotated[User, Depends(get_current_user)],
+    limit: int = 20,
+):
+    """Fichiers les plus téléchargés (compteurs écrits en différé, quelques secondes de retard)."""
+    limit = min(limit, 100)
+    stats = await FileStats.find(FileStats.owner_id == str(current_user.id)).sort(
+        -FileStats.download_count
+    ).limit(limit).to_list()
+    files = {
+        f.id: f
+        for f in await File.find({"_id": {"$in": [s.id for s in stats]}}, File.trashed == False).to_list()
+    }
+    return [
+        {
+            "id": str(s.id),
+            "file_name": files[s.id].file_name,
+            "file_size_bytes": files[s.id].file_size_bytes,
+            "download_count": s.download_count,
+            "last_opened_at": s.last_opened_at,
+        }
+        for s in stats
+        if s.id in files
+    ]
+
+
+@router.get("/search", response_model=FileSearchOut, status_code=status.HTTP_200_OK)
+async def search_user_files(
+    current_user: Annotated[User, Depends(get_current_user)],
+    q: str | None = None,
+    extension: str | None = None,
+    content_type: str | None = None,
+    min_size: int | None = None,
+    max_size: int | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = 50,
+):
+    return await search_files(
+        str(current_user.id),
+        q=q,
+        cursor=cursor,
+        limit=limit,
+        extension=extension,
+        content_type=content_type,
+        min_size=min_size,
+        max_size=max_size,
+        created_after=created_after,
+        created_before=created_before,
+    )
 
-@router.delete("/delete/{directory}/{filename}", status_code=status.HTTP_204_NO_CONTENT)
+
+@router.get("/changes", response_model=ChangesPageOut, status_code=status.HTTP_200_OK)
+async def get_changes(
+    current_user: Annotated[User, Depends(get_current_user)],
+    # Même session (dépendance mise en cache) que celle de get_current_user
+    db: Annotated[AsyncSession, Depends(get_read_db_session)],
+    cursor: int = 0,
+    limit: int = 100,
+    wait: float = 0,
+):
+    # Rend la connexion Postgres au pool pendant le long-polling
+    await db.close()
+    return await list_changes(str(current_user.id), cursor=cursor, limit=min(max(limit, 1), 1000), wait=wait)
+
+
+@router.delete("/delete/{directory:path}/{filename}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_file(
     directory: str,
     filename: str,
     current_user: Annotated[User, Depends(get_current_user)],
     db: Annotated[AsyncSession, Depends(get_db_session)],
-    gridfs_bucket: Annotated[AsyncIOMotorGridFSBucket, Depends(get_gridfs_bucket)],
 ):
-    found_dir = await Directory.find_one(
-        Directory.dir_name == directory,
-        Directory.owner_id == str(current_user.id)
-    )
+    found_dir = await find_directory(str(current_user.id), directory)
     if not found_dir:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
                             detail=f"Dossier '{directory}' introuvable")
 
     file = await File.find_one(
         File.file_name == filename,
-        File.parent.id == found_dir.id
+        File.parent.id == found_dir.id,
+        File.trashed == False
     )
     if not file:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Fichier '{filename}' introuvable dans '{directory}'")
@@ -246,10 +710,138 @@ async def delete_file(
     if file.owner_id != str(current_user.id):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Non autorisé à supprimer ce fichier")
 
-    await gridfs_bucket.delete(file.gridfs_id)
-    await file.delete()
-    
-    await calculate_user_storage_usage(str(current_user.id), db, gridfs_bucket)
+    # Suppression logique : le blob est récupéré plus tard par le purgeur
+    if not await move_to_trash(file, found_dir, db):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Fichier '{filename}' introuvable dans '{directory}'")
     
     return {"detail": "Fichier supprimé avec succès"}
 
+
+@router.patch("/move/{directory:path}/{filename}", response_model=FileOut, status_code=status.HTTP_200_OK)
+async def move_file(
+    directory: str,
+    filename: str,
+    target_directory: str,
+    current_user: Annotated[User, Depends(get_current_user)],
+):
+    found_dir = await find_directory(str(current_user.id), directory)
+    if not found_dir:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Dossier '{directory}' introuvable")
+
+    target_dir = await find_directory(str(current_user.id), target_directory)
+    if not target_dir:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Dossier '{target_directory}' introuvable")
+
+    file = await File.find_one(
+        File.file_name == filename,
+        File.parent.id == found_dir.id,
+        File.trashed == False
+    )
+    if not file:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Fichier '{filename}' introuvable dans '{directory}'")
+    if target_dir.id == found_dir.id:
+        file.parent = found_dir
+        return file
+
+    if await File.find_one(File.file_name == filename, File.parent.id == target_dir.id, File.trashed == False):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Un fichier '{filename}' existe déjà dans '{target_directory}'"
+        )
+
+    # $set ciblé : une nouvelle version, une mise à la corbeille ou un vidage d'accès
+    # concurrents ne sont pas écrasés par le document lu plus haut
+    ancestors = child_ancestors(target_dir)
+    moved = await get_collection(File.Settings.name).find_one_and_update(
+        {"_id": file.id, "trashed": False},
+        {"$set": {"parent": DBRef(Directory.Settings.name, target_dir.id), "ancestors": ancestors}},
+        projection={"file_size_bytes": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if moved is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Fichier '{filename}' introuvable dans '{directory}'")
+
+    file.file_size_bytes = moved["file_size_bytes"]
+    analytics_cache.apply(str(current_user.id), file, -1)
+    file.parent = target_dir
+    file.ancestors = ancestors
+    analytics_cache.apply(str(current_user.id), file, 1)
+    await apply_directory_delta(found_dir.id, -1, -file.file_size_bytes)
+    await apply_directory_delta(target_dir.id, 1, file.file_size_bytes)
+    await record_change(
+        str(current_user.id),
+        ChangeEvent.MOVE,
+        ChangeKind.FILE,
+        file.id,
+        f"{target_dir.path}/{filename}",
+        old_path=f"{found_dir.path}/{filename}",
+    )
+    return file
+
+
+# -------------------- Trash --------------------
+@router.get("/trash", response_model=List[TrashedFileOut], status_code=status.HTTP_200_OK)
+async def get_trash(
+    current_user: Annotated[User, Depends(get_current_user)],
+    limit: int = 50,
+    skip: int = 0,
+):
+    files = await File.find(
+        File.owner_id == str(current_user.id),
+        File.trashed == True
+    ).sort(-File.trashed_at).skip(skip).limit(limit).to_list()
+    return [
+        {
+            "id": str(f.id),
+            "file_name": f.file_name,
+            "content_type": f.content_type,
+            "file_size_bytes": f.file_size_bytes,
+            "created_at": f.created_at,
+            "trashed_at": f.trashed_at,
+            "purge_at": f.purge_at,
+        }
+        for f in files
+    ]
+
+
+@router.post("/trash/{file_id}/restore", response_model=FileOut, status_code=status.HTTP_200_OK)
+async def restore_trashed_file(
+    file_id: PydanticObjectId,
+    current_user: Annotated[User, Depends(get_current_user)],
+    db: Annotated[AsyncSession, Depends(get_db_session)],
+):
+    file = await File.find_one(
+        File.id == file_id,
+        File.owner_id == str(current_user.id),
+        File.trashed == True
+    )
+    if not file:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Fichier introuvable dans la corbeille")
+
+    parent = await file.parent.fetch()
+    if await File.find_one(File.file_name == file.file_name, File.parent.id == parent.id, File.trashed == False):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Un fichier '{file.file_name}' existe déjà dans '{parent.path}'"
+        )
+    # Hors quota en corbeille : la restauration compte comme un nouvel upload
+    if settings.trash_quota_policy == "exclude" and not await check_storage_quota(
+        str(current_user.id), file.file_size_bytes, db
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Quota de stockage dépassé. Veuillez upgrader votre abonnement."
+        )
+
+    if not await restore_file(file, parent, db):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Fichier introuvable dans la corbeille")
+    file.parent = parent
+    return file
+
+
+@router.delete("/trash", status_code=status.HTTP_200_OK)
+async def empty_user_trash(
+    current_user: Annotated[User, Depends(get_current_user)],
+):
+    scheduled = await empty_trash(str(current_user.id))
+    return {"detail": "Corbeille vidée", "scheduled_for_purge": scheduled}
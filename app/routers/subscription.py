@@ -1,10 +1,10 @@
 from typing import Annotated, List
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 from datetime import datetime, timedelta
-from app.postgres_connect import get_db_session
+from app.postgres_connect import get_db_session, get_read_db_session, mark_recent_write
 from app.models.user import User, Plan, Subscription, StorageUsage, SubscriptionStatus
 from app.schemas.subscription import (
     PlanOut,
@@ -15,39 +15,44 @@ from app.schemas.subscription import (
     PaymentConfirmationRequest,
     PlanDisplayOut
 )
-from app.oauth2 import get_current_user
+from app.oauth2 import get_current_user, get_current_admin
+from app.bandwidth import invalidate_entitlement
+from app.config import settings
+from app.plans import notify_plans_changed, plan_catalogue
 
 router = APIRouter(prefix="/subscriptions", tags=["Subscriptions"])
 
 # -------------------- Plans --------------------
 @router.get("/plans", response_model=List[PlanOut])
-async def get_available_plans(db: AsyncSession = Depends(get_db_session)):
-    result = await db.execute(select(Plan).where(Plan.is_active == True).order_by(Plan.storage_limit_mb))
-    plans = result.scalars().all()
-    return plans
+async def get_available_plans(if_none_match: Annotated[str | None, Header()] = None):
+    # Servi depuis le catalogue en mémoire, corps JSON pré-sérialisé
+    cache_headers = {
+        "Cache-Control": f"public, max-age={settings.plans_cache_max_age_seconds}",
+        "ETag": plan_catalogue.etag,
+    }
+    if if_none_match == plan_catalogue.etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+    return Response(content=plan_catalogue.body, media_type="application/json", headers=cache_headers)
 
 @router.post("/plans", response_model=PlanOut)
 async def create_plan(
     plan_data: dict,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[User, Depends(get_current_admin)],
     db: AsyncSession = Depends(get_db_session)
 ):
-    if not getattr(current_user, "is_admin", False):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Accès refusé. Droits administrateur requis."
-        )
     new_plan = Plan(**plan_data)
     db.add(new_plan)
+    await notify_plans_changed(db)
     await db.commit()
     await db.refresh(new_plan)
+    await plan_catalogue.reload()
     return new_plan
 
 # -------------------- Subscriptions --------------------
 @router.get("/my-subscription", response_model=SubscriptionOut)
 async def get_my_subscription(
     current_user: Annotated[User, Depends(get_current_user)],
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_read_db_session)
 ):
     result = await db.execute(
         select(Subscription)
@@ -68,13 +73,15 @@ async def get_my_subscription(
 @router.get("/storage-usage", response_model=StorageUsageOut)
 async def get_storage_usage(
     current_user: Annotated[User, Depends(get_current_user)],
+    read_db: AsyncSession = Depends(get_read_db_session),
     db: AsyncSession = Depends(get_db_session)
 ):
-    result = await db.execute(
+    result = await read_db.execute(
         select(StorageUsage).where(StorageUsage.user_id == current_user.id)
     )
     usage = result.scalars().first()
     if not usage:
+        # Création paresseuse : seule cette branche écrit, sur le primaire
         usage = StorageUsage(user_id=current_user.id, used_storage_mb=0.0)
         db.add(usage)
         await db.commit()
@@ -83,12 +90,12 @@ async def get_storage_usage(
 
 @router.post("/upgrade", response_model=SubscriptionOut)
 async def upgrade_subscription(
+    response: Response,
     subscription_data: SubscriptionCreate,
     current_user: Annotated[User, Depends(get_current_user)],
     db: AsyncSession = Depends(get_db_session)
 ):
-    plan_result = await db.execute(select(Plan).where(Plan.id == subscription_data.plan_id))
-    plan = plan_result.scalars().first()
+    plan = await plan_catalogue.get(subscription_data.plan_id)
     if not plan:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -106,6 +113,8 @@ async def upgrade_subscription(
     if current_subscription:
         current_subscription.status = SubscriptionStatus.CANCELLED
         current_subscription.end_date = datetime.utcnow()
+        # Un seul abonnement actif par utilisateur (index unique partiel) : l'UPDATE part avant l'INSERT
+        await db.flush()
 
     end_date = datetime.utcnow() + timedelta(days=365 if subscription_data.is_yearly else 30)
     new_subscription = Subscription(
@@ -119,10 +128,13 @@ async def upgrade_subscription(
     db.add(new_subscription)
     await db.commit()
     await db.refresh(new_subscription)
+    invalidate_entitlement(current_user.id)
+    mark_recent_write(current_user.id, response)
     return SubscriptionOut.from_orm(new_subscription)
 
 @router.post("/cancel")
 async def cancel_subscription(
+    response: Response,
     current_user: Annotated[User, Depends(get_current_user)],
     db: AsyncSession = Depends(get_db_session)
 ):
@@ -142,5 +154,7 @@ async def cancel_subscription(
     subscription.status = SubscriptionStatus.CANCELLED
     subscription.end_date = datetime.utcnow()
     await db.commit()
+    invalidate_entitlement(current_user.id)
+    mark_recent_write(current_user.id, response)
     return {"message": "Abonnement annulé avec succès"}
 
@@ -1,16 +1,28 @@
+import csv
+import io
+import uuid
+import orjson
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from typing import List
+from fastapi.responses import StreamingResponse
+from typing import Annotated, AsyncIterator, List, Literal, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.schemas.user import UserCreate, UserOut, VerifyCodeRequest, ResetPasswordRequest
 from app.models.user import User
-from app.models.user import StorageUsage, Plan, Subscription, PlanType, SubscriptionStatus
+from app.models.user import StorageUsage, Subscription, PlanType, SubscriptionStatus
 from app.utils import generate_otp, send_email, hashed, send_forgot_password_email
-from app.postgres_connect import get_db_session
+from app.postgres_connect import get_db_session, get_read_db_session, read_sessionmaker
+from app.plans import plan_catalogue
+from app.oauth2 import get_current_admin
+from app.config import settings
+from app.responses import list_response, parse_fields
 from datetime import datetime
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
+MAX_USERS_PAGE = 500
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
 otp_store = {}
 
 @router.post("/create", response_model=UserOut)
@@ -32,10 +44,7 @@ async def register_user(user: UserCreate, background_tasks: BackgroundTasks,
     storage_usage = StorageUsage(user_id=new_user.id, used_storage_mb=0.0)
     db.add(storage_usage)
     
-    free_plan_result = await db.execute(
-        select(Plan).where(Plan.plan_type == PlanType.FREE)
-    )
-    free_plan = free_plan_result.scalar_one_or_none()
+    free_plan = plan_catalogue.by_type(PlanType.FREE)
     
     if free_plan:
         free_subscription = Subscription(
@@ -107,10 +116,87 @@ async def reset_password(data: ResetPasswordRequest, email: str, db: AsyncSessio
     return {"message": "Mot de passe réinitialisé avec succès"}
 
 
+def _users_query(fields: List[str], is_active: Optional[bool], plan_type: Optional[PlanType]):
+    """Colonnes demandées seulement (id toujours, pour le curseur) ; filtres appliqués en SQL.
+
+    Le plan est testé par EXISTS sur l'abonnement actif (index user/status).
+    """
+    columns = dict.fromkeys(["id", *fields])
+    query = select(*(getattr(User, column) for column in columns))
+    if is_active is not None:
+        query = query.where(User.is_active == is_active)
+    if plan_type is not None:
+        query = query.where(
+            select(Subscription.id)
+            .where(Subscription.user_id == User.id)
+            .where(Subscription.status == SubscriptionStatus.ACTIVE)
+            .where(Subscription.plan_id.in_(plan_catalogue.ids_for_type(plan_type)))
+            .exists()
+        )
+    return query
+
+
+def _csv_value(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return "" if value is None else str(value)
+
+
+def _export_chunk(rows, fields: List[str], export_format: str) -> bytes:
+    if export_format == "ndjson":
+        return b"".join(orjson.dumps({name: row[name] for name in fields}) + b"\n" for row in rows)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_csv_value(row[name]) for name in fields] for row in rows)
+    return buffer.getvalue().encode()
+
+
+async def _export_users(query, fields: List[str], export_format: str, user_id: str) -> AsyncIterator[bytes]:
+    """Curseur serveur (stream + yield_per) : mémoire constante quel que soit le volume."""
+    if export_format == "csv":
+        yield (",".join(fields) + "\r\n").encode()
+    # Session propre au flux : celle de la dépendance est fermée avant l'envoi du corps
+    async with read_sessionmaker(user_id)() as session:
+        result = await session.stream(
+            query.order_by(User.id).execution_options(yield_per=settings.users_export_batch_size)
+        )
+        async for rows in result.mappings().partitions():
+            yield _export_chunk(rows, fields, export_format)
+
+
 @router.get("/all", response_model=List[UserOut])
-async def get_all_users(db: AsyncSession = Depends(get_db_session)):
-    # Exécuter la requête asynchrone et récupérer tous les résultats
-    result = await db.execute(select(User))
-    users = result.scalars().all()
-    return users
+async def get_all_users(
+    current_admin: Annotated[User, Depends(get_current_admin)],
+    db: Annotated[AsyncSession, Depends(get_read_db_session)],
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    plan_type: Optional[PlanType] = None,
+    format: Literal["json", "ndjson", "csv"] = "json",
+    fields: Optional[str] = None,
+):
+    """Utilisateurs par pages (curseur dans X-Next-Cursor) ou export complet en flux NDJSON/CSV."""
+    fields = parse_fields(UserOut, fields)
+    query = _users_query(fields, is_active, plan_type)
+    if format != "json":
+        return StreamingResponse(
+            _export_users(query, fields, format, str(current_admin.id)),
+            media_type=EXPORT_MEDIA_TYPES[format],
+            headers={"Content-Disposition": f'attachment; filename="users.{format}"'},
+        )
+
+    # Pagination par clé (id) : coût constant quelle que soit la profondeur, contrairement à OFFSET
+    limit = max(1, min(limit, MAX_USERS_PAGE))
+    if cursor:
+        try:
+            query = query.where(User.id > uuid.UUID(cursor))
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Curseur invalide")
+    users = (await db.execute(query.order_by(User.id).limit(limit + 1))).mappings().all()
+    headers = {}
+    if len(users) > limit:
+        users = users[:limit]
+        headers["X-Next-Cursor"] = str(users[-1]["id"])
+    return list_response(UserOut, users, fields, headers=headers)
 
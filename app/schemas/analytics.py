@@ -0,0 +1,38 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class AnalyticsBucketOut(BaseModel):
+
+    key: str
+    file_count: int
+    total_bytes: int
+
+
+class StorageAnalyticsOut(BaseModel):
+
+    computed_at: datetime
+    file_count: int
+    total_bytes: int
+    by_content_type: List[AnalyticsBucketOut]
+    by_directory: List[AnalyticsBucketOut]
+    by_size: List[AnalyticsBucketOut]
+    by_age: List[AnalyticsBucketOut]
+
+
+class UserStorageRankOut(BaseModel):
+
+    owner_id: str
+    file_count: int
+    total_bytes: int
+
+
+class StorageRollupOut(BaseModel):
+
+    computed_at: Optional[datetime] = None
+    users: int
+    file_count: int
+    total_bytes: int
+    top_users: List[UserStorageRankOut]
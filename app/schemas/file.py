@@ -1,6 +1,7 @@
 from datetime import datetime
+from typing import List, Literal, Optional, Tuple
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, model_validator
 
 
 class DirectoryOut(BaseModel):
@@ -9,6 +10,17 @@ class DirectoryOut(BaseModel):
     owner_id: str
     created_at: datetime
     owner:str
+    path: str = ""
+    depth: int = 0
+    file_count: int = 0
+    total_bytes: int = 0
+    last_modified: Optional[datetime] = None
+
+class DirectorySizeOut(BaseModel):
+
+    path: str
+    file_count: int
+    total_bytes: int
 
 class FileOut(BaseModel):
     
@@ -19,7 +31,141 @@ class FileOut(BaseModel):
     owner_id: str
     owner: str
     parent: DirectoryOut
+    download_count: int = 0
+    last_opened_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+
+class FileSearchItem(BaseModel):
+
+    id: str
+    file_name: str
+    content_type: str
+    file_size_bytes: int
+    created_at: datetime
+    extension: str
+    directory: Optional[str] = None
+    score: int
+
+class FileSearchOut(BaseModel):
+
+    items: List[FileSearchItem]
+    next_cursor: Optional[str] = None
+
+class ChangeOut(BaseModel):
+
+    seq: int
+    event: str
+    kind: str
+    entity_id: str
+    path: str
+    old_path: Optional[str] = None
+    file_size_bytes: Optional[int] = None
+    created_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
 
+class ChangesPageOut(BaseModel):
+
+    changes: List[ChangeOut]
+    cursor: int
+    has_more: bool
+    reset: bool = False
+
+class ShareLinkOut(BaseModel):
+
+    url: str
+    expires: int
+    signature: str
+
+class TrashedFileOut(BaseModel):
+
+    id: str
+    file_name: str
+    content_type: str
+    file_size_bytes: int
+    created_at: datetime
+    trashed_at: datetime
+    purge_at: Optional[datetime] = None
+
+class FileVersionOut(BaseModel):
+
+    version: int
+    file_size_bytes: int
+    content_type: str
+    digest: Optional[str] = None
+    created_at: datetime
+    is_current: bool
+
+
+class BlockSignaturesOut(BaseModel):
+
+    version: int
+    block_size: int
+    length: int
+    # [adler32, sha256] par bloc, dans l'ordre des chunks
+    blocks: List[Tuple[int, str]]
+
+
+class HotFileOut(BaseModel):
+
+    id: str
+    file_name: str
+    file_size_bytes: int
+    download_count: int
+    last_opened_at: Optional[datetime] = None
+
+
+class ArchiveExtractOut(BaseModel):
+
+    directory: str
+    extracted: int
+    total_bytes: int
+    directories_created: int
+
+
+StatField = Literal["file_name", "content_type", "file_size_bytes", "digest", "version",
+                    "created_at", "updated_at", "storage_tier"]
+
+
+class FileStatRef(BaseModel):
+
+    # Soit un identifiant, soit un couple (dossier, nom)
+    id: Optional[str] = None
+    directory: Optional[str] = None
+    filename: Optional[str] = None
+
+    @model_validator(mode="after")
+    def _check_reference(self):
+        if self.id is None and not (self.directory and self.filename):
+            raise ValueError("Chaque entrée doit fournir 'id' ou 'directory' et 'filename'")
+        return self
+
+
+class FileStatRequest(BaseModel):
+
+    entries: List[FileStatRef]
+    fields: Optional[List[StatField]] = None
+
+
+class FileStatItem(BaseModel):
+
+    id: Optional[str] = None
+    directory: Optional[str] = None
+    filename: Optional[str] = None
+    found: bool
+    file_name: Optional[str] = None
+    content_type: Optional[str] = None
+    file_size_bytes: Optional[int] = None
+    digest: Optional[str] = None
+    version: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    storage_tier: Optional[str] = None
+
+
+class FileStatOut(BaseModel):
 
+    items: List[FileStatItem]
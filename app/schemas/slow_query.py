@@ -0,0 +1,37 @@
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel
+
+SlowQueryOrder = Literal["total_ms", "max_ms", "count"]
+
+
+class SlowQueryShapeOut(BaseModel):
+
+    db: str
+    shape: str
+    count: int
+    total_ms: float
+    mean_ms: float
+    max_ms: float
+    last_seen: Optional[datetime] = None
+    routes: Dict[str, int]
+    slowest_params: Any = None
+
+
+class SlowQueryOut(BaseModel):
+
+    db: str
+    shape: str
+    params: Any = None
+    duration_ms: float
+    route: str
+    at: datetime
+
+
+class SlowQueryReportOut(BaseModel):
+
+    threshold_ms: float
+    since: datetime
+    top: List[SlowQueryShapeOut]
+    recent: List[SlowQueryOut]
@@ -8,6 +8,7 @@ class PlanBase(BaseModel):
     name: str
     plan_type: PlanType
     storage_limit_mb: int
+    max_file_versions: int = Field(10, description="Nombre de versions conservées par fichier")
     price_monthly: float = Field(..., description="Prix mensuel en FCFA")
     price_yearly: float = Field(..., description="Prix annuel en FCFA")
 
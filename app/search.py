@@ -0,0 +1,143 @@
+"""Recherche indexée sur les noms et métadonnées des fichiers d'un utilisateur."""
+import base64
+import json
+import re
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+
+from app.models.file import Directory, File, tokenize
+
+MAX_SEARCH_LIMIT = 200
+
+
+def encode_cursor(score: int, file_id: ObjectId) -> str:
+    raw = json.dumps({"s": score, "id": str(file_id)}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        return int(data["s"]), ObjectId(data["id"])
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Curseur de pagination invalide")
+
+
+def build_match(
+    owner_id: str,
+    q: Optional[str] = None,
+    extension: Optional[str] = None,
+    content_type: Optional[str] = None,
+    min_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+) -> dict:
+    """Filtre toujours préfixé par owner_id pour rester sur les index du propriétaire."""
+    # trashed: False doit figurer tel quel pour que les index partiels s'appliquent
+    match: dict = {"owner_id": owner_id, "trashed": False}
+
+    tokens = tokenize(q) if q else []
+    if tokens:
+        # Tous les jetons complets doivent correspondre exactement, le dernier
+        # (en cours de frappe) par préfixe : les deux passent par l'index multiclé.
+        *exact, last = tokens
+        clauses = [{"search_tokens": {"$regex": f"^{re.escape(last)}"}}]
+        if exact:
+            clauses.append({"search_tokens": {"$all": exact}})
+        match["$and"] = clauses
+
+    if extension:
+        match["extension"] = extension.lower().lstrip(".")
+    if content_type:
+        match["content_type"] = {"$regex": f"^{re.escape(content_type)}"}
+    if min_size is not None or max_size is not None:
+        match["file_size_bytes"] = {
+            **({"$gte": min_size} if min_size is not None else {}),
+            **({"$lte": max_size} if max_size is not None else {}),
+        }
+    if created_after or created_before:
+        match["created_at"] = {
+            **({"$gte": created_after} if created_after else {}),
+            **({"$lt": created_before} if created_before else {}),
+        }
+    return match
+
+
+def build_score(q: Optional[str]) -> dict:
+    """Score de pertinence : préfixe du nom > jeton exact > jetons communs."""
+    tokens = tokenize(q) if q else []
+    if not tokens:
+        return {"$literal": 0}
+    return {"$add": [
+        {"$cond": [{"$eq": [{"$indexOfCP": ["$name_lower", q.lower()]}, 0]}, 4, 0]},
+        {"$cond": [{"$in": [tokens[-1], "$search_tokens"]}, 2, 0]},
+        {"$size": {"$setIntersection": ["$search_tokens", tokens]}},
+    ]}
+
+
+async def search_files(
+    owner_id: str,
+    q: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    **filters,
+) -> dict:
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    match = build_match(owner_id, q, **filters)
+    projection = {"$project": {
+        "file_name": 1,
+        "content_type": 1,
+        "file_size_bytes": 1,
+        "created_at": 1,
+        "extension": 1,
+        "parent_id": {"$last": "$ancestors"},
+        "score": build_score(q),
+    }}
+    last = decode_cursor(cursor) if cursor else None
+
+    if not q:
+        # Sans texte : tri par _id sur l'index, le score est constant
+        if last:
+            match["_id"] = {"$lt": last[1]}
+        pipeline = [{"$match": match}, {"$sort": {"_id": -1}}, {"$limit": limit + 1}, projection]
+    else:
+        # Avec texte : le filtre indexé réduit l'ensemble, puis tri par pertinence
+        pipeline = [{"$match": match}, projection]
+        if last:
+            pipeline.append({"$match": {"$or": [
+                {"score": {"$lt": last[0]}},
+                {"score": last[0], "_id": {"$lt": last[1]}},
+            ]}})
+        pipeline += [{"$sort": {"score": -1, "_id": -1}}, {"$limit": limit + 1}]
+
+    rows = await File.aggregate(pipeline).to_list()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Chemins des dossiers de la page en une seule requête $in
+    parent_ids = list({row["parent_id"] for row in rows if row.get("parent_id")})
+    paths = {}
+    if parent_ids:
+        directories = await Directory.find({"_id": {"$in": parent_ids}}).to_list()
+        paths = {d.id: d.path for d in directories}
+
+    items = [
+        {
+            "id": str(row["_id"]),
+            "file_name": row["file_name"],
+            "content_type": row["content_type"],
+            "file_size_bytes": row.get("file_size_bytes", 0),
+            "created_at": row["created_at"],
+            "extension": row.get("extension", ""),
+            "directory": paths.get(row.get("parent_id")),
+            "score": row["score"],
+        }
+        for row in rows
+    ]
+    next_cursor = encode_cursor(rows[-1]["score"], rows[-1]["_id"]) if has_more else None
+    return {"items": items, "next_cursor": next_cursor}
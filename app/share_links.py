@@ -0,0 +1,91 @@
+"""Liens de partage pré-signés (HMAC) servis sans authentification ni requête Postgres."""
+import base64
+import hashlib
+import hmac
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from app.config import settings
+
+# Préfixe de signature conservé dans la liste de révocation (12 octets suffisent)
+DENY_KEY_BYTES = 12
+
+
+def _secret() -> bytes:
+    return (settings.share_link_secret or settings.secret_key).encode()
+
+
+def _message(blob_id: str, expires: int, byte_range: Optional[str]) -> bytes:
+    return f"{blob_id}:{expires}:{byte_range or ''}".encode()
+
+
+def sign(blob_id: str, expires: int, byte_range: Optional[str] = None) -> str:
+    digest = hmac.new(_secret(), _message(blob_id, expires, byte_range), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+def _decode_signature(signature: str) -> bytes:
+    try:
+        return base64.urlsafe_b64decode(signature + "=" * (-len(signature) % 4))
+    except Exception:
+        return b""
+
+
+def parse_range(byte_range: Optional[str]) -> Optional[Tuple[int, int]]:
+    """"0-1023" -> (0, 1024) : début inclus, fin exclue."""
+    if not byte_range:
+        return None
+    try:
+        start, end = (int(part) for part in byte_range.split("-", 1))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Plage d'octets invalide")
+    if start < 0 or end < start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Plage d'octets invalide")
+    return start, end + 1
+
+
+class DenyList:
+    """Signatures révoquées, indexées par préfixe et oubliées à leur expiration."""
+
+    def __init__(self):
+        self._entries: Dict[bytes, int] = {}
+
+    def _prune(self, now: int):
+        for key in [key for key, expires in self._entries.items() if expires <= now]:
+            del self._entries[key]
+
+    def add(self, signature: bytes, expires: int):
+        now = int(time.time())
+        self._prune(now)
+        if expires > now:
+            self._entries[signature[:DENY_KEY_BYTES]] = expires
+
+    def __contains__(self, signature: bytes) -> bool:
+        return signature[:DENY_KEY_BYTES] in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+deny_list = DenyList()
+
+
+def verify(blob_id: str, expires: int, byte_range: Optional[str], signature: str) -> int:
+    """Vérifie le lien en temps constant et retourne le nombre de secondes restantes."""
+    provided = _decode_signature(signature)
+    expected = hmac.new(_secret(), _message(blob_id, expires, byte_range), hashlib.sha256).digest()
+    if not hmac.compare_digest(provided, expected):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Signature de lien invalide")
+
+    remaining = expires - int(time.time())
+    if remaining <= 0:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Lien de partage expiré")
+    if provided in deny_list:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Lien de partage révoqué")
+    return remaining
+
+
+def revoke(signature: str, expires: int):
+    deny_list.add(_decode_signature(signature), expires)
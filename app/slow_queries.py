@@ -0,0 +1,236 @@
+"""Journal des requêtes lentes PostgreSQL et MongoDB, agrégé par forme de requête.
+
+Toute instruction SQL ou commande Mongo au-delà de `slow_query_threshold_ms`
+est journalisée et cumulée par forme normalisée (littéraux et valeurs
+remplacés par `?`, listes `IN (...)` repliées) : une boucle N+1, comme un
+`parent.fetch()` par fichier, ressort en tête par nombre d'occurrences. Les
+paramètres sont expurgés : seuls les nombres, booléens et None sont conservés,
+les chaînes deviennent `<str:longueur>`.
+
+Les listeners pymongo s'exécutent dans les threads de Motor (le contexte, donc
+la route, y est copié) : le journal est protégé par un verrou.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+from pymongo.monitoring import CommandListener
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import settings
+from app.instrumentation import current_route
+from app.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+slow_queries_total = Counter("slow_queries_total", "Requêtes au-delà du seuil de lenteur", ("db",))
+
+MAX_SHAPE_LENGTH = 2000
+# Champs ajoutés par le pilote à chaque commande, sans intérêt pour la forme
+MONGO_DRIVER_FIELDS = {
+    "lsid", "$clusterTime", "$db", "txnNumber", "$readPreference", "signature",
+    "autocommit", "startTransaction", "readConcern", "writeConcern", "apiVersion",
+}
+# Contenus écrits (insert, update) : volumineux et sans intérêt pour la forme
+MONGO_PAYLOAD_FIELDS = {"documents", "updates"}
+
+_SQL_STRING = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+# asyncpg rend les paramètres typés : `$1::VARCHAR`, `$2::INTEGER[]`
+_SQL_CAST = r"(?:::\w+(?:\[\])?)?"
+_SQL_LIST = re.compile(
+    rf"\(\s*(?:\?|\$\d+|%\(\w+\)s){_SQL_CAST}(?:\s*,\s*(?:\?|\$\d+|%\(\w+\)s){_SQL_CAST})*\s*\)"
+)
+_SQL_PLACEHOLDER = re.compile(rf"(?:\$\d+|%\(\w+\)s){_SQL_CAST}")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(statement: str) -> str:
+    shape = _SQL_STRING.sub("?", statement)
+    shape = _SQL_NUMBER.sub("?", shape)
+    shape = _SQL_PLACEHOLDER.sub("?", shape)
+    shape = _SQL_LIST.sub("(...)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()[:MAX_SHAPE_LENGTH]
+
+
+def redact(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (str, bytes)):
+        return f"<{type(value).__name__}:{len(value)}>"
+    if isinstance(value, dict):
+        return {str(key): redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value[:20]] + (["..."] if len(value) > 20 else [])
+    return f"<{type(value).__name__}>"
+
+
+def _mongo_shape(value, depth: int = 0):
+    """Clés et opérateurs conservés, valeurs remplacées par `?` ; un tableau prend la forme de son 1er élément."""
+    if isinstance(value, dict):
+        if depth > 6:
+            return "{...}"
+        return {key: _mongo_shape(item, depth + 1) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_mongo_shape(value[0], depth + 1)] if value else []
+    return "?"
+
+
+def normalize_mongo(command_name: str, command: dict) -> Tuple[str, dict]:
+    """(forme, paramètres expurgés) ; le nom de la collection reste en clair."""
+    body = {key: item for key, item in command.items() if key not in MONGO_DRIVER_FIELDS}
+    collection = body.pop(command_name, None)
+    shape = {command_name: collection if isinstance(collection, str) else "?", **_mongo_shape(body)}
+    text = json.dumps(shape, default=str, separators=(",", ":"))[:MAX_SHAPE_LENGTH]
+    return text, redact(body)
+
+
+class _ShapeStats:
+    __slots__ = ("db", "shape", "count", "total_ms", "max_ms", "last_seen", "routes", "slowest_params")
+
+    def __init__(self, db: str, shape: str):
+        self.db = db
+        self.shape = shape
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_seen: Optional[datetime] = None
+        self.routes: Dict[str, int] = {}
+        self.slowest_params = None
+
+
+class SlowQueryLog:
+    """Table bornée des formes lentes : au-delà de `max_shapes`, la forme au cumul le plus faible sort."""
+
+    def __init__(self, threshold_ms: float, max_shapes: int, recent_size: int):
+        self.threshold_ms = threshold_ms
+        self.max_shapes = max_shapes
+        self._shapes: Dict[Tuple[str, str], _ShapeStats] = {}
+        self._recent: Deque[dict] = deque(maxlen=recent_size)
+        self._lock = threading.Lock()
+        self.since = datetime.utcnow()
+
+    def is_slow(self, duration_ms: float) -> bool:
+        return self.threshold_ms > 0 and duration_ms >= self.threshold_ms
+
+    def record(self, db: str, shape: str, params, duration_ms: float, route: Optional[str]):
+        route = route or "background"
+        now = datetime.utcnow()
+        with self._lock:
+            stats = self._shapes.get((db, shape))
+            if stats is None:
+                if len(self._shapes) >= self.max_shapes:
+                    del self._shapes[min(self._shapes, key=lambda key: self._shapes[key].total_ms)]
+                stats = self._shapes[(db, shape)] = _ShapeStats(db, shape)
+            stats.count += 1
+            stats.total_ms += duration_ms
+            stats.last_seen = now
+            stats.routes[route] = stats.routes.get(route, 0) + 1
+            if duration_ms >= stats.max_ms:
+                stats.max_ms = duration_ms
+                stats.slowest_params = params
+            self._recent.append({
+                "db": db, "shape": shape, "params": params,
+                "duration_ms": round(duration_ms, 2), "route": route, "at": now,
+            })
+        slow_queries_total.inc(db=db)
+        logger.warning("Requête lente (%s, %.1f ms, %s) : %s", db, duration_ms, route, shape)
+
+    def top(self, limit: int, order_by: str = "total_ms") -> List[dict]:
+        with self._lock:
+            ranked = sorted(self._shapes.values(), key=lambda stats: getattr(stats, order_by), reverse=True)[:limit]
+            return [
+                {
+                    "db": stats.db,
+                    "shape": stats.shape,
+                    "count": stats.count,
+                    "total_ms": round(stats.total_ms, 2),
+                    "mean_ms": round(stats.total_ms / stats.count, 2),
+                    "max_ms": round(stats.max_ms, 2),
+                    "last_seen": stats.last_seen,
+                    "routes": dict(sorted(stats.routes.items(), key=lambda item: -item[1])[:10]),
+                    "slowest_params": stats.slowest_params,
+                }
+                for stats in ranked
+            ]
+
+    def recent(self, limit: int) -> List[dict]:
+        with self._lock:
+            return list(self._recent)[-limit:][::-1]
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+            self._recent.clear()
+            self.since = datetime.utcnow()
+
+
+slow_query_log = SlowQueryLog(
+    settings.slow_query_threshold_ms, settings.slow_query_max_shapes, settings.slow_query_recent_size
+)
+
+
+def watch_engine(engine: AsyncEngine, label: str = "postgres"):
+    """Abonne le journal aux instructions SQL de `engine` ; `label` distingue primaire et réplica."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (time.perf_counter() - conn.info["slow_query_started"].pop()) * 1000
+        if slow_query_log.is_slow(duration_ms):
+            slow_query_log.record(label, normalize_sql(statement), redact(parameters), duration_ms, current_route())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _on_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("slow_query_started"):
+            connection.info["slow_query_started"].pop()
+
+
+class SlowCommandListener(CommandListener):
+    """Garde la commande de chaque started jusqu'au succeeded/failed correspondant."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[tuple, Tuple[dict, Optional[str]]] = {}
+
+    @staticmethod
+    def _key(event) -> tuple:
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        if slow_query_log.threshold_ms <= 0:
+            return
+        # Copie réduite : la commande complète resterait référencée jusqu'à sa fin
+        command = {
+            key: item for key, item in event.command.items()
+            if key not in MONGO_DRIVER_FIELDS and key not in MONGO_PAYLOAD_FIELDS
+        }
+        with self._lock:
+            self._pending[self._key(event)] = (command, current_route())
+
+    def _finish(self, event):
+        with self._lock:
+            pending = self._pending.pop(self._key(event), None)
+        duration_ms = event.duration_micros / 1000
+        if pending is None or not slow_query_log.is_slow(duration_ms):
+            return
+        command, route = pending
+        shape, params = normalize_mongo(event.command_name, command)
+        slow_query_log.record("mongo", shape, params, duration_ms, route)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
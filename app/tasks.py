@@ -0,0 +1,42 @@
+"""Tâches de fond périodiques démarrées et arrêtées par le lifespan de l'application."""
+import asyncio
+import logging
+from typing import Awaitable, Callable, List
+
+logger = logging.getLogger(__name__)
+
+_tasks: List[asyncio.Task] = []
+
+
+async def _run_once(name: str, job: Callable[[], Awaitable]):
+    try:
+        await job()
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.exception("Échec de la tâche de fond '%s'", name)
+
+
+async def _run_periodic(name: str, job: Callable[[], Awaitable], interval_seconds: float):
+    while True:
+        await asyncio.sleep(interval_seconds)
+        await _run_once(name, job)
+
+
+def spawn(name: str, job: Callable[[], Awaitable]):
+    """Lance `job` une seule fois en arrière-plan ; la tâche est annulée à l'arrêt."""
+    task = asyncio.create_task(_run_once(name, job), name=name)
+    _tasks.append(task)
+    task.add_done_callback(lambda done: done in _tasks and _tasks.remove(done))
+
+
+def start_periodic(name: str, job: Callable[[], Awaitable], interval_seconds: float):
+    """Planifie `job` toutes les `interval_seconds` secondes ; une erreur n'arrête pas la boucle."""
+    _tasks.append(asyncio.create_task(_run_periodic(name, job, interval_seconds), name=name))
+
+
+async def stop_background_tasks():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
@@ -0,0 +1,377 @@
+"""Stockage hiérarchisé : les blobs non lus depuis N jours quittent GridFS pour un backend froid compressé.
+
+Le blob garde son identifiant : un document `cold_blobs` décrit la copie froide
+(backend, tailles, métadonnées GridFS d'origine). Une lecture qui ne trouve plus
+le blob dans GridFS le rapatrie de façon transparente avant de le servir.
+
+Un blob est partagé par déduplication et par les versions : il n'est copié à
+froid que si aucun fichier qui le référence n'a été lu depuis la date limite.
+La copie GridFS n'est supprimée qu'après `cold_storage_delete_grace_seconds`,
+si aucune lecture n'a eu lieu entre-temps : les téléchargements en cours se
+terminent sur GridFS, et un blob relu pendant le délai reste chaud.
+"""
+import asyncio
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Iterable
+
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+from app.access import access_buffer
+from app.config import settings
+from app.metrics import Counter, Gauge
+from app.models.file import File
+from app import mongo_connect
+from app.mongo_connect import get_collection, get_database, get_gridfs_bucket, iter_stream, record_gridfs_write
+
+logger = logging.getLogger(__name__)
+
+COLD_BLOBS_COLLECTION = "cold_blobs"
+READ_SIZE = 1024 * 1024
+
+cold_reads = Counter("storage_cold_reads_total", "Lectures ayant rapatrié un blob du stockage froid")
+tiered_bytes = Counter("storage_tiered_bytes_total", "Octets déplacés vers le stockage froid")
+tier_bytes = Gauge("storage_tier_bytes", "Octets stockés par niveau", ("tier",))
+cache_hit_ratio = Gauge("mongo_cache_hit_ratio", "Part des pages servies par le cache WiredTiger")
+
+
+# -------------------- Backends --------------------
+class LocalColdStore:
+    """Fichiers zlib dans un répertoire local, répartis par préfixe d'identifiant."""
+
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, blob_id) -> str:
+        blob_id = str(blob_id)
+        return os.path.join(self.root, blob_id[-2:], f"{blob_id}.z")
+
+    async def write(self, blob_id, chunks: AsyncIterator[bytes]):
+        path = self._path(blob_id)
+        await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
+        handle = await asyncio.to_thread(open, path + ".tmp", "wb")
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(handle.write, chunk)
+        finally:
+            await asyncio.to_thread(handle.close)
+        # Renommage atomique : jamais de copie froide partielle visible
+        await asyncio.to_thread(os.replace, path + ".tmp", path)
+
+    async def read(self, blob_id) -> AsyncIterator[bytes]:
+        handle = await asyncio.to_thread(open, self._path(blob_id), "rb")
+        try:
+            while chunk := await asyncio.to_thread(handle.read, READ_SIZE):
+                yield chunk
+        finally:
+            await asyncio.to_thread(handle.close)
+
+    async def delete(self, blob_id):
+        try:
+            await asyncio.to_thread(os.remove, self._path(blob_id))
+        except FileNotFoundError:
+            pass
+
+
+class MongoColdStore:
+    """Bucket GridFS d'une base Mongo distincte, hors du working set de la base principale."""
+
+    name = "mongo"
+
+    def __init__(self, database_name: str):
+        self.database_name = database_name
+
+    def _bucket(self) -> AsyncIOMotorGridFSBucket:
+        return AsyncIOMotorGridFSBucket(mongo_connect.client[self.database_name], bucket_name="cold")
+
+    async def write(self, blob_id, chunks: AsyncIterator[bytes]):
+        bucket = self._bucket()
+        try:
+            await bucket.delete(blob_id)
+        except NoFile:
+            pass
+        upload = bucket.open_upload_stream_with_id(blob_id, str(blob_id))
+        try:
+            async for chunk in chunks:
+                await upload.write(chunk)
+                record_gridfs_write(len(chunk))
+        except BaseException:
+            await upload.abort()
+            raise
+        await upload.close()
+
+    async def read(self, blob_id) -> AsyncIterator[bytes]:
+        stream = await self._bucket().open_download_stream(blob_id)
+        async for chunk in iter_stream(stream, READ_SIZE):
+            yield chunk
+
+    async def delete(self, blob_id):
+        try:
+            await self._bucket().delete(blob_id)
+        except NoFile:
+            pass
+
+
+def _stores() -> Dict[str, object]:
+    return {
+        LocalColdStore.name: LocalColdStore(settings.cold_storage_path),
+        MongoColdStore.name: MongoColdStore(settings.cold_storage_mongo_database),
+    }
+
+
+# -------------------- Compression en flux --------------------
+async def _compress(chunks: AsyncIterator[bytes], sizes: dict) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(settings.cold_storage_compression_level)
+    async for chunk in chunks:
+        sizes["raw"] += len(chunk)
+        if data := await asyncio.to_thread(compressor.compress, chunk):
+            sizes["compressed"] += len(data)
+            yield data
+    data = compressor.flush()
+    sizes["compressed"] += len(data)
+    yield data
+
+
+async def _decompress(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    decompressor = zlib.decompressobj()
+    async for chunk in chunks:
+        if data := await asyncio.to_thread(decompressor.decompress, chunk):
+            yield data
+    if data := decompressor.flush():
+        yield data
+
+
+# -------------------- Migration et rappel --------------------
+async def _move_to_cold(store, grid_file: dict):
+    blob_id = grid_file["_id"]
+    sizes = {"raw": 0, "compressed": 0}
+    stream = await get_gridfs_bucket().open_download_stream(blob_id)
+    await store.write(blob_id, _compress(iter_stream(stream, READ_SIZE), sizes))
+
+    # La copie froide est décrite avant que le blob ne quitte GridFS : aucune fenêtre sans copie
+    await get_collection(COLD_BLOBS_COLLECTION).replace_one({"_id": blob_id}, {
+        "_id": blob_id,
+        "backend": store.name,
+        "length": sizes["raw"],
+        "compressed_length": sizes["compressed"],
+        "filename": grid_file.get("filename"),
+        "metadata": grid_file.get("metadata"),
+        "chunk_size": grid_file["chunkSize"],
+        "upload_date": grid_file.get("uploadDate"),
+        "moved_at": datetime.utcnow(),
+        # La copie GridFS reste servie jusqu'à _release_hot_copies
+        "hot_deleted": False,
+    }, upsert=True)
+    await get_collection(File.Settings.name).update_many(
+        {"gridfs_id": blob_id}, {"$set": {"storage_tier": "cold"}}
+    )
+
+
+async def _last_access_by_blob(gridfs_ids: list) -> Dict:
+    """gridfs_id -> (dernier accès parmi les fichiers qui le référencent, identifiants de ces fichiers)."""
+    groups = await get_collection(File.Settings.name).aggregate([
+        {"$match": {"gridfs_id": {"$in": gridfs_ids}}},
+        {"$group": {"_id": "$gridfs_id", "last": {"$max": "$last_accessed_at"}, "files": {"$push": "$_id"}}},
+    ]).to_list(length=None)
+    return {group["_id"]: (group["last"], group["files"]) for group in groups}
+
+
+async def _release_hot_copies(store):
+    """Supprime de GridFS les blobs copiés à froid depuis le délai de grâce, sauf s'ils ont été relus."""
+    cold_blobs = get_collection(COLD_BLOBS_COLLECTION)
+    grace_cutoff = datetime.utcnow() - timedelta(seconds=settings.cold_storage_delete_grace_seconds)
+    pending = await cold_blobs.find(
+        {"hot_deleted": False, "backend": store.name, "moved_at": {"$lte": grace_cutoff}},
+        {"moved_at": 1, "length": 1},
+    ).to_list(length=None)
+    if not pending:
+        return
+    accesses = await _last_access_by_blob([cold["_id"] for cold in pending])
+    for cold in pending:
+        blob_id = cold["_id"]
+        last, file_ids = accesses.get(blob_id, (None, []))
+        if (last and last > cold["moved_at"]) or any(access_buffer.pending(file_id) for file_id in file_ids):
+            # Relu pendant le délai : le blob reste chaud, la copie froide est abandonnée
+            await store.delete(blob_id)
+            await cold_blobs.delete_one({"_id": blob_id})
+            await get_collection(File.Settings.name).update_many(
+                {"gridfs_id": blob_id}, {"$set": {"storage_tier": "hot"}}
+            )
+            continue
+        try:
+            await get_gridfs_bucket().delete(blob_id)
+        except NoFile:
+            pass
+        await cold_blobs.update_one({"_id": blob_id}, {"$set": {"hot_deleted": True}})
+        tiered_bytes.inc(cold["length"])
+
+
+_recalls: Dict = {}
+
+
+async def _claim_recall(blob_id):
+    """Un seul worker rapatrie un blob donné ; un rappel interrompu est repris après expiration."""
+    cold_blobs = get_collection(COLD_BLOBS_COLLECTION)
+    stale = datetime.utcnow() - timedelta(seconds=settings.cold_recall_timeout_seconds)
+    deadline = asyncio.get_running_loop().time() + settings.cold_recall_timeout_seconds
+    while True:
+        cold = await cold_blobs.find_one_and_update(
+            {"_id": blob_id, "$or": [{"recalling_at": None}, {"recalling_at": {"$lt": stale}}]},
+            {"$set": {"recalling_at": datetime.utcnow()}},
+        )
+        if cold:
+            return cold
+        if not await cold_blobs.find_one({"_id": blob_id}, {"_id": 1}):
+            # Pas (ou plus) de copie froide : rappelé entre-temps par un autre worker, ou inconnu
+            return None
+        if asyncio.get_running_loop().time() > deadline:
+            raise TimeoutError(f"Rappel du blob {blob_id} toujours en cours")
+        await asyncio.sleep(0.2)
+
+
+async def _recall(blob_id) -> bool:
+    cold = await _claim_recall(blob_id)
+    if not cold:
+        return await get_collection("fs.files").find_one({"_id": blob_id}, {"_id": 1}) is not None
+    store = _stores()[cold["backend"]]
+
+    # Un rappel interrompu a pu aller jusqu'au bout (fs.files écrit) ou laisser des chunks orphelins
+    if not await get_collection("fs.files").find_one({"_id": blob_id}, {"_id": 1}):
+        await get_collection("fs.chunks").delete_many({"files_id": blob_id})
+        upload = get_gridfs_bucket().open_upload_stream_with_id(
+            blob_id, cold["filename"], chunk_size_bytes=cold["chunk_size"], metadata=cold["metadata"]
+        )
+        try:
+            async for chunk in _decompress(store.read(blob_id)):
+                await upload.write(chunk)
+                record_gridfs_write(len(chunk))
+            await upload.close()
+        except BaseException:
+            await upload.abort()
+            await get_collection(COLD_BLOBS_COLLECTION).update_one({"_id": blob_id}, {"$set": {"recalling_at": None}})
+            raise
+
+    # Un rappel compte comme un accès : le blob ne repart pas au prochain passage
+    await get_collection(File.Settings.name).update_many(
+        {"gridfs_id": blob_id},
+        {"$set": {"storage_tier": "hot"}, "$max": {"last_accessed_at": datetime.utcnow()}}
+    )
+    await get_collection(COLD_BLOBS_COLLECTION).delete_one({"_id": blob_id})
+    await store.delete(blob_id)
+    cold_reads.inc()
+    return True
+
+
+async def recall(blob_id) -> bool:
+    """Rapatrie un blob froid dans GridFS ; les lectures concurrentes partagent le même rappel."""
+    task = _recalls.get(blob_id)
+    if task is None:
+        task = asyncio.ensure_future(_recall(blob_id))
+        _recalls[blob_id] = task
+        task.add_done_callback(lambda _: _recalls.pop(blob_id, None))
+    return await asyncio.shield(task)
+
+
+async def open_blob(blob_id):
+    """Ouvre un blob en lecture, en le rapatriant du stockage froid si nécessaire."""
+    bucket = get_gridfs_bucket()
+    try:
+        return await bucket.open_download_stream(blob_id)
+    except NoFile:
+        if not await recall(blob_id):
+            raise
+        return await bucket.open_download_stream(blob_id)
+
+
+async def ensure_hot(blob_id):
+    """Pour les traitements qui lisent fs.chunks directement (uploads différentiels)."""
+    if not await get_collection("fs.files").find_one({"_id": blob_id}, {"_id": 1}):
+        await recall(blob_id)
+
+
+async def delete_cold_blobs(blob_ids: Iterable):
+    blob_ids = list(blob_ids)
+    cold_blobs = get_collection(COLD_BLOBS_COLLECTION)
+    stores = _stores()
+    async for cold in cold_blobs.find({"_id": {"$in": blob_ids}}, {"backend": 1}):
+        await stores[cold["backend"]].delete(cold["_id"])
+    await cold_blobs.delete_many({"_id": {"$in": blob_ids}})
+
+
+async def _sum_lengths(collection: str) -> dict:
+    totals = await get_collection(collection).aggregate([
+        {"$group": {"_id": None, "length": {"$sum": "$length"}, "compressed": {"$sum": "$compressed_length"}}}
+    ]).to_list(length=1)
+    return totals[0] if totals else {"length": 0, "compressed": 0}
+
+
+async def _refresh_tier_sizes():
+    hot = await _sum_lengths("fs.files")
+    cold = await _sum_lengths(COLD_BLOBS_COLLECTION)
+    tier_bytes.set(hot["length"], tier="hot")
+    tier_bytes.set(cold["length"], tier="cold")
+    tier_bytes.set(cold["compressed"], tier="cold_compressed")
+
+    try:
+        cache = (await get_database().command("serverStatus"))["wiredTiger"]["cache"]
+    except Exception:
+        # serverStatus exige le rôle clusterMonitor : la métrique est simplement absente
+        return
+    requested = cache.get("pages requested from the cache", 0)
+    if requested:
+        cache_hit_ratio.set(1 - cache.get("pages read into cache", 0) / requested)
+
+
+async def tier_cold_files():
+    """Déplace par lots les blobs non lus depuis `cold_storage_after_days` jours."""
+    if settings.cold_storage_backend == "none":
+        return
+    store = _stores()[settings.cold_storage_backend]
+    # Les accès encore en mémoire doivent compter avant de choisir les candidats
+    await access_buffer.flush()
+    cutoff = datetime.utcnow() - timedelta(days=settings.cold_storage_after_days)
+
+    candidates = await get_collection(File.Settings.name).find(
+        {"storage_tier": "hot", "last_accessed_at": {"$lt": cutoff}},
+        {"gridfs_id": 1},
+    ).sort("last_accessed_at", 1).limit(settings.tiering_batch_size).to_list(length=None)
+
+    # Un blob partagé ne part que si aucun des fichiers qui le référencent n'a été lu depuis la limite
+    accesses = await _last_access_by_blob(list({candidate["gridfs_id"] for candidate in candidates}))
+    moved = 0
+    seen = set()
+    for candidate in candidates:
+        if candidate["gridfs_id"] in seen:
+            continue
+        seen.add(candidate["gridfs_id"])
+        last, file_ids = accesses.get(candidate["gridfs_id"], (None, [candidate["_id"]]))
+        if any(access_buffer.pending(file_id) for file_id in file_ids):
+            continue
+        if last and last >= cutoff:
+            # Aligné sur le fichier le plus récemment lu : le candidat ne revient pas en tête
+            await get_collection(File.Settings.name).update_many(
+                {"gridfs_id": candidate["gridfs_id"]}, {"$max": {"last_accessed_at": last}}
+            )
+            continue
+        grid_file = await get_collection("fs.files").find_one({"_id": candidate["gridfs_id"]})
+        if not grid_file:
+            # Déjà froid (blob partagé avec une version) ou perdu : le candidat ne doit pas revenir en tête
+            cold = await get_collection(COLD_BLOBS_COLLECTION).find_one({"_id": candidate["gridfs_id"]}, {"_id": 1})
+            await get_collection(File.Settings.name).update_one(
+                {"_id": candidate["_id"]}, {"$set": {"storage_tier": "cold" if cold else "missing"}}
+            )
+            continue
+        try:
+            await _move_to_cold(store, grid_file)
+            moved += 1
+        except Exception:
+            logger.exception("Échec du passage en stockage froid du blob %s", candidate["gridfs_id"])
+    await _release_hot_copies(store)
+    await _refresh_tier_sizes()
+    if moved:
+        logger.info("%d blob(s) déplacé(s) vers le stockage froid (%s)", moved, store.name)
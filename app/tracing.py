@@ -0,0 +1,280 @@
+"""Chronométrage des phases d'une requête : en-tête Server-Timing, journal d'accès et export OTLP.
+
+Les phases sont des spans ouverts par `span(name)` (ou le décorateur `traced`)
+dans le code applicatif ; hors requête échantillonnée, un span ne coûte qu'une
+lecture de ContextVar. La trace est un objet partagé : les spans ouverts dans
+le threadpool ou dans les tâches d'une StreamingResponse y sont ajoutés aussi.
+Server-Timing part avec les en-têtes et ne contient donc que les phases
+terminées avant la réponse ; le journal d'accès et l'export, écrits à la fin,
+les contiennent toutes (lectures GridFS d'un téléchargement compris).
+
+L'export écrit une ligne OTLP/JSON (ExportTraceServiceRequest) par trace,
+lisible par le récepteur `otlpjsonfile` de l'OpenTelemetry Collector.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.instrumentation import route_template
+from app.metrics import Counter
+
+access_logger = logging.getLogger("app.access")
+
+exported_traces = Counter("traces_exported_total", "Traces écrites dans le fichier d'export")
+dropped_traces = Counter("traces_dropped_total", "Traces perdues, tampon d'export saturé")
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_ERROR = 2
+
+
+class _Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "error")
+
+    def __init__(self, name: str, span_id: str, parent_id: Optional[str], start_ns: int):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start_ns = start_ns
+        self.end_ns = start_ns
+        self.error = False
+
+
+class RequestTrace:
+    def __init__(self, trace_id: Optional[str] = None, parent_id: Optional[str] = None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.root_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        # Horloge murale pour l'export, horloge monotone pour les durées
+        self.start_unix_ns = time.time_ns()
+        self.start_perf_ns = time.perf_counter_ns()
+        self.spans: List[_Span] = []
+        self.attributes: Dict[str, object] = {}
+
+    def now_ns(self) -> int:
+        return self.start_unix_ns + time.perf_counter_ns() - self.start_perf_ns
+
+    def totals(self) -> Dict[str, list]:
+        """Durée cumulée (ms) et nombre d'occurrences par nom de span."""
+        totals: Dict[str, list] = {}
+        for span in list(self.spans):
+            total = totals.setdefault(span.name, [0.0, 0])
+            total[0] += (span.end_ns - span.start_ns) / 1e6
+            total[1] += 1
+        return totals
+
+
+_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name: str):
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    current = _Span(name, os.urandom(8).hex(), _current_span.get() or trace.root_id, trace.now_ns())
+    token = _current_span.set(current.span_id)
+    try:
+        yield
+    except BaseException:
+        current.error = True
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end_ns = trace.now_ns()
+        trace.spans.append(current)
+
+
+def traced(name: str):
+    """Décorateur de coroutine : tout l'appel est un span `name`."""
+    def decorate(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def set_attribute(key: str, value):
+    trace = _trace.get()
+    if trace is not None:
+        trace.attributes[key] = value
+
+
+def server_timing(trace: RequestTrace, total_ms: float) -> str:
+    entries = []
+    for name, (duration, count) in trace.totals().items():
+        description = f';desc="x{count}"' if count > 1 else ""
+        entries.append(f"{name}{description};dur={duration:.1f}")
+    entries.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(entries)
+
+
+def _parse_traceparent(scope) -> tuple:
+    """(trace_id, parent_id, échantillonné) d'un en-tête W3C traceparent, sinon (None, None, None)."""
+    for key, value in scope.get("headers", ()):
+        if key == b"traceparent":
+            parts = value.decode("latin-1").split("-")
+            if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+                return parts[1], parts[2], parts[3] == "01"
+    return None, None, None
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def to_otlp(trace: RequestTrace, name: str, end_ns: int, status_code: int, attributes: dict) -> dict:
+    root = {
+        "traceId": trace.trace_id,
+        "spanId": trace.root_id,
+        "name": name,
+        "kind": SPAN_KIND_SERVER,
+        "startTimeUnixNano": str(trace.start_unix_ns),
+        "endTimeUnixNano": str(end_ns),
+        "attributes": [_attribute(key, value) for key, value in {**trace.attributes, **attributes}.items()],
+        "status": {"code": STATUS_ERROR} if status_code >= 500 else {},
+    }
+    if trace.parent_id:
+        root["parentSpanId"] = trace.parent_id
+    spans = [root] + [
+        {
+            "traceId": trace.trace_id,
+            "spanId": child.span_id,
+            "parentSpanId": child.parent_id,
+            "name": child.name,
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(child.start_ns),
+            "endTimeUnixNano": str(child.end_ns),
+            "status": {"code": STATUS_ERROR} if child.error else {},
+        }
+        for child in list(trace.spans)
+    ]
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", settings.tracing_service_name)]},
+        "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+    }]}
+
+
+class TraceExporter:
+    """Lignes OTLP/JSON en mémoire, ajoutées au fichier par un vidage périodique hors de la boucle."""
+
+    def __init__(self, path: Optional[str], max_buffer: int):
+        self.path = path
+        self.max_buffer = max_buffer
+        self._lines: List[str] = []
+
+    def export(self, payload: dict):
+        if len(self._lines) >= self.max_buffer:
+            dropped_traces.inc()
+            return
+        self._lines.append(json.dumps(payload, separators=(",", ":")))
+
+    def _write(self, lines: List[str]):
+        with open(self.path, "a", encoding="utf-8") as output:
+            output.write("\n".join(lines) + "\n")
+
+    async def flush(self):
+        if not self._lines:
+            return
+        lines, self._lines = self._lines, []
+        await asyncio.to_thread(self._write, lines)
+        exported_traces.inc(len(lines))
+
+
+trace_exporter = TraceExporter(settings.tracing_export_path, settings.tracing_export_max_buffer)
+
+
+def configure_access_log():
+    """Une ligne JSON par requête sur la sortie standard, indépendamment de la config de uvicorn."""
+    if not settings.access_log_enabled or access_logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    access_logger.addHandler(handler)
+    access_logger.setLevel(logging.INFO)
+    access_logger.propagate = False
+
+
+class TracingMiddleware:
+    """Trace une fraction `tracing_sample_rate` des requêtes (ou celles marquées échantillonnées
+    par un traceparent entrant) ; le journal d'accès couvre toutes les requêtes."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, parent_id, sampled = _parse_traceparent(scope)
+        if sampled is None:
+            sampled = random.random() < settings.tracing_sample_rate
+        if not sampled and not settings.access_log_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(trace_id, parent_id) if sampled else None
+        state = {"status": 500}
+        started = time.perf_counter()
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                if trace is not None:
+                    total_ms = (time.perf_counter() - started) * 1000
+                    message.setdefault("headers", []).extend([
+                        (b"server-timing", server_timing(trace, total_ms).encode("latin-1")),
+                        (b"traceparent", f"00-{trace.trace_id}-{trace.root_id}-01".encode("latin-1")),
+                    ])
+            await send(message)
+
+        token = _trace.set(trace) if trace is not None else None
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            if token is not None:
+                _trace.reset(token)
+            self._finish(scope, trace, state["status"], (time.perf_counter() - started) * 1000)
+
+    def _finish(self, scope, trace: Optional[RequestTrace], status_code: int, duration_ms: float):
+        route = route_template(scope)
+        if settings.access_log_enabled:
+            entry = {
+                "ts": time.time(),
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": route,
+                "status": status_code,
+                "duration_ms": round(duration_ms, 2),
+            }
+            if trace is not None:
+                entry["trace_id"] = trace.trace_id
+                entry.update(trace.attributes)
+                entry["phases_ms"] = {name: round(total[0], 2) for name, total in trace.totals().items()}
+            access_logger.info(json.dumps(entry, default=str, ensure_ascii=False))
+        if trace is not None and trace_exporter.path:
+            trace_exporter.export(to_otlp(trace, f"{scope['method']} {route}", trace.now_ns(), status_code, {
+                "http.request.method": scope["method"],
+                "http.route": route,
+                "url.path": scope["path"],
+                "http.response.status_code": status_code,
+            }))
@@ -0,0 +1,116 @@
+"""Corbeille : suppression logique immédiate et purge asynchrone des blobs GridFS."""
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.analytics import analytics_cache
+from app.config import settings
+from app.directories import apply_directory_delta
+from app.journal import record_change
+from app.models.change import ChangeEvent, ChangeKind
+from app.models.file import Directory, File, FileStats
+from app.mongo_connect import delete_blobs, get_collection, get_gridfs_bucket
+from app.postgres_connect import AsyncSessionLocal
+from app.utils import adjust_storage_usage, calculate_user_storage_usage
+from app.versions import delete_file_versions
+
+logger = logging.getLogger(__name__)
+
+
+async def move_to_trash(file: File, directory: Directory, db: AsyncSession) -> bool:
+    """Bascule le fichier dans la corbeille : aucune suppression de blob dans la requête.
+
+    Retourne False si une requête concurrente l'a déjà fait (aucun effet de bord appliqué).
+    """
+    now = datetime.utcnow()
+    purge_at = now + timedelta(days=settings.trash_retention_days)
+    result = await get_collection(File.Settings.name).update_one(
+        {"_id": file.id, "trashed": False},
+        {"$set": {"trashed": True, "trashed_at": now, "purge_at": purge_at}}
+    )
+    if result.modified_count == 0:
+        return False
+    file.trashed = True
+    file.trashed_at = now
+    file.purge_at = purge_at
+    await apply_directory_delta(directory.id, -1, -file.file_size_bytes)
+    analytics_cache.apply(file.owner_id, file, -1)
+    await record_change(file.owner_id, ChangeEvent.DELETE, ChangeKind.FILE, file.id, f"{directory.path}/{file.file_name}")
+    if settings.trash_quota_policy == "exclude":
+        await adjust_storage_usage(file.owner_id, -file.file_size_bytes, db)
+    return True
+
+
+async def restore_file(file: File, directory: Directory, db: AsyncSession) -> bool:
+    """Sort le fichier de la corbeille ; False si une requête concurrente l'a déjà fait."""
+    result = await get_collection(File.Settings.name).update_one(
+        {"_id": file.id, "trashed": True},
+        {"$set": {"trashed": False}, "$unset": {"trashed_at": "", "purge_at": ""}}
+    )
+    if result.modified_count == 0:
+        return False
+    file.trashed = False
+    file.trashed_at = None
+    file.purge_at = None
+    await apply_directory_delta(directory.id, 1, file.file_size_bytes)
+    analytics_cache.apply(file.owner_id, file, 1)
+    await record_change(
+        file.owner_id,
+        ChangeEvent.CREATE,
+        ChangeKind.FILE,
+        file.id,
+        f"{directory.path}/{file.file_name}",
+        file_size_bytes=file.file_size_bytes,
+    )
+    if settings.trash_quota_policy == "exclude":
+        await adjust_storage_usage(file.owner_id, file.file_size_bytes, db)
+    return True
+
+
+async def empty_trash(owner_id: str) -> int:
+    """Rend toute la corbeille éligible au prochain passage du purgeur."""
+    result = await get_collection(File.Settings.name).update_many(
+        {"owner_id": owner_id, "trashed": True},
+        {"$set": {"purge_at": datetime.utcnow()}}
+    )
+    return result.modified_count
+
+
+async def purge_trash():
+    """Supprime par lots les fichiers dont la rétention en corbeille est écoulée."""
+    files = get_collection(File.Settings.name)
+    owners = set()
+    while True:
+        now = datetime.utcnow()
+        eligible = {"trashed": True, "purge_at": {"$lte": now}}
+        batch = await files.find(
+            eligible, {"gridfs_id": 1, "owner_id": 1}
+        ).limit(settings.trash_purge_batch_size).to_list(length=None)
+        if not batch:
+            break
+
+        # Documents supprimés d'abord : un fichier restauré entre le find et le
+        # delete_many n'y correspond plus et garde ses blobs
+        file_ids = [doc["_id"] for doc in batch]
+        await files.delete_many({"_id": {"$in": file_ids}, **eligible})
+        survivors = {doc["_id"] for doc in await files.find({"_id": {"$in": file_ids}}, {"_id": 1}).to_list(length=None)}
+        purged = [doc for doc in batch if doc["_id"] not in survivors]
+
+        if purged:
+            purged_ids = [doc["_id"] for doc in purged]
+            # Le blob courant et ceux de tout l'historique des versions
+            gridfs_ids = {doc["gridfs_id"] for doc in purged}
+            gridfs_ids.update(await delete_file_versions(purged_ids))
+            await delete_blobs(gridfs_ids)
+            await get_collection(FileStats.Settings.name).delete_many({"_id": {"$in": purged_ids}})
+            owners.update(doc["owner_id"] for doc in purged)
+        if len(batch) < settings.trash_purge_batch_size:
+            break
+
+    if settings.trash_quota_policy == "count":
+        async with AsyncSessionLocal() as db:
+            for owner_id in owners:
+                await calculate_user_storage_usage(owner_id, db, get_gridfs_bucket())
+    if owners:
+        logger.info("Corbeille purgée pour %d utilisateur(s)", len(owners))
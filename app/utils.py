@@ -6,10 +6,14 @@ from dotenv import load_dotenv
 from datetime import datetime
 from fastapi import HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, update
 from sqlalchemy.future import select
 from app.models.user import StorageUsage
 from app.models.file import File
 from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from app.config import settings
+from app.plans import plan_catalogue
+from app.tracing import traced
 
 load_dotenv()
 
@@ -165,6 +169,17 @@ async def send_forgot_password_email(to_email: str, otp: str):
 def get_filename(filename: str) -> str:
     base, ext = os.path.splitext(filename)
     return f"{base}_{datetime.now()}{ext}"
+
+
+def storage_usage_match(user_id: str) -> dict:
+    """Fichiers pris en compte dans le quota selon la politique de corbeille."""
+    match = {"owner_id": user_id}
+    if settings.trash_quota_policy == "exclude":
+        match["trashed"] = False
+    return match
+
+
+@traced("storage_usage")
 async def calculate_user_storage_usage(
     user_id: str,
     db: AsyncSession,
@@ -172,10 +187,12 @@ async def calculate_user_storage_usage(
 ) -> float:
     """Calcule l'utilisation totale du stockage pour un utilisateur"""
     try:
-        # Récupérer tous les fichiers de l'utilisateur via Beanie
-        files = await File.find(File.owner_id == user_id).to_list()
-
-        total_size_bytes = sum(f.file_size_bytes for f in files)
+        # Somme calculée côté MongoDB, sans charger les documents
+        result = await File.aggregate([
+            {"$match": storage_usage_match(user_id)},
+            {"$group": {"_id": None, "total": {"$sum": "$file_size_bytes"}}},
+        ]).to_list()
+        total_size_bytes = result[0]["total"] if result else 0
 
         # Convertir en MB
         total_size_mb = total_size_bytes / (1024 * 1024)
@@ -207,6 +224,40 @@ async def calculate_user_storage_usage(
         )
 
 
+async def adjust_storage_usage(user_id: str, delta_bytes: int, db: AsyncSession):
+    """Ajustement incrémental (UPDATE atomique) sans recalcul complet."""
+    await db.execute(
+        update(StorageUsage)
+        .where(StorageUsage.user_id == user_id)
+        .values(used_storage_mb=StorageUsage.used_storage_mb + delta_bytes / (1024 * 1024))
+    )
+    await db.commit()
+
+
+async def get_active_plan(user_id: str, db: AsyncSession):
+    """Plan de l'abonnement actif le plus récent, ou None ; le plan vient du catalogue en mémoire"""
+    from app.models.user import Subscription, SubscriptionStatus
+
+    result = await db.execute(
+        select(Subscription.plan_id)
+        .where(Subscription.user_id == user_id)
+        .where(Subscription.status == SubscriptionStatus.ACTIVE)
+        # Échu mais pas encore traité par app.expiry : ne donne plus droit au plan
+        .where(or_(Subscription.end_date.is_(None), Subscription.end_date >= datetime.utcnow()))
+        .order_by(Subscription.created_at.desc())
+        .limit(1)
+    )
+    plan_id = result.scalar_one_or_none()
+    return await plan_catalogue.get(plan_id) if plan_id else None
+
+
+async def get_version_retention(user_id: str, db: AsyncSession) -> int:
+    """Nombre de versions conservées par fichier selon le plan de l'utilisateur"""
+    plan = await get_active_plan(user_id, db)
+    return plan.max_file_versions if plan else settings.default_max_file_versions
+
+
+@traced("quota")
 async def check_storage_quota(
     user_id: str,
     file_size_bytes: int,
@@ -214,7 +265,6 @@ async def check_storage_quota(
 ) -> bool:
     """Vérifie si l'utilisateur peut uploader un fichier selon son quota"""
     from app.models.user import User
-    from app.models.user import Subscription, Plan, SubscriptionStatus
     
     # Récupérer l'utilisateur
     user_result = await db.execute(select(User).where(User.id == user_id))
@@ -231,22 +281,8 @@ async def check_storage_quota(
     current_usage_mb = usage.used_storage_mb if usage else 0.0
     
     # Récupérer la limite de stockage
-    subscription_result = await db.execute(
-        select(Subscription)
-        .where(Subscription.user_id == user_id)
-        .where(Subscription.status == SubscriptionStatus.ACTIVE)
-        .order_by(Subscription.created_at.desc())
-    )
-    subscription = subscription_result.scalars().first()
-    
-    if subscription:
-        plan_result = await db.execute(
-            select(Plan).where(Plan.id == subscription.plan_id)
-        )
-        plan = plan_result.scalars().first()
-        storage_limit_mb = plan.storage_limit_mb if plan else user.storage_quota_mb
-    else:
-        storage_limit_mb = user.storage_quota_mb
+    plan = await get_active_plan(user_id, db)
+    storage_limit_mb = plan.storage_limit_mb if plan else user.storage_quota_mb
     
     # Convertir la taille du fichier en MB
     file_size_mb = file_size_bytes / (1024 * 1024)
@@ -305,3 +341,45 @@ async def send_subscription_confirmation_email(to_email: str, plan_name: str, st
         )
 
 
+async def send_subscription_expired_email(to_email: str, plan_name: str, end_date: datetime):
+    if not SENDINBLUE_API_KEY:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Configuration email manquante"
+        )
+
+    url = "https://api.brevo.com/v3/smtp/email"
+    subject = "⏳ Votre abonnement a expiré"
+    html_content = f"""
+    <div style="font-family: Arial, sans-serif;">
+      <h2>Votre abonnement {plan_name} a expiré</h2>
+      <p>Votre abonnement <b>Drive Storage</b> a pris fin le {end_date.strftime("%d-%m-%Y")}.</p>
+      <p>Vos fichiers restent accessibles, mais les limites du plan gratuit s'appliquent désormais.
+      Renouvelez votre abonnement pour retrouver votre espace de stockage 🚀.</p>
+    </div>
+    """
+
+    data = {
+        "sender": {
+            "name": "Support Drive Storage",
+            "email": "diallo30amadoukorka@gmail.com"
+        },
+        "to": [{"email": to_email}],
+        "subject": subject,
+        "htmlContent": html_content,
+    }
+    headers = {
+        "api-key": SENDINBLUE_API_KEY,
+        "Content-Type": "application/json"
+    }
+
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.post(url, json=data, headers=headers)
+            response.raise_for_status()
+            return response.json()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erreur lors de l'envoi de l'email d'expiration: {str(e)}"
+        )
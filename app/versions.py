@@ -0,0 +1,141 @@
+"""Historique des versions de fichiers : identité stable, un blob GridFS par contenu distinct."""
+import logging
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from pymongo import ReturnDocument
+
+from app.analytics import analytics_cache
+from app.config import settings
+from app.models.file import File, FileVersion
+from app.mongo_connect import delete_blobs, get_collection
+
+logger = logging.getLogger(__name__)
+
+
+async def record_version(file: File) -> FileVersion:
+    """Enregistre la version courante d'un fichier dans l'historique."""
+    version = FileVersion(
+        file_id=file.id,
+        owner_id=file.owner_id,
+        version=file.version,
+        gridfs_id=file.gridfs_id,
+        file_size_bytes=file.file_size_bytes,
+        content_type=file.content_type,
+        digest=file.digest,
+        created_at=file.updated_at or file.created_at,
+    )
+    await version.insert()
+    return version
+
+
+async def commit_new_version(file: File, gridfs_id, file_size_bytes: int, digest: Optional[str], content_type: str) -> int:
+    """Fait pointer le fichier vers un nouveau contenu et l'historise.
+
+    Le numéro de version est incrémenté atomiquement : deux remplacements
+    concurrents obtiennent deux versions distinctes. Retourne la variation de taille.
+    """
+    if file.digest is None and not await FileVersion.find_one(FileVersion.file_id == file.id):
+        # Fichier antérieur au versionnage : on historise d'abord son contenu actuel
+        await record_version(file)
+
+    now = datetime.utcnow()
+    analytics_cache.apply(file.owner_id, file, -1)
+    previous = await get_collection(File.Settings.name).find_one_and_update(
+        {"_id": file.id},
+        {
+            "$inc": {"version": 1},
+            "$set": {
+                "gridfs_id": gridfs_id,
+                "file_size_bytes": file_size_bytes,
+                "digest": digest,
+                "content_type": content_type,
+                "updated_at": now,
+            },
+        },
+        return_document=ReturnDocument.BEFORE,
+    )
+    file.version = previous.get("version", 1) + 1
+    file.gridfs_id = gridfs_id
+    file.file_size_bytes = file_size_bytes
+    file.digest = digest
+    file.content_type = content_type
+    file.updated_at = now
+    analytics_cache.apply(file.owner_id, file, 1)
+    await record_version(file)
+    return file_size_bytes - previous.get("file_size_bytes", 0)
+
+
+async def set_blob_digest(gridfs_id, digest: str):
+    """Renseigne l'empreinte d'un blob enregistré sans elle, sur le fichier et son historique."""
+    for collection in (File.Settings.name, FileVersion.Settings.name):
+        await get_collection(collection).update_many(
+            {"gridfs_id": gridfs_id, "digest": None},
+            {"$set": {"digest": digest}},
+        )
+
+
+async def find_reusable_blob(file: File, digest: str):
+    """Blob d'une version conservée ayant le même contenu, pour ne pas le stocker deux fois."""
+    existing = await FileVersion.find_one(
+        FileVersion.file_id == file.id,
+        FileVersion.digest == digest,
+        FileVersion.prunable == False
+    )
+    return existing.gridfs_id if existing else None
+
+
+async def list_versions(file: File) -> List[FileVersion]:
+    return await FileVersion.find(FileVersion.file_id == file.id).sort(-FileVersion.version).to_list()
+
+
+async def get_version(file: File, version: int) -> Optional[FileVersion]:
+    return await FileVersion.find_one(FileVersion.file_id == file.id, FileVersion.version == version)
+
+
+async def mark_prunable(file: File, max_versions: int):
+    """Marque les versions au-delà de la rétention ; la suppression se fait en tâche de fond."""
+    await get_collection(FileVersion.Settings.name).update_many(
+        {"file_id": file.id, "version": {"$lte": file.version - max(max_versions, 1)}, "prunable": {"$ne": True}},
+        {"$set": {"prunable": True}}
+    )
+
+
+async def _unreferenced(gridfs_ids: Iterable) -> list:
+    """Blobs qui ne sont plus utilisés ni par un fichier ni par une version conservée."""
+    gridfs_ids = list(set(gridfs_ids))
+    in_use = set(await get_collection(File.Settings.name).distinct(
+        "gridfs_id", {"gridfs_id": {"$in": gridfs_ids}}
+    ))
+    in_use.update(await get_collection(FileVersion.Settings.name).distinct(
+        "gridfs_id", {"gridfs_id": {"$in": gridfs_ids}, "prunable": {"$ne": True}}
+    ))
+    return [gridfs_id for gridfs_id in gridfs_ids if gridfs_id not in in_use]
+
+
+async def prune_versions():
+    """Supprime par lots les versions marquées et les blobs devenus orphelins."""
+    versions = get_collection(FileVersion.Settings.name)
+    pruned = 0
+    while True:
+        batch = await versions.find(
+            {"prunable": True}, {"gridfs_id": 1}
+        ).limit(settings.version_prune_batch_size).to_list(length=None)
+        if not batch:
+            break
+
+        await delete_blobs(await _unreferenced(doc["gridfs_id"] for doc in batch))
+        await versions.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        pruned += len(batch)
+        if len(batch) < settings.version_prune_batch_size:
+            break
+    if pruned:
+        logger.info("%d version(s) de fichiers purgée(s)", pruned)
+
+
+async def delete_file_versions(file_ids: list) -> list:
+    """Supprime l'historique de fichiers purgés et retourne les blobs à libérer."""
+    versions = get_collection(FileVersion.Settings.name)
+    gridfs_ids = await versions.distinct("gridfs_id", {"file_id": {"$in": file_ids}})
+    await versions.delete_many({"file_id": {"$in": file_ids}})
+    return gridfs_ids
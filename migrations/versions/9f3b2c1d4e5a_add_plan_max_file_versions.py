@@ -0,0 +1,28 @@
+"""add plan max file versions
+
+Revision ID: 9f3b2c1d4e5a
+Revises: 46d551907c09
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9f3b2c1d4e5a'
+down_revision: Union[str, Sequence[str], None] = '46d551907c09'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('plans', sa.Column('max_file_versions', sa.Integer(), nullable=False, server_default='10'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('plans', 'max_file_versions')
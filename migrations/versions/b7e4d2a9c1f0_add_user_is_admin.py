@@ -0,0 +1,28 @@
+"""add user is_admin
+
+Revision ID: b7e4d2a9c1f0
+Revises: 9f3b2c1d4e5a
+Create Date: 2026-10-18 10:02:17.540913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e4d2a9c1f0'
+down_revision: Union[str, Sequence[str], None] = '9f3b2c1d4e5a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('is_admin', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'is_admin')
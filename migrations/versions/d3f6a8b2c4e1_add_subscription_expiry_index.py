@@ -0,0 +1,37 @@
+"""add subscription expiry index
+
+Revision ID: d3f6a8b2c4e1
+Revises: b7e4d2a9c1f0
+Create Date: 2026-10-19 09:14:52.207316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3f6a8b2c4e1'
+down_revision: Union[str, Sequence[str], None] = 'b7e4d2a9c1f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Index partiel : seuls les abonnements actifs à échéance sont parcourus par l'expiration planifiée
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_subscriptions_active_end_date',
+            'subscriptions',
+            ['end_date'],
+            postgresql_where=sa.text("status = 'active' AND end_date IS NOT NULL"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_subscriptions_active_end_date', table_name='subscriptions', postgresql_concurrently=True)
@@ -0,0 +1,71 @@
+"""add subscription indexes
+
+Revision ID: e5b7c9d1f3a2
+Revises: d3f6a8b2c4e1
+Create Date: 2026-10-19 11:37:05.419862
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b7c9d1f3a2'
+down_revision: Union[str, Sequence[str], None] = 'd3f6a8b2c4e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Doublons antérieurs aux contraintes : seul l'abonnement actif le plus récent reste actif
+    op.execute("""
+        UPDATE subscriptions SET status = 'cancelled', updated_at = now()
+        WHERE status = 'active' AND id NOT IN (
+            SELECT DISTINCT ON (user_id) id FROM subscriptions
+            WHERE status = 'active'
+            ORDER BY user_id, created_at DESC
+        )
+    """)
+    # Transaction Wave réutilisée : la première garde l'identifiant, les suivantes sont suffixées
+    op.execute("""
+        UPDATE subscriptions AS s SET wave_transaction_id = s.wave_transaction_id || ':dup:' || s.id
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY wave_transaction_id ORDER BY created_at) AS rank
+            FROM subscriptions WHERE wave_transaction_id IS NOT NULL
+        ) AS d
+        WHERE s.id = d.id AND d.rank > 1
+    """)
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_subscriptions_user_status_created',
+            'subscriptions',
+            ['user_id', 'status', sa.text('created_at DESC')],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'uq_subscriptions_wave_transaction_id',
+            'subscriptions',
+            ['wave_transaction_id'],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'uq_subscriptions_one_active_per_user',
+            'subscriptions',
+            ['user_id'],
+            unique=True,
+            postgresql_where=sa.text("status = 'active'"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('uq_subscriptions_one_active_per_user', table_name='subscriptions', postgresql_concurrently=True)
+        op.drop_index('uq_subscriptions_wave_transaction_id', table_name='subscriptions', postgresql_concurrently=True)
+        op.drop_index('ix_subscriptions_user_status_created', table_name='subscriptions', postgresql_concurrently=True)
@@ -0,0 +1,113 @@
+"""
+Benchmark de la recherche de fichiers sur un drive synthétique volumineux
+
+Usage : python scripts/bench_search.py [--files 100000] [--queries 500] [--keep]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+
+from app.models.file import search_fields
+from app.mongo_connect import connect_database, disconnect_from_database, get_collection
+from app.search import search_files
+
+WORDS = [
+    "vacances", "facture", "rapport", "photo", "contrat", "budget", "projet",
+    "scan", "releve", "dakar", "thies", "mariage", "cv", "presentation", "notes",
+    "export", "backup", "devis", "bulletin", "plan", "reunion", "video", "audio",
+]
+EXTENSIONS = {
+    "jpg": "image/jpeg", "png": "image/png", "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "mp4": "video/mp4", "txt": "text/plain", "zip": "application/zip",
+}
+
+
+def synthetic_file(owner_id: str, directory_id: ObjectId, now: datetime) -> dict:
+    ext = random.choice(list(EXTENSIONS))
+    name = "_".join(random.sample(WORDS, random.randint(1, 3))) + f"_{random.randint(1, 9999)}.{ext}"
+    return {
+        "file_name": name,
+        "content_type": EXTENSIONS[ext],
+        "owner_id": owner_id,
+        "owner": "bench",
+        "created_at": now - timedelta(minutes=random.randint(0, 525600)),
+        "parent": None,
+        "ancestors": [directory_id],
+        "gridfs_id": ObjectId(),
+        "file_size_bytes": random.randint(1_000, 50_000_000),
+        **search_fields(name),
+    }
+
+
+async def seed(owner_id: str, count: int, batch_size: int = 5000):
+    directories = get_collection("directories")
+    directory_id = (await directories.insert_one({
+        "dir_name": "bench", "owner_id": owner_id, "owner": "bench",
+        "created_at": datetime.utcnow(), "path": "/bench", "ancestors": [], "depth": 0,
+    })).inserted_id
+
+    files = get_collection("files")
+    now = datetime.utcnow()
+    for start in range(0, count, batch_size):
+        batch = [synthetic_file(owner_id, directory_id, now) for _ in range(min(batch_size, count - start))]
+        await files.insert_many(batch, ordered=False)
+    print(f"✅ {count} fichiers synthétiques insérés pour {owner_id}")
+
+
+def random_query() -> dict:
+    kind = random.random()
+    if kind < 0.5:
+        word = random.choice(WORDS)
+        return {"q": word[:random.randint(2, len(word))]}
+    if kind < 0.7:
+        return {"q": " ".join(random.sample(WORDS, 2))}
+    if kind < 0.85:
+        return {"extension": random.choice(list(EXTENSIONS))}
+    return {"min_size": 10_000_000, "content_type": "image/"}
+
+
+async def run(files: int, queries: int, keep: bool):
+    await connect_database()
+    owner_id = f"bench-{uuid.uuid4()}"
+    try:
+        await seed(owner_id, files)
+
+        latencies = []
+        for _ in range(queries):
+            params = random_query()
+            start = time.perf_counter()
+            page = await search_files(owner_id, limit=50, **params)
+            if page["next_cursor"]:
+                await search_files(owner_id, cursor=page["next_cursor"], limit=50, **params)
+            latencies.append((time.perf_counter() - start) * 1000 / (2 if page["next_cursor"] else 1))
+
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f"📊 {queries} recherches sur {files} fichiers")
+        print(f"   p50={statistics.median(latencies):.1f}ms p95={p95:.1f}ms p99={p99:.1f}ms max={latencies[-1]:.1f}ms")
+    finally:
+        if not keep:
+            await get_collection("files").delete_many({"owner_id": owner_id})
+            await get_collection("directories").delete_many({"owner_id": owner_id})
+        await disconnect_from_database()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--keep", action="store_true", help="Conserver les données synthétiques")
+    args = parser.parse_args()
+    asyncio.run(run(args.files, args.queries, args.keep))
@@ -0,0 +1,122 @@
+"""
+Micro-benchmark de la sérialisation des listes : validation response_model + json contre projections + orjson
+
+Deux routes servent les mêmes N fichiers synthétiques (aucune base requise) :
+  - /avant : objets renvoyés tels quels, validés contre List[FileOut] puis encodés par FastAPI ;
+  - /apres : projections complétées par app.responses et encodées par orjson.
+
+Usage : python scripts/bench_serialization.py [--items 500] [--requests 300] [--concurrency 8] [--fields file_name,created_at]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+
+from app.responses import list_response, parse_fields, project_row
+from app.schemas.file import DirectoryOut, FileOut
+
+
+def synthetic_rows(count: int) -> List[dict]:
+    now = datetime.utcnow()
+    parent = {
+        "dir_name": "bench", "owner_id": "bench", "created_at": now, "owner": "bench",
+        "path": "/bench", "depth": 0, "file_count": count, "total_bytes": count * 1000,
+    }
+    return [
+        {
+            "file_name": f"fichier_{i}.pdf",
+            "content_type": "application/pdf",
+            "created_at": now - timedelta(minutes=random.randint(0, 525600)),
+            "owner_id": "bench",
+            "owner": "bench",
+            "parent": parent,
+            "download_count": random.randint(0, 100),
+            "last_opened_at": now,
+        }
+        for i in range(count)
+    ]
+
+
+def build_app(rows: List[dict]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/avant", response_model=List[FileOut])
+    async def before():
+        return rows
+
+    @app.get("/apres", response_model=List[FileOut])
+    async def after(fields: str | None = None):
+        selected = parse_fields(FileOut, fields)
+        return list_response(
+            FileOut, ({**row, "parent": project_row(DirectoryOut, row["parent"])} for row in rows), selected
+        )
+
+    return app
+
+
+async def measure(client: httpx.AsyncClient, url: str, requests: int, concurrency: int) -> dict:
+    latencies = []
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.get(url)
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    # Préchauffage : caches des modèles pydantic et de FastAPI
+    await client.get(url)
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": requests / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "size": len((await client.get(url)).content),
+    }
+
+
+async def run(items: int, requests: int, concurrency: int, fields: str | None):
+    app = build_app(synthetic_rows(items))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        results = {
+            "avant": await measure(client, "/avant", requests, concurrency),
+            "apres": await measure(client, "/apres", requests, concurrency),
+        }
+        if fields:
+            results[f"apres ?fields={fields}"] = await measure(client, f"/apres?fields={fields}", requests, concurrency)
+
+    print(f"📊 {requests} requêtes de {items} éléments, concurrence {concurrency}")
+    for label, result in results.items():
+        print(
+            f"   {label:<32} {result['rps']:8.1f} req/s  p50={result['p50']:.1f}ms "
+            f"p95={result['p95']:.1f}ms  {result['size'] / 1024:.0f} Ko"
+        )
+    print(f"   gain : x{results['apres']['rps'] / results['avant']['rps']:.1f} req/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--fields", default="file_name,created_at", help="Sous-ensemble mesuré en plus (vide : aucun)")
+    args = parser.parse_args()
+    asyncio.run(run(args.items, args.requests, args.concurrency, args.fields or None))
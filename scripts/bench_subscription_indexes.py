@@ -0,0 +1,156 @@
+"""
+Benchmark des requêtes chaudes sur subscriptions, avant et après les index
+
+Les données synthétiques sont créées dans un schéma jetable (copie de la
+structure de subscriptions, sans index) : la base réelle n'est pas modifiée.
+
+Usage : python scripts/bench_subscription_indexes.py [--rows 1000000] [--users 200000] [--queries 200] [--keep]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import statistics
+import sys
+import os
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from app.postgres_connect import async_engine
+
+# Mêmes définitions que la migration e5b7c9d1f3a2 et l'index d'expiration d3f6a8b2c4e1
+INDEXES = [
+    "CREATE INDEX ix_subscriptions_user_status_created ON subscriptions (user_id, status, created_at DESC)",
+    "CREATE UNIQUE INDEX uq_subscriptions_wave_transaction_id ON subscriptions (wave_transaction_id)",
+    "CREATE UNIQUE INDEX uq_subscriptions_one_active_per_user ON subscriptions (user_id) WHERE status = 'active'",
+    "CREATE INDEX ix_subscriptions_active_end_date ON subscriptions (end_date)"
+    " WHERE status = 'active' AND end_date IS NOT NULL",
+]
+
+QUERIES = {
+    "abonnement actif": (
+        "SELECT plan_id FROM subscriptions WHERE user_id = :user_id AND status = 'active'"
+        " ORDER BY created_at DESC LIMIT 1"
+    ),
+    "transaction wave": "SELECT id FROM subscriptions WHERE wave_transaction_id = :transaction_id",
+    "échéances": (
+        "SELECT id FROM subscriptions WHERE status = 'active' AND end_date IS NOT NULL"
+        " AND end_date < now() ORDER BY end_date LIMIT 500"
+    ),
+}
+
+
+def user_id(rank: int) -> uuid.UUID:
+    # Même dérivation que md5('user' || rank)::uuid côté SQL
+    return uuid.UUID(hashlib.md5(f"user{rank}".encode()).hexdigest())
+
+
+async def seed(connection, rows: int, users: int):
+    # Abonnement g à l'utilisateur g % users ; seul le plus récent de chaque utilisateur est actif
+    await connection.execute(text("""
+        WITH p AS (SELECT CAST(:rows AS integer) AS rows, CAST(:users AS integer) AS users)
+        INSERT INTO subscriptions (id, user_id, plan_id, status, start_date, end_date, is_yearly,
+                                   wave_transaction_id, created_at, updated_at)
+        SELECT gen_random_uuid(),
+               md5('user' || (g % p.users))::uuid,
+               md5('plan' || (g % 4))::uuid,
+               CASE WHEN g + p.users >= p.rows THEN 'active'
+                    WHEN g % 3 = 0 THEN 'expired' ELSE 'cancelled' END,
+               t.created_at, t.created_at + interval '30 days', false,
+               CASE WHEN g % 10 < 7 THEN 'bench-' || g END,
+               t.created_at, t.created_at
+        FROM p, generate_series(0, p.rows - 1) AS g,
+             -- Étalement sur 40 jours : une partie des abonnements actifs est échue
+             LATERAL (SELECT now() - ((p.rows - g) / p.users) * interval '30 days'
+                             - random() * interval '40 days' AS created_at) AS t
+    """), {"rows": rows, "users": users})
+    await connection.execute(text("ANALYZE subscriptions"))
+    print(f"✅ {rows} abonnements synthétiques pour {users} utilisateurs")
+
+
+def random_params(name: str, rows: int, users: int) -> dict:
+    if name == "abonnement actif":
+        return {"user_id": user_id(random.randrange(users))}
+    if name == "transaction wave":
+        return {"transaction_id": f"bench-{random.randrange(rows)}"}
+    return {}
+
+
+def plan_nodes(plan: dict) -> str:
+    nodes, stack = [], [plan]
+    while stack:
+        node = stack.pop()
+        nodes.append(node["Node Type"] + (f" ({node['Index Name']})" if "Index Name" in node else ""))
+        stack.extend(reversed(node.get("Plans", [])))
+    return " > ".join(nodes)
+
+
+async def measure(connection, rows: int, users: int, queries: int) -> dict:
+    results = {}
+    for name, sql in QUERIES.items():
+        timings, shape = [], None
+        for _ in range(queries):
+            explained = (await connection.execute(
+                text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), random_params(name, rows, users)
+            )).scalar_one()
+            if isinstance(explained, str):
+                explained = json.loads(explained)
+            timings.append(explained[0]["Planning Time"] + explained[0]["Execution Time"])
+            shape = shape or plan_nodes(explained[0]["Plan"])
+        timings.sort()
+        results[name] = (statistics.median(timings), timings[int(len(timings) * 0.95) - 1], shape)
+    return results
+
+
+def report(label: str, results: dict):
+    print(f"📊 {label}")
+    for name, (p50, p95, shape) in results.items():
+        print(f"   {name:<18} p50={p50:.2f}ms p95={p95:.2f}ms  {shape}")
+
+
+async def run(rows: int, users: int, queries: int, keep: bool):
+    schema = f"bench_{uuid.uuid4().hex[:8]}"
+    async with async_engine.connect() as connection:
+        await connection.execute(text(f"CREATE SCHEMA {schema}"))
+        await connection.execute(text(
+            f"CREATE TABLE {schema}.subscriptions (LIKE public.subscriptions INCLUDING DEFAULTS)"
+        ))
+        await connection.execute(text(f"SET search_path TO {schema}"))
+        await connection.commit()
+        try:
+            await seed(connection, rows, users)
+            await connection.commit()
+            before = await measure(connection, rows, users, queries)
+            report("Sans index", before)
+
+            for ddl in INDEXES:
+                await connection.execute(text(ddl))
+            await connection.execute(text("ANALYZE subscriptions"))
+            await connection.commit()
+            after = await measure(connection, rows, users, queries)
+            report("Avec index", after)
+
+            for name in QUERIES:
+                print(f"   {name:<18} gain p50 x{before[name][0] / max(after[name][0], 1e-3):.0f}")
+        finally:
+            await connection.rollback()
+            if keep:
+                print(f"ℹ️  Schéma conservé : {schema}")
+            else:
+                await connection.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+                await connection.commit()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--keep", action="store_true", help="Conserver le schéma de benchmark")
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.users, args.queries, args.keep))
@@ -9,6 +9,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.postgres_connect import AsyncSessionLocal
 from app.models.user import Plan, PlanType
+from app.plans import notify_plans_changed
 
 async def create_default_plans():
     """Créer les plans d'abonnement par défaut avec les liens Wave"""
@@ -18,6 +19,7 @@ async def create_default_plans():
             "name": "Gratuit",
             "plan_type": PlanType.FREE,
             "storage_limit_mb": 300,
+            "max_file_versions": 3,
             "price_monthly": 0.0,
             "price_yearly": 0.0,
             "wave_payment_link_monthly": None,
@@ -28,6 +30,7 @@ async def create_default_plans():
             "name": "Basique",
             "plan_type": PlanType.BASIC,
             "storage_limit_mb": 5120,  # 5GB
+            "max_file_versions": 10,
             "price_monthly": 2000.0,  # 2.000 FCFA
             "price_yearly": 20000.0,  # 20.000 FCFA
             "wave_payment_link_monthly": "https://pay.wave.com/m/M_sn_nipMFngsi-Fy/c/sn/?amount=2000",
@@ -38,6 +41,7 @@ async def create_default_plans():
             "name": "Premium",
             "plan_type": PlanType.PREMIUM,
             "storage_limit_mb": 51200,  # 50GB
+            "max_file_versions": 30,
             "price_monthly": 5000.0,  # 5.000 FCFA
             "price_yearly": 50000.0,  # 50.000 FCFA
             "wave_payment_link_monthly": "https://wave.com/pay/premium-monthly-5000fcfa",
@@ -48,6 +52,7 @@ async def create_default_plans():
             "name": "Entreprise",
             "plan_type": PlanType.ENTERPRISE,
             "storage_limit_mb": 512000,  # 500GB
+            "max_file_versions": 100,
             "price_monthly": 15000.0,  # 15.000 FCFA
             "price_yearly": 150000.0,  # 150.000 FCFA
             "wave_payment_link_monthly": "https://wave.com/pay/enterprise-monthly-15000fcfa",
@@ -73,8 +78,11 @@ async def create_default_plans():
                 else:
                     existing_plan.wave_payment_link_monthly = plan_data["wave_payment_link_monthly"]
                     existing_plan.wave_payment_link_yearly = plan_data["wave_payment_link_yearly"]
+                    existing_plan.max_file_versions = plan_data["max_file_versions"]
                     print(f"⚠️  Plan '{plan_data['name']}' mis à jour avec liens Wave")
             
+            # Les workers en cours rechargent leur catalogue au commit
+            await notify_plans_changed(session)
             await session.commit()
             print("🎉 Initialisation des plans avec Wave terminée avec succès!")
             
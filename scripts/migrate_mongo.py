@@ -0,0 +1,124 @@
+"""
+Script de migration des documents MongoDB existants vers le schéma courant
+"""
+import asyncio
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+from app.directories import repair_directory_stats
+from app.models.file import search_fields
+from app.mongo_connect import connect_database, disconnect_from_database, get_collection
+
+
+async def backfill_directory_paths():
+    """Les anciens dossiers sont tous à la racine : path = "/<dir_name>"."""
+    result = await get_collection("directories").update_many(
+        {"path": {"$exists": False}},
+        [{"$set": {
+            "path": {"$concat": ["/", "$dir_name"]},
+            "parent_id": None,
+            "ancestors": [],
+            "depth": 0,
+        }}]
+    )
+    print(f"✅ {result.modified_count} dossier(s) migré(s) vers les chemins matérialisés")
+
+
+async def backfill_file_ancestors():
+    """Les anciens fichiers n'ont qu'un ancêtre : leur dossier parent."""
+    result = await get_collection("files").update_many(
+        {"ancestors": {"$exists": False}, "parent": {"$ne": None}},
+        [{"$set": {
+            "ancestors": [{"$getField": {"field": {"$literal": "$id"}, "input": "$parent"}}],
+        }}]
+    )
+    print(f"✅ {result.modified_count} fichier(s) rattaché(s) à leurs dossiers ancêtres")
+
+
+async def backfill_search_fields():
+    """Champs de recherche dérivés du nom (même découpage que le modèle File)."""
+    files = get_collection("files")
+    cursor = files.find({"search_tokens": {"$exists": False}}, {"file_name": 1})
+    operations = []
+    migrated = 0
+    async for doc in cursor:
+        operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": search_fields(doc["file_name"])}))
+        if len(operations) >= 1000:
+            migrated += (await files.bulk_write(operations, ordered=False)).modified_count
+            operations = []
+    if operations:
+        migrated += (await files.bulk_write(operations, ordered=False)).modified_count
+    print(f"✅ {migrated} fichier(s) indexé(s) pour la recherche")
+
+
+async def backfill_trash_flags():
+    """Les fichiers antérieurs à la corbeille sont vivants (requis par les index partiels), en version 1."""
+    result = await get_collection("files").update_many(
+        {"trashed": {"$exists": False}},
+        {"$set": {"trashed": False, "version": 1}}
+    )
+    print(f"✅ {result.modified_count} fichier(s) marqué(s) hors corbeille")
+
+
+async def backfill_storage_tiers():
+    """Tous les blobs existants sont dans GridFS ; dernier accès = dernière écriture connue."""
+    result = await get_collection("files").update_many(
+        {"storage_tier": {"$exists": False}},
+        [{"$set": {
+            "storage_tier": "hot",
+            "last_accessed_at": {"$ifNull": ["$updated_at", "$created_at"]},
+        }}]
+    )
+    print(f"✅ {result.modified_count} fichier(s) rattaché(s) au stockage chaud")
+
+
+# Index remplacés par leurs variantes partielles sur trashed=false (suffixe _live)
+REPLACED_INDEXES = {
+    "files": [
+        "parent_file_name", "owner_recent", "owner_search_tokens", "owner_extension",
+        "owner_content_type", "owner_created_at", "owner_size",
+    ],
+}
+
+
+async def drop_replaced_indexes():
+    """init_beanie ne supprime aucun index : les index remplacés sont retirés ici, par leur nom."""
+    dropped = 0
+    for collection, names in REPLACED_INDEXES.items():
+        existing = await get_collection(collection).index_information()
+        for name in names:
+            if name not in existing:
+                continue
+            try:
+                await get_collection(collection).drop_index(name)
+                dropped += 1
+            except OperationFailure as e:
+                print(f"⚠️  Index {collection}.{name} non supprimé : {e}")
+    print(f"✅ {dropped} index remplacé(s) supprimé(s)")
+
+
+async def migrate():
+    await connect_database()
+    try:
+        await backfill_directory_paths()
+        await backfill_file_ancestors()
+        await backfill_search_fields()
+        await backfill_trash_flags()
+        await backfill_storage_tiers()
+        await drop_replaced_indexes()
+        await repair_directory_stats()
+        print("✅ Agrégats des dossiers recalculés")
+        print("🎉 Migration MongoDB terminée avec succès!")
+    except Exception as e:
+        print(f"❌ Erreur lors de la migration MongoDB: {e}")
+        raise
+    finally:
+        await disconnect_from_database()
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
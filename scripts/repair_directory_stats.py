@@ -0,0 +1,29 @@
+"""
+Script de réparation des agrégats de dossiers (file_count, total_bytes, last_modified)
+
+Usage : python scripts/repair_directory_stats.py [owner_id]
+"""
+import asyncio
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.directories import repair_directory_stats
+from app.mongo_connect import connect_database, disconnect_from_database
+
+
+async def repair(owner_id: str | None = None):
+    await connect_database()
+    try:
+        await repair_directory_stats(owner_id)
+        scope = f"de l'utilisateur {owner_id}" if owner_id else "de tous les utilisateurs"
+        print(f"🎉 Agrégats des dossiers {scope} recalculés avec succès!")
+    except Exception as e:
+        print(f"❌ Erreur lors du recalcul des agrégats: {e}")
+        raise
+    finally:
+        await disconnect_from_database()
+
+if __name__ == "__main__":
+    asyncio.run(repair(sys.argv[1] if len(sys.argv) > 1 else None))